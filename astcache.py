@@ -0,0 +1,256 @@
+import array, collections, gc, hashlib, itertools, marshal, struct
+
+import pycub.expression as expression
+import pycub.statement as statement
+import pycub.tokencache as tokencache
+import pycub.tokens as tokens
+from pycub.parse import Parser
+from pycub.reader import ByteReader
+from pycub.lex import Scanner
+from pycub.tokenbuffer import TokenBuffer
+
+# bump when the layout of a cache file changes
+FORMAT = 1
+
+MAGIC = b'PCST'
+
+# magic, format, fingerprint
+header = struct.Struct('<4sH20s')
+
+# the modules whose source decides what tree a parse builds. the token
+# fingerprint covers the lexer
+parser_modules = ('parse', 'disambiguate', 'ops', 'statement', 'expression',
+  'tokens', 'types', 'tree')
+
+# worked out on first use, the sources don't change while we run
+_fingerprint = None
+
+def fingerprint():
+  global _fingerprint
+  if _fingerprint is not None:
+    return _fingerprint
+  digest = hashlib.sha1()
+  digest.update(repr(FORMAT).encode('utf-8'))
+  digest.update(tokencache.fingerprint())
+  for name in parser_modules:
+    module = __import__('pycub.' + name, fromlist=[name])
+    try:
+      with open(module.__file__, 'rb') as f:
+        digest.update(f.read())
+    except (OSError, TypeError):
+      pass
+  _fingerprint = digest.digest()
+  return _fingerprint
+
+# only these classes are ever rebuilt from a cache file, by name
+def node_classes():
+  classes = {}
+  for module, bases in ((statement, (statement.Statement,
+    statement.DefineClause)), (expression, (expression.Expression,)),
+    (tokens, (tokens.Token,))):
+    prefix = module.__name__.rsplit('.', 1)[-1] + '.'
+    for name, value in vars(module).items():
+      if isinstance(value, type) and issubclass(value, bases):
+        classes[prefix + name] = value
+  return classes
+
+_classes = node_classes()
+_names = dict((cls, name) for name, cls in _classes.items())
+
+plain_types = (type(None), bool, int, float, str, bytes)
+
+def _slots(cls):
+  return tuple(slot for klass in reversed(cls.__mro__)
+    for slot in getattr(klass, '__slots__', ()))
+
+# the attributes of a node, token or clause as a dict
+def _state(obj, slots):
+  if slots is None:
+    return vars(obj)
+  return dict((slot, getattr(obj, slot)) for slot in slots
+    if hasattr(obj, slot))
+
+def _is_node(value):
+  return type(value) in _names
+
+# attribute kinds in a cache file
+K_VALUE = 0 # stored as is
+K_REFERENCE = 1 # the index of another object
+K_REFERENCES = 2 # a list of indices
+
+# the tree as a marshalled table of objects, grouped by class and attributes.
+# each group holds a column per attribute: plain values are stored as they
+# are, and references to other objects (parent links included) as indices.
+# loading creates and fills a whole group at a time with map, so even parent
+# links come back without walking the tree in Python. raises TypeError for
+# trees holding anything else
+def dump(tree, fingerprint):
+  # the rows built here are all kept until the end, see load
+  enabled = gc.isenabled()
+  gc.disable()
+  try:
+    table = _flatten(tree)
+  finally:
+    if enabled: gc.enable()
+  return header.pack(MAGIC, FORMAT, fingerprint) + marshal.dumps(table)
+
+# (class names, root index, groups)
+def _flatten(tree):
+  index = {id(tree): 0}
+  objects = [tree]
+  slots = {}
+  groups = {}
+
+  def number(value):
+    found = index.get(id(value))
+    if found is None:
+      found = index[id(value)] = len(objects)
+      objects.append(value)
+    return found
+
+  position = 0
+  while position < len(objects):
+    obj = objects[position]
+    cls = type(obj)
+    if cls not in _names:
+      raise TypeError("can't cache %s" % cls.__name__)
+    if cls not in slots:
+      slots[cls] = None if hasattr(obj, '__dict__') else _slots(cls)
+
+    names = []
+    kinds = []
+    row = []
+    for name, value in _state(obj, slots[cls]).items():
+      if _is_node(value):
+        kind, value = K_REFERENCE, number(value)
+      elif isinstance(value, list) and value and \
+        all(_is_node(item) for item in value):
+        kind, value = K_REFERENCES, [number(item) for item in value]
+      elif type(value) in plain_types or (isinstance(value, list) and
+        all(type(item) in plain_types for item in value)):
+        kind = K_VALUE
+      else:
+        raise TypeError("can't cache %s.%s" % (cls.__name__, name))
+      names.append(name)
+      kinds.append(kind)
+      row.append(value)
+
+    group = groups.get((cls, tuple(names), tuple(kinds)))
+    if group is None:
+      group = groups[cls, tuple(names), tuple(kinds)] = ([], [])
+    group[0].append(position)
+    group[1].append(row)
+    position += 1
+
+  # objects are numbered group by group, so each group is one slice
+  final = [0] * len(objects)
+  count = 0
+  for members, rows in groups.values():
+    for member in members:
+      final[member] = count
+      count += 1
+
+  class_ids = {}
+  tables = []
+  for (cls, names, kinds), (members, rows) in groups.items():
+    class_id = class_ids.setdefault(cls, len(class_ids))
+    columns = []
+    for column, (name, kind) in enumerate(zip(names, kinds)):
+      values = [row[column] for row in rows]
+      if kind == K_REFERENCE:
+        values = array.array('I', [final[value] for value in values]).tobytes()
+      elif kind == K_REFERENCES:
+        values = [[final[item] for item in value] for value in values]
+      columns.append((name, kind, values))
+    tables.append((class_id, len(members), tuple(columns)))
+
+  class_names = [None] * len(class_ids)
+  for cls, class_id in class_ids.items():
+    class_names[class_id] = _names[cls]
+
+  return class_names, final[0], tables
+
+# returns None if data isn't a cache file for this fingerprint
+def load(data, fingerprint):
+  if len(data) < header.size:
+    return None
+  magic, format, found = header.unpack_from(data)
+  if magic != MAGIC or format != FORMAT or found != fingerprint:
+    return None
+  try:
+    class_names, root, tables = marshal.loads(data[header.size:])
+    classes = [_classes[name] for name in class_names]
+  except (EOFError, ValueError, TypeError, KeyError):
+    return None
+
+  # every object is new and nothing is garbage yet, so collections triggered
+  # by the allocations here would only walk the tree being built
+  enabled = gc.isenabled()
+  gc.disable()
+  try:
+    return _build(classes, root, tables)
+  except (IndexError, TypeError, ValueError, AttributeError):
+    return None
+  finally:
+    if enabled: gc.enable()
+
+# creates the objects of every group, then fills in their attributes a column
+# at a time
+def _build(classes, root, tables):
+  new = object.__new__
+  objects = []
+  for class_id, count, columns in tables:
+    objects.extend(map(new, itertools.repeat(classes[class_id], count)))
+  get = objects.__getitem__
+
+  start = 0
+  for class_id, count, columns in tables:
+    members = objects[start:start + count]
+    start += count
+    for name, kind, values in columns:
+      if kind == K_REFERENCE:
+        indices = array.array('I')
+        indices.frombytes(values)
+        values = indices
+      if len(values) != count:
+        return None
+      if kind == K_REFERENCE:
+        values = map(get, values)
+      elif kind == K_REFERENCES:
+        values = [list(map(get, items)) for items in values]
+      # setattr for every member in one pass
+      collections.deque(map(setattr, members, itertools.repeat(name),
+        values), 0)
+  return objects[root]
+
+# stores parse trees in a directory, one file per distinct source, keyed and
+# evicted the same way as tokencache.TokenCache
+#
+#   cache = ASTCache('.pycub-cache')
+#   tree = cache.load_file('main.cub')
+class ASTCache(tokencache.TokenCache):
+  suffix = '.ast'
+
+  # parser is the class to parse with on a miss, they all build the same trees
+  def __init__(self, directory, max_bytes=64 << 20, parser=Parser):
+    super(ASTCache, self).__init__(directory, max_bytes)
+    self.fingerprint = fingerprint()
+    self.parser = parser
+
+  def put(self, data, tree):
+    try:
+      super(ASTCache, self).put(data, tree)
+    except TypeError:
+      # holds something other than nodes and plain values, so it's parsed
+      # every time
+      pass
+
+  # internal api
+  def build(self, data):
+    return self.parser(TokenBuffer(Scanner(ByteReader(data)))).parse()
+
+  def encode(self, tree):
+    return dump(tree, self.fingerprint)
+
+  def decode(self, data):
+    return load(data, self.fingerprint)
@@ -0,0 +1,73 @@
+# synthetic cub sources of a given size and shape, for the benchmarks
+#
+# every line ends in punctuation, so no corpus depends on pushing a character
+# back across a newline
+
+import random
+
+def identifiers(rng, options):
+  length = options.get('length', 12)
+  alphabet = u'abcdefghijklmnopqrstuvwxyz_ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+  def name():
+    return rng.choice(alphabet[:26]) + u''.join(rng.choice(alphabet + u'0123456789')
+      for _ in range(rng.randrange(1, length)))
+  while True:
+    yield u"%s %s = %s.%s(%s, %s);\n" % (name(), name(), name(), name(), name(),
+      name())
+
+def operators(rng, options):
+  ops = [u'+', u'-', u'*', u'/', u'%', u'<<', u'>>', u'>>>', u'&', u'|', u'^',
+    u'&&', u'||', u'^^', u'==', u'!=', u'<', u'<=', u'>', u'>=', u'#']
+  assigns = [u'=', u'+=', u'-=', u'>>>=', u'<<=', u'#=', u'^=', u'|=']
+  while True:
+    terms = [u'a'] + [rng.choice(ops) + u'b' for _ in range(8)]
+    yield u"x %s %s;\n" % (rng.choice(assigns), u''.join(terms))
+
+def strings(rng, options):
+  length = options.get('length', 200)
+  alphabet = u'abcdefghij klmnopqrstuvwxyz,.!?'
+  escapes = [u'\\n', u'\\t', u'\\"', u'\\x41', u'\\\\']
+  escape_rate = options.get('escape_rate', 0.01)
+  while True:
+    chars = [rng.choice(escapes) if rng.random() < escape_rate
+      else rng.choice(alphabet) for _ in range(length)]
+    yield u's = "%s";\n' % u''.join(chars)
+
+def comments(rng, options):
+  depth = options.get('depth', 8)
+  while True:
+    lines = [u'/* level %d license header text\n' % level for level in range(depth)]
+    lines += [u' * doc text */\n'] * depth
+    yield u''.join(lines) + u'// line comment\nx;\n'
+
+def numbers(rng, options):
+  while True:
+    values = [str(rng.randrange(0, 1 << rng.choice((8, 16, 32, 64))))
+      for _ in range(8)]
+    yield u"table(%s);\n" % u', '.join(values)
+
+def mixed(rng, options):
+  shapes = [generator(rng, options) for generator in
+    (identifiers, operators, strings, comments, numbers)]
+  while True:
+    yield next(rng.choice(shapes))
+
+shapes = {
+  'identifiers': identifiers,
+  'operators': operators,
+  'strings': strings,
+  'comments': comments,
+  'numbers': numbers,
+  'mixed': mixed
+}
+
+# about size characters of the given shape, always ending on a line boundary
+def generate(shape, size, seed=0, **options):
+  rng = random.Random(seed)
+  lines = []
+  total = 0
+  for line in shapes[shape](rng, options):
+    if total >= size: break
+    lines.append(line)
+    total += len(line)
+  return u''.join(lines)
@@ -0,0 +1,104 @@
+# lexer throughput for every scanner input path over synthetic corpora
+#
+#   python -m pycub.bench.lexing [--size BYTES] [--shape NAME ...]
+#     [--path NAME ...] [--repeat N] [--output FILE]
+#
+# writes a JSON report, to stdout unless --output is given
+
+import argparse, json, os, platform, shutil, sys, tempfile, time, tracemalloc
+
+from pycub.bench import corpus
+from pycub.file_iter import file_chunks, file_iter, file_map
+from pycub.lex import RegexScanner, Scanner
+from pycub.parallel import lex_parallel
+from pycub.reader import ByteReader, ChunkReader, TextReader
+
+# each builds a token iterator from the corpus file and its text
+paths = {
+  'file_iter': lambda filename, text: Scanner(file_iter(filename)),
+  'file_map': lambda filename, text: Scanner(ByteReader(file_map(filename))),
+  'file_chunks': lambda filename, text:
+    Scanner(ChunkReader(file_chunks(filename))),
+  'iterator': lambda filename, text: Scanner(iter(text)),
+  'string': lambda filename, text: Scanner(text),
+  'text': lambda filename, text: Scanner(TextReader(text)),
+  'regex': lambda filename, text: RegexScanner(text),
+  'parallel': lambda filename, text: lex_parallel(text)
+}
+
+def count(scanner):
+  total = 0
+  for _ in scanner:
+    total += 1
+  return total
+
+def run(path, filename, text, repeat):
+  build = paths[path]
+  best = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    tokens = count(build(filename, text))
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+
+  tracemalloc.start()
+  count(build(filename, text))
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+
+  return tokens, best, peak
+
+def main(argv=None):
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--size', type=int, default=1 << 20)
+  parser.add_argument('--shape', action='append', choices=sorted(corpus.shapes))
+  parser.add_argument('--path', action='append', choices=sorted(paths))
+  parser.add_argument('--repeat', type=int, default=3)
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--output')
+  args = parser.parse_args(argv)
+
+  results = []
+  directory = tempfile.mkdtemp()
+  try:
+    for shape in args.shape or sorted(corpus.shapes):
+      text = corpus.generate(shape, args.size, args.seed)
+      filename = os.path.join(directory, shape + '.cub')
+      with open(filename, 'wb') as f:
+        f.write(text.encode('utf-8'))
+      size = os.path.getsize(filename)
+
+      for path in args.path or sorted(paths):
+        result = {'shape': shape, 'path': path, 'bytes': size}
+        try:
+          tokens, seconds, peak = run(path, filename, text, args.repeat)
+        except Exception as e:
+          result['error'] = "%s: %s" % (type(e).__name__, e)
+        else:
+          result.update({
+            'tokens': tokens,
+            'seconds': seconds,
+            'tokens_per_sec': tokens / seconds,
+            'mb_per_sec': size / seconds / (1 << 20),
+            'peak_bytes': peak
+          })
+        results.append(result)
+        print("%-12s %-12s %s" % (shape, path, result.get('error') or
+          "%.0f tokens/s" % result['tokens_per_sec']), file=sys.stderr)
+  finally:
+    shutil.rmtree(directory)
+
+  report = {
+    'python': platform.python_version(),
+    'size': args.size,
+    'seed': args.seed,
+    'results': results
+  }
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(report, f, indent=2)
+  else:
+    json.dump(report, sys.stdout, indent=2)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,86 @@
+# parse time for deeply nested calls, f(f(f(...x...))), with and without the
+# disambiguation memo
+#
+#   python -m pycub.bench.nesting [--depth N ...] [--repeat N] [--output FILE]
+#
+# writes a JSON report, to stdout unless --output is given
+
+import argparse, json, platform, sys, time
+
+import pycub.disambiguate as disambiguate
+from pycub.lex import Scanner
+from pycub.parse import Parser
+from pycub.tokenbuffer import TokenBuffer
+
+def source(depth):
+  return u"f(" * depth + u"x" + u")" * depth + u";"
+
+def run(tokens, memo, repeat):
+  best = None
+  for _ in range(repeat):
+    parser = Parser(tokens)
+    if not memo: parser.memo = None
+    start = time.perf_counter()
+    parser.parse()
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return best
+
+# counts the disambiguation scans of one parse
+def scans(tokens, memo):
+  count = [0]
+  scan = disambiguate.scan_expression_inner
+  def counted(*args):
+    count[0] += 1
+    return scan(*args)
+  disambiguate.scan_expression_inner = counted
+  try:
+    parser = Parser(tokens)
+    if not memo: parser.memo = None
+    parser.parse()
+  finally:
+    disambiguate.scan_expression_inner = scan
+  return count[0]
+
+def main(argv=None):
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--depth', type=int, action='append')
+  parser.add_argument('--repeat', type=int, default=3)
+  parser.add_argument('--output')
+  args = parser.parse_args(argv)
+
+  # the parser recurses several frames per level of nesting
+  sys.setrecursionlimit(max(sys.getrecursionlimit(), 20000))
+
+  results = []
+  for depth in args.depth or [10, 50, 100, 200, 400]:
+    tokens = TokenBuffer(Scanner(source(depth)))
+    for memo in (True, False):
+      result = {'depth': depth, 'memo': memo, 'tokens': len(tokens)}
+      try:
+        seconds = run(tokens, memo, args.repeat)
+      except Exception as e:
+        result['error'] = "%s: %s" % (type(e).__name__, e)
+      else:
+        result.update({
+          'seconds': seconds,
+          'tokens_per_sec': len(tokens) / seconds,
+          'scans': scans(tokens, memo)
+        })
+      results.append(result)
+      print("depth %-6d %-8s %s" % (depth, 'memo' if memo else 'rescan',
+        result.get('error') or "%.0f tokens/s, %d scans" %
+        (result['tokens_per_sec'], result['scans'])), file=sys.stderr)
+
+  report = {
+    'python': platform.python_version(),
+    'results': results
+  }
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(report, f, indent=2)
+  else:
+    json.dump(report, sys.stdout, indent=2)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,129 @@
+# parser throughput for each expression engine over synthetic programs, timed
+# apart from lexing, with the time spent in each module for telling apart
+# disambiguation, expression parsing and the readers
+#
+#   python -m pycub.bench.parsing [--size BYTES] [--shape NAME ...]
+#     [--parser NAME ...] [--depth N] [--length N] [--repeat N]
+#     [--output FILE]
+#
+# writes a JSON report, to stdout unless --output is given
+
+import argparse, cProfile, json, os, platform, pstats, sys, time, tracemalloc
+
+import pycub.statement as statement
+from pycub.bench import programs
+from pycub.lex import Scanner
+from pycub.parse import Parser, PrattParser, StackParser
+from pycub.tokenbuffer import TokenBuffer
+
+parsers = {
+  'climbing': Parser,
+  'pratt': PrattParser,
+  'stack': StackParser
+}
+
+# every statement in the tree, nested ones included
+def count_statements(tree):
+  total = 0
+  pending = [tree]
+  while pending:
+    node = pending.pop()
+    while node is not None:
+      total += 1
+      if isinstance(node, statement.BlockStatement):
+        pending.append(node.body)
+      elif isinstance(node, statement.IfStatement):
+        pending.extend((node.first, node.second))
+      elif isinstance(node, statement.LoopStatement):
+        pending.append(node.body)
+      node = getattr(node, 'next', None)
+  return total
+
+def best_time(function, repeat):
+  best = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return result, best
+
+# own time by module, from one profiled parse
+def module_seconds(parse):
+  profile = cProfile.Profile()
+  profile.runcall(parse)
+  seconds = {}
+  for (filename, line, function), entry in \
+    pstats.Stats(profile).stats.items():
+    if filename == '~':
+      module = 'builtins'
+    else:
+      module = os.path.splitext(os.path.basename(filename))[0]
+    seconds[module] = seconds.get(module, 0) + entry[2]
+  return dict(sorted(seconds.items(), key=lambda item: -item[1]))
+
+def run(parser_class, text, repeat):
+  tokens, lex_seconds = best_time(lambda: TokenBuffer(Scanner(text)), repeat)
+  parse = lambda: parser_class(tokens).parse()
+  tree, parse_seconds = best_time(parse, repeat)
+
+  tracemalloc.start()
+  parse()
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+
+  statements = count_statements(tree)
+  return {
+    'tokens': len(tokens),
+    'statements': statements,
+    'lex_seconds': lex_seconds,
+    'parse_seconds': parse_seconds,
+    'statements_per_sec': statements / parse_seconds,
+    'tokens_per_sec': len(tokens) / parse_seconds,
+    'peak_bytes': peak,
+    'module_seconds': module_seconds(parse)
+  }
+
+def main(argv=None):
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--size', type=int, default=1 << 18)
+  parser.add_argument('--shape', action='append',
+    choices=sorted(programs.shapes))
+  parser.add_argument('--parser', action='append', choices=sorted(parsers))
+  parser.add_argument('--depth', type=int, default=50)
+  parser.add_argument('--length', type=int, default=32)
+  parser.add_argument('--repeat', type=int, default=3)
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--output')
+  args = parser.parse_args(argv)
+
+  results = []
+  for shape in args.shape or sorted(programs.shapes):
+    text = programs.generate(shape, args.size, args.seed, depth=args.depth,
+      length=args.length)
+    for name in args.parser or sorted(parsers):
+      result = {'shape': shape, 'parser': name, 'bytes': len(text)}
+      try:
+        result.update(run(parsers[name], text, args.repeat))
+      except Exception as e:
+        result['error'] = "%s: %s" % (type(e).__name__, e)
+      results.append(result)
+      print("%-10s %-9s %s" % (shape, name, result.get('error') or
+        "%.0f statements/s" % result['statements_per_sec']), file=sys.stderr)
+
+  report = {
+    'python': platform.python_version(),
+    'size': args.size,
+    'seed': args.seed,
+    'depth': args.depth,
+    'length': args.length,
+    'results': results
+  }
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(report, f, indent=2)
+  else:
+    json.dump(report, sys.stdout, indent=2)
+
+if __name__ == '__main__':
+  main()
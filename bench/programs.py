@@ -0,0 +1,113 @@
+# synthetic cub programs of a given size and shape, for the parser benchmarks.
+# unlike corpus, these are meant to parse
+#
+# each generator yields one top-level statement at a time
+
+import random
+
+# the underscore keeps names like u8 from scanning as types
+def name(rng):
+  return u"%s_%d" % (rng.choice(u'abcdefghijklmnopqrstuvwxyz'),
+    rng.randrange(64))
+
+def term(rng):
+  if rng.random() < 0.25:
+    return str(rng.randrange(1000))
+  return name(rng)
+
+binary = [u'+', u'-', u'*', u'/', u'%', u'<<', u'>>', u'>>>', u'&', u'|',
+  u'^', u'&&', u'||', u'^^', u'==', u'!=', u'<', u'<=', u'>', u'>=', u'#']
+
+assigns = [u'=', u'+=', u'-=', u'*=', u'<<=', u'#=', u'^=', u'|=']
+
+# short statements of every kind the parser handles on one line
+def flat(rng, options):
+  while True:
+    choice = rng.randrange(5)
+    if choice == 0:
+      yield u"%s = %s + %s;\n" % (name(rng), term(rng), term(rng))
+    elif choice == 1:
+      yield u"%s(%s, %s);\n" % (name(rng), term(rng), term(rng))
+    elif choice == 2:
+      yield u"%s.%s = %s[%s];\n" % (name(rng), name(rng), name(rng), term(rng))
+    elif choice == 3:
+      yield u"%s++;\n" % name(rng)
+    else:
+      yield u"%s %s -%s;\n" % (name(rng), rng.choice(assigns), term(rng))
+
+# long binary operator chains
+def operators(rng, options):
+  length = options.get('length', 32)
+  while True:
+    terms = [term(rng)] + [u" %s %s" % (rng.choice(binary), term(rng))
+      for _ in range(length)]
+    yield u"%s %s %s;\n" % (name(rng), rng.choice(assigns), u''.join(terms))
+
+# parentheses nested depth deep on the right of an assignment
+def parens(rng, options):
+  depth = options.get('depth', 50)
+  while True:
+    text = term(rng)
+    for _ in range(depth):
+      text = u"(%s %s %s)" % (text, rng.choice(binary), term(rng))
+    yield u"%s = %s;\n" % (name(rng), text)
+
+# if, else and while blocks nested depth deep
+def nesting(rng, options):
+  depth = options.get('depth', 50)
+  while True:
+    lines = []
+    keywords = [u"if" if rng.random() < 0.5 else u"while"
+      for _ in range(depth)]
+    for level, keyword in enumerate(keywords):
+      lines.append(u"%s%s (%s < %s) {\n" %
+        (u" " * level, keyword, name(rng), term(rng)))
+    lines.append(u"%s%s += 1;\n" % (u" " * depth, name(rng)))
+    for level in reversed(range(depth)):
+      orelse = keywords[level] == u"if" and rng.random() < 0.25
+      lines.append(u"%s}%s\n" % (u" " * level,
+        u" else %s--;" % name(rng) if orelse else u""))
+    yield u''.join(lines)
+
+# a call to depth levels of nested calls among plain arguments
+def call(rng, depth):
+  if depth == 0:
+    return term(rng)
+  arguments = [call(rng, depth - 1)] + [term(rng)
+    for _ in range(rng.randrange(3))]
+  rng.shuffle(arguments)
+  return u"%s(%s)" % (name(rng), u", ".join(arguments))
+
+# nested and chained calls, which send every argument list through
+# disambiguation. the parser doesn't take function definitions yet
+def calls(rng, options):
+  depth = options.get('depth', 50)
+  while True:
+    nested = call(rng, rng.randrange(1, depth + 1))
+    choice = rng.randrange(3)
+    if choice == 0:
+      yield u"%s;\n" % nested
+    elif choice == 1:
+      yield u"%s = %s;\n" % (name(rng), nested)
+    else:
+      yield u"%s(%s)(%s);\n" % (name(rng), term(rng), nested)
+
+shapes = {
+  'flat': flat,
+  'operators': operators,
+  'parens': parens,
+  'nesting': nesting,
+  'calls': calls
+}
+
+# about size characters of the given shape, always a whole number of
+# statements
+def generate(shape, size, seed=0, **options):
+  rng = random.Random(seed)
+  statements = []
+  total = 0
+  for statement in shapes[shape](rng, options):
+    if total >= size: break
+    statements.append(statement)
+    total += len(statement)
+  return u''.join(statements)
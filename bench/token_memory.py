@@ -0,0 +1,71 @@
+# compares the memory held by a lexed token stream against the old token
+# representation (a __dict__ per token, a fresh string per identifier)
+#
+#   python -m pycub.bench.token_memory [--lines N]
+
+import argparse, gc, tracemalloc
+
+import pycub.tokens as tokens
+from pycub.lex import Scanner
+
+class DictToken(tokens.Token):
+  pass
+
+class DictIdToken(tokens.IdToken):
+  pass
+
+class DictLiteralToken(tokens.LiteralToken):
+  pass
+
+def source(lines):
+  names = [u"alpha", u"beta", u"gamma", u"delta", u"counter", u"index"]
+  return u''.join(u"%s = %s + (%s * %d) - \"item\";\n" %
+    (names[line % 6], names[(line + 1) % 6], names[(line + 2) % 6], line)
+    for line in range(lines))
+
+# copies each token into a subclass that has a __dict__, and gives every
+# identifier its own string
+def unslotted(stream):
+  for token in stream:
+    if isinstance(token, tokens.IdToken):
+      copy = DictIdToken(token.line, token.offset, u''.join(list(token.value)))
+    elif isinstance(token, tokens.LiteralToken):
+      copy = DictLiteralToken(token.line, token.offset, token.literal_type)
+      copy.value = getattr(token, 'value', None)
+    else:
+      copy = DictToken(token.line, token.offset, token.token_type)
+    yield copy
+
+def measure(build):
+  gc.collect()
+  tracemalloc.start()
+  before = tracemalloc.take_snapshot()
+  result = build()
+  current, peak = tracemalloc.get_traced_memory()
+  after = tracemalloc.take_snapshot()
+  tracemalloc.stop()
+  blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+  return result, current, peak, blocks
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--lines', type=int, default=20000)
+  args = parser.parse_args()
+
+  text = source(args.lines)
+  stream = list(Scanner(iter(text)))
+
+  rows = [
+    ("slots + interning", lambda: list(Scanner(iter(text)))),
+    ("dict + fresh strings", lambda: list(unslotted(stream)))
+  ]
+
+  print("%d lines, %d tokens" % (args.lines, len(stream)))
+  print("%-22s %12s %12s %12s" % ("representation", "retained", "peak", "blocks"))
+  for name, build in rows:
+    result, current, peak, blocks = measure(build)
+    print("%-22s %12d %12d %12d" % (name, current, peak, blocks))
+    del result
+
+if __name__ == '__main__':
+  main()
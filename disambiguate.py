@@ -23,6 +23,15 @@ G_NEW_ARRAY = 1
 G_NEW_OBJECT = 2
 
 def get_accept(lookahead):
+  # compare types without building tokens where the lookahead allows it
+  if hasattr(lookahead, 'peek_type'):
+    def accept(token_type):
+      if lookahead.peek_type() != token_type:
+        return False
+      lookahead.skip()
+      return True
+    return accept
+
   def accept(token_type):
     token = lookahead.peek()
     if token is None or token.token_type != token_type:
@@ -31,8 +40,40 @@ def get_accept(lookahead):
     return True
   return accept
 
-
-def disambiguate_expression_inner(lookahead, restrict):
+# each scan is a generator that yields the restrict of every nested argument
+# list it needs scanned and is sent back the result, so nesting takes memory
+# rather than recursion. results are a function of where a scan starts and
+# restrict alone, so with a memo (and a lookahead that can tell and seek) each
+# nested argument list is only ever scanned once. the memo maps (position,
+# restrict) to the result and the position it stopped at
+def disambiguate_expression_inner(lookahead, restrict, memo=None):
+  if not hasattr(lookahead, 'tell'):
+    memo = None
+  stack = []
+  result = None
+  while True:
+    if restrict is not None:
+      key = None if memo is None else (lookahead.tell(), restrict)
+      found = None if key is None else memo.get(key)
+      if found is None:
+        stack.append((scan_expression_inner(lookahead, restrict), key))
+        result = None
+      else:
+        lookahead.seek(found[1])
+        result = found[0]
+        if not stack: return result
+
+    scan, key = stack[-1]
+    try:
+      restrict = scan.send(result)
+    except StopIteration as stop:
+      stack.pop()
+      result, restrict = stop.value, None
+      if key is not None:
+        memo[key] = (result, lookahead.tell())
+      if not stack: return result
+
+def scan_expression_inner(lookahead, restrict):
   accept = get_accept(lookahead)
 
   if not accept(tokens.L_TYPE) and not accept(tokens.L_IDENTIFIER):
@@ -52,7 +93,8 @@ def disambiguate_expression_inner(lookahead, restrict):
       if restrict & G_EXPRESSION: subrestrict |= G_EXPRESSION | G_FUNCTION
       if restrict & G_FUNCTION: subrestrict |= G_ARGUMENT | G_PARAMETER
 
-      detect = disambiguate_expression_inner(lookahead, restrict)
+      # the nested scan, run by disambiguate_expression_inner
+      detect = yield restrict
 
       if detect == 0:
         return 0
@@ -125,7 +167,8 @@ def disambiguate_statement(parser):
       if restrict & G_EXPRESSION: subrestrict |= G_EXPRESSION | G_FUNCTION
       if restrict & G_FUNCTION: subrestrict |= G_ARGUMENT | G_PARAMETER
 
-      detect = disambiguate_expression_inner(lookahead, subrestrict)
+      detect = disambiguate_expression_inner(lookahead, subrestrict,
+        parser.memo)
 
       if detect == 0:
         return 0
@@ -182,7 +225,8 @@ def disambiguate_expression(parser):
     while True:
       subrestrict = G_ARGUMENT | G_EXPRESSION | G_FUNCTION | G_PARAMETER
 
-      detect = disambiguate_expression_inner(lookahead, subrestrict)
+      detect = disambiguate_expression_inner(lookahead, subrestrict,
+        parser.memo)
 
       if detect == 0:
         return 0
@@ -230,7 +274,8 @@ def disambiguate_new(parser):
     if not accept(tokens.L_CLOSE_PAREN):
       while True:
         subrestrict = G_EXPRESSION | G_FUNCTION | G_PARAMETER
-        restrict = disambiguate_expression_inner(lookahead, subrestrict)
+        restrict = disambiguate_expression_inner(lookahead, subrestrict,
+          parser.memo)
 
         if restrict == 0:
           # it's clearly wrong, might as well try
@@ -1,5 +1,6 @@
 import pycub.code as code
 import pycub.ops as operator
+import pycub.tree as tree
 
 class Expression(object):
   def __init__(self):
@@ -13,6 +14,18 @@ class Expression(object):
     # TODO: ParseError or something
     raise Exception("cannot capture this expression")
 
+  # nodes are equal when all of their attributes are, see tree.equal
+  @property
+  def fields(self):
+    return sorted(vars(self))
+
+  def __eq__(self, other):
+    return tree.equal(self, other)
+
+  # defining __eq__ drops the inherited hash, and nodes are used as keys by
+  # identity
+  __hash__ = object.__hash__
+
 class CallNode(Expression):
   def __init__(self, callee, args):
     self.callee = callee
@@ -83,6 +96,45 @@ class BinaryNode(Expression):
 # MulNode = binary_factory(operator.O_MUL, types.isNum)
 # SubNode = binary_factory(operator.O_SUB, types.isNum)
 
+################################################################################
+## operators as parsed, before desugaring and type analysis
+################################################################################
+
+# type is the operator's token type, see desugar below
+class OperatorNode(Expression):
+  def __init__(self, type, left, right):
+    self.type = type
+    self.left = left
+    self.right = right
+
+  def gen(self, block):
+    raise NotImplementedError("TODO: implement me")
+
+class NegateNode(Expression):
+  def __init__(self, value):
+    self.value = value
+
+  def gen(self, block):
+    raise NotImplementedError("TODO: implement me")
+
+# ! when bitwise is False, ~ otherwise
+class NotNode(Expression):
+  def __init__(self, bitwise, value):
+    self.bitwise = bitwise
+    self.value = value
+
+  def gen(self, block):
+    raise NotImplementedError("TODO: implement me")
+
+# x++ and x--, type is the token type
+class PostfixNode(Expression):
+  def __init__(self, type, value):
+    self.type = type
+    self.value = value
+
+  def gen(self, block):
+    raise NotImplementedError("TODO: implement me")
+
 ################################################################################
 ## getters and setters and associated capture objects
 ################################################################################
@@ -1,4 +1,4 @@
-import codecs
+import codecs, mmap, os
 
 def file_iter(filename):
   # utf-8-sig is the same as utf-8, except that it strips the BOM if present
@@ -7,3 +7,26 @@ def file_iter(filename):
     while len(char):
       yield char
       char = f.read(1)
+
+# reads the file in large blocks and yields whole decoded chunks, for use with
+# reader.ChunkReader. the incremental decoder holds on to code points split
+# across a block boundary until the rest of them arrives
+def file_chunks(filename, size=65536):
+  decoder = codecs.getincrementaldecoder('utf-8-sig')()
+  with open(filename, 'rb') as f:
+    while True:
+      block = f.read(size)
+      chunk = decoder.decode(block, final=not block)
+      if chunk:
+        yield chunk
+      if not block: break
+
+# maps the raw utf-8 bytes of the file into memory, for use with
+# reader.ByteReader (which strips the BOM itself, and closes the map when it's
+# closed or used as a context manager)
+def file_map(filename):
+  with open(filename, 'rb') as f:
+    # empty files can't be mapped
+    if os.fstat(f.fileno()).st_size == 0:
+      return b''
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
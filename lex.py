@@ -1,31 +1,20 @@
+import re
 import pycub.tokens as tokens
 import pycub.types as types
-from pycub.reader import CharReader
-
-ordinalset = set(map(str, range(0, 10)))
-hexletterset = set(map(chr, range(0x41, 0x47)))
-alphaset = set(map(chr, range(0x41, 0x5b))) | \
-  set(map(chr, range(0x61, 0x7b)))
+import pycub.stats as stats
+from pycub.parse import ParseError
+from pycub.reader import CharReader, ChunkReader
+
+# frozen so that readers can cache per-set matchers
+ordinalset = frozenset(map(str, range(0, 10)))
+hexletterset = frozenset(map(chr, range(0x41, 0x47)))
+alphaset = frozenset(map(chr, range(0x41, 0x5b))) | \
+  frozenset(map(chr, range(0x61, 0x7b)))
 idstartset = alphaset.union(set(['_']))
 idset = ordinalset.union(idstartset)
 
-keywordmap = {
-  u"as":       tokens.L_AS,
-  u"break":    tokens.L_BREAK,
-  u"case":     tokens.L_CASE,
-  u"class":    tokens.L_CLASS,
-  u"continue": tokens.L_CONTINUE,
-  u"do":       tokens.L_DO,
-  u"else":     tokens.L_ELSE,
-  u"extends":  tokens.L_EXTENDS,
-  u"for":      tokens.L_FOR,
-  u"if":       tokens.L_IF,
-  u"let":      tokens.L_LET,
-  u"native":   tokens.L_NATIVE,
-  u"new":      tokens.L_NEW,
-  u"return":   tokens.L_RETURN,
-  u"while":    tokens.L_WHILE
-}
+# mapped by the parser where a statement can start, see word_token
+keywordmap = tokens.keywordmap
 
 typemap = {
   u"bool":   types.T_BOOL,
@@ -58,11 +47,107 @@ escapemap = {
   u'v': u'\v'
 }
 
+# the characters that interrupt a run of plain string contents
+string_stops = {
+  u'"': frozenset(u'"\\'),
+  u"'": frozenset(u"'\\")
+}
+
+number_pattern = re.compile(r'''
+  0x(?P<hex>[0-9A-Fa-f]+) | 0b(?P<binary>[01]+) | 0o(?P<octal>[0-7]+) |
+  (?P<decimal>[0-9]+) |
+  (?P<float>[0-9]*\.[0-9]+(?:[eE][+-]?[0-9]+)? | [0-9]+[eE][+-]?[0-9]+)
+''', re.X)
+
+# a literal that can take a signed exponent next
+exponent_pattern = re.compile(r'[0-9]*(?:\.[0-9]*)?[eE]')
+
+number_bases = {'hex': 16, 'binary': 2, 'octal': 8, 'decimal': 10}
+
+# converts the complete span of a numeric literal, error is called with a
+# message if it isn't one
+def number_token(line, offset, span, error):
+  found = number_pattern.fullmatch(span)
+  if found is None:
+    prefix = span[:2]
+    if prefix == u'0x': error("expected [0-9a-f]")
+    if prefix == u'0b': error("expected [01]")
+    if prefix == u'0o': error("expected [0-7]")
+    if exponent_pattern.fullmatch(span): error("expected exponent")
+    error("identifiers may not begin with digits")
+
+  kind = found.lastgroup
+  if kind == 'float':
+    value = float(span)
+    if value == float('inf'):
+      error("float literal too large")
+    return tokens.FloatToken(line, offset, value)
+
+  if kind == 'decimal' and len(span) > 1 and span[0] == u'0':
+    print("warning: octals are written as 0o7, not 07")
+  value = int(found.group(kind), number_bases[kind])
+  if value > 0xffffffffffffffff:
+    error("%s literal too large" % kind)
+  return tokens.IntToken(line, offset, value)
+
+def word_token(line, offset, word):
+  # TODO: don't map yet, map in parser - context sensitive
+  # maybe handle reserved words like "import" here?
+  # (import is reserved for type names, what about bindings?)
+  # if word in keywordmap:
+  #   return tokens.Token(line, offset, keywordmap[word])
+
+  if word in typemap:
+    return tokens.TypeToken(line, offset, typemap[word])
+
+  if word == u"true":
+    return tokens.BoolToken(line, offset, True)
+  if word == u"false":
+    return tokens.BoolToken(line, offset, False)
+  if word == u"null":
+    return tokens.LiteralToken(line, offset, types.T_OBJECT)
+  return tokens.IdToken(line, offset, word)
+
+# builds a transition table from tokens.punctuation. state 0 is the start,
+# transitions[state] maps the next character to the next state, and
+# accepts[state] is the token type matched in that state, or None for a prefix
+# that isn't punctuation itself, like .. on the way to ...
+def punctuation_table(table):
+  transitions = [{}]
+  accepts = [None]
+  for string, token_type in table.items():
+    state = 0
+    for char in string:
+      next = transitions[state].get(char)
+      if next is None:
+        next = transitions[state][char] = len(transitions)
+        transitions.append({})
+        accepts.append(None)
+      state = next
+    accepts[state] = token_type
+  return transitions, accepts
+
+punctuation_transitions, punctuation_accepts = \
+  punctuation_table(tokens.punctuation)
+
 class Scanner:
   # public api
-  def __init__(self, upstream):
+  # upstream is a source string, an iterable of characters or a CharReader,
+  # such as a reader.ByteReader over file_iter.file_map. symbols interns
+  # identifier and string values, and can be shared by every scanner in a
+  # compilation
+  def __init__(self, upstream, symbols=None):
     self.upstream = upstream
-    self.reader = CharReader(upstream)
+    if isinstance(upstream, CharReader):
+      self.reader = upstream
+    elif isinstance(upstream, str):
+      # a whole string is a single chunk
+      self.reader = ChunkReader((upstream,))
+    else:
+      self.reader = CharReader(upstream)
+    self.symbols = {} if symbols is None else symbols
+    if stats.active is not None:
+      stats.instrument(self)
 
   def __iter__(self):
     return self
@@ -77,8 +162,6 @@ class Scanner:
 
     # handle whitespace and comments
     while True:
-      # token offset start
-      offset = reader.offset
       char = reader.pop()
       if char == u'/':
         char = reader.peek()
@@ -94,314 +177,294 @@ class Scanner:
       elif char is None: return None
       elif char != u'\n': break
 
-    def accept(char):
-      return reader.accept(char) is not None
+    # the first character of the token has just been consumed, and it can't
+    # be a newline, so the position is only looked up once per token
+    offset = reader.offset - 1
 
-    if char == u'.':
-      if reader.peek() not in ordinalset:
-        return self.token(tokens.L_DOT, offset)
-      reader.push(char)
-      return self.scan_number()
-
-    if char in ordinalset:
-      reader.push(char)
-      return self.scan_number()
+    if char in ordinalset or (char == u'.' and reader.peek() in ordinalset):
+      return self.scan_number(char, offset)
 
     if char in idstartset:
-      reader.push(char)
-      return self.scan_word()
+      return self.scan_word(char, offset)
 
     if char in u'\'"':
       return self.scan_string(char, offset)
 
-    if char == u'#':
-      # accept '='
-      return self.token(tokens.L_STR_CONCAT_ASSIGN if accept(u'=')
-        else tokens.L_STR_CONCAT, offset)
-
-    if char == u'!':
-      # accept '='
-      token_type = tokens.L_NE if accept(u'=') else tokens.L_NOT
-    elif char == u'>':
-      if accept(u'>'):
-        if accept(u'>'):
-          if accept(u'='): token_type = tokens.L_RSHIFT_ASSIGN
-          else: token_type = tokens.L_RSHIFT
-        elif accept(u'='): token_type = tokens.L_ASHIFT_ASSIGN
-        else: token_type = tokens.L_ASHIFT
-      elif accept(u'='): token_type = tokens.L_GTE
-      else: token_type = tokens.L_GT
-    elif char == u'<':
-      if accept(u'<'):
-        if accept(u'='): token_type = tokens.L_LSHIFT_ASSIGN
-        else: token_type = tokens.L_LSHIFT
-      elif accept(u'='): token_type = tokens.L_LTE
-      else: token_type = tokens.L_LT
-    elif char == u'%':
-      token_type = tokens.L_MOD_ASSIGN if accept(u'=') else tokens.L_MOD
-    elif char == u'&':
-      if accept(u'&'): token_type = tokens.L_AND
-      elif accept(u'='): token_type = tokens.L_BITWISE_AND_ASSIGN
-      else: token_type = tokens.L_BITWISE_AND
-    elif char == u'*':
-      token_type = tokens.L_MUL_ASSIGN if accept(u'=') else tokens.L_MUL
-    elif char == u'+':
-      if accept(u'+'): token_type = tokens.L_INCREMENT
-      elif accept(u'='): token_type = tokens.L_ADD_ASSIGN
-      else: token_type = tokens.L_ADD
-    elif char == u'-':
-      if accept(u'-'): token_type = tokens.L_DECREMENT
-      elif accept(u'='): token_type = tokens.L_SUB_ASSIGN
-      else: token_type = tokens.L_SUB
-    elif char == u'/':
-      token_type = tokens.L_DIV_ASSIGN if accept(u'=') else tokens.L_DIV
-    elif char == u'=':
-      token_type = tokens.L_EQ if accept(u'=') else tokens.L_ASSIGN
-    elif char == u'^':
-      if accept(u'^'): token_type = tokens.L_XOR
-      elif accept(u'='): token_type = tokens.L_BITWISE_XOR_ASSIGN
-      else: token_type = tokens.L_BIWISE_XOR
-    elif char == u'|':
-      if accept(u'|'): token_type = tokens.L_OR
-      elif accept(u'='): token_type = tokens.L_BITWISE_OR_ASSIGN
-      else: token_type = tokens.L_BITWISE_OR
-    elif char == u'(': token_type = tokens.L_OPEN_PAREN
-    elif char == u')': token_type = tokens.L_CLOSE_PAREN
-    elif char == u',': token_type = tokens.L_COMMA
-    elif char == u':': token_type = tokens.L_COLON
-    elif char == u';': token_type = tokens.L_SEMICOLON
-    elif char == u'?': token_type = tokens.L_TERNARY
-    elif char == u'[': token_type = tokens.L_OPEN_BRACKET
-    elif char == u']': token_type = tokens.L_CLOSE_BRACKET
-    elif char == u'{': token_type = tokens.L_OPEN_BRACE
-    elif char == u'}': token_type = tokens.L_CLOSE_BRACE
-    elif char == u'~': token_type = tokens.L_BITWISE_NOT
-    else:
+    # walk the punctuation table as far as it goes, then give back whatever
+    # was read past the last state that matched
+    state = punctuation_transitions[0].get(char)
+    if state is None:
       self.error("unexpected character '%c'" % char)
+    token_type = punctuation_accepts[state]
+    extra = []
+    while True:
+      next = punctuation_transitions[state].get(reader.peek())
+      if next is None: break
+      extra.append(reader.pop())
+      state = next
+      if punctuation_accepts[state] is not None:
+        token_type = punctuation_accepts[state]
+        extra = []
+    if token_type is None:
+      self.error("unexpected character '%c'" % char)
+    for char in reversed(extra):
+      reader.push(char)
     return self.token(token_type, offset)
 
   # internal api
-  def scan_word(self):
+  def scan_word(self, char, offset):
     reader = self.reader
-    offset = reader.offset
-    word = reader.pop()
-    while True:
-      char = reader.pop()
-      if char not in idset:
-        reader.push(char)
-        break
-      word += char
-
-    # TODO: don't map yet, map in parser - context sensitive
-    # maybe handle reserved words like "import" here?
-    # (import is reserved for type names, what about bindings?)
-    # if word in keywordmap:
-    #   return self.token(keywordmap[word], offset)
-
-    if word in typemap:
-      return tokens.TypeToken(reader.line, offset, typemap[word])
-
-    if word == u"true":
-      token = tokens.BoolToken(reader.line, offset, True)
-    elif word == u"false":
-      token = tokens.BoolToken(reader.line, offset, False)
-    elif word == u"null":
-      token = self.token(tokens.L_LITERAL, offset)
-      tokens.literal_type = T_OBJECT
-    else:
-      token = tokens.IdToken(reader.line, offset, word)
+    word = char + reader.take_while(idset)
 
-    return token
+    return word_token(reader.line, offset, self.symbols.setdefault(word, word))
 
   # TODO: interpolation
   def scan_string(self, match, offset):
     reader = self.reader
-    string = u""
+    stops = string_stops[match]
+    # runs of plain characters are taken whole and joined once at the end
+    pieces = []
     while True:
+      pieces.append(reader.take_until(stops))
       char = reader.pop()
       if char == match: break
       if char is None:
         self.error("unexpected EOF, expected character")
-      if char != u'\\':
-        string += char
-        continue
+      # must be a backslash
       char = reader.pop()
       if char is None:
         self.error("unexpected EOF, expected character")
       if char in escapemap:
-        string += escapemap[char]
+        pieces.append(escapemap[char])
         continue
       if char == u'u':
         raise NotImplementedError("unicode not implemented")
       if char == u'\n':
         self.error("expected escape sequence, found newline")
       if char == u'x':
-        string += chr((self.expectHexDigit() << 4) | self.expectHexDigit())
+        pieces.append(chr((self.expect_hex_digit() << 4) |
+          self.expect_hex_digit()))
       else:
         self.error("unexpected character '%c', expected escape sequence" %
           char)
 
-    return tokens.StrToken(reader.line, offset, string)
-
-  def scan_number(self):
-    offset = self.reader.offset
-    token = self.scan_number_inner()
-    token.offset = offset
-    return token
+    string = u''.join(pieces)
+    return tokens.StrToken(reader.line, offset,
+      self.symbols.setdefault(string, string))
 
-  # TODO: use maybeDot for floats
-  def scan_number_inner(self):
+  # finds the whole literal first, then converts it in one go
+  def scan_number(self, char, offset):
     reader = self.reader
-
-    def integer_token(value):
-      return tokens.IntToken(reader.line, 0, value)
-
-    char = reader.pop()
-    if char == u'0':
-      char = reader.pop()
-
-      if char is None:
-        return integer_token(0)
-
-      # TODO: maybe_dot support with floating point literals
-      if char == u'.':
+    span = char + reader.take_while(idset)
+    # a dot only continues a decimal literal if a digit follows, as in 0.5 but
+    # not 0.method()
+    if reader.peek() == u'.' and span.isdigit():
+      reader.pop()
+      if reader.peek() in ordinalset:
+        span += u'.' + reader.take_while(idset)
+      else:
         reader.push(u'.')
-        return integer_token(0)
-
-      if char in u".eE":
-        raise NotImplementedError("floating point literals are not implemented")
-
-      if char == u'x':
-        found = False
-        value = 0
-
-        while True:
-          char = reader.pop()
-
-          if char is None: break
-
-          if char in ordinalset:
-            v2 = value << 4
-            if v2 > 0xffffffffffffffff:
-              self.error("hex literal too large")
-            found = True
-            value = v2 | (ord('0' - ord(char)))
-            continue
-
-          lower = char.lower()
-          if lower in hexletterset:
-            v2 = value << 4
-            if v2 > 0xffffffffffffffff:
-              self.error("hex literal too large")
-            found = True
-            value = v2 | (ord(lower) - 0x57)
-            continue
-
-          reader.push(char)
-          break
+    if reader.peek() in (u'+', u'-') and exponent_pattern.fullmatch(span):
+      span += reader.pop() + reader.take_while(idset)
+    return number_token(reader.line, offset, span, self.error)
 
-        if not found:
-          self.error("expected [0-9a-f]")
-        return integer_token(value)
-
-      if char == u'b':
-        found = False
-        value = 0
+  def expect_hex_digit(self):
+    char = self.reader.pop()
 
-        while True:
-          char = reader.pop()
+    if char is None:
+      self.error("unexpected EOF, expected hex digit")
 
-          if char is None or char not in u"01":
-            if char is not None and char in ordinalset:
-              self.error("bad binary literal")
+    c = ord(char)
 
-            if not found:
-              self.error("expected [01]")
+    if c >= 0x30 and c <= 0x39: return c - 0x30
+    c |= 0x20
+    if c >= 0x61 and c <= 0x66: return c - 0x57
 
-            reader.push(char)
-            break
+    self.error("unexpected character, expected hex digit")
 
-          v2 = value << 1
-          if v2 > 0xffffffffffffffff:
-            self.error("binary literal too large")
+  def consume_comment(self):
+    if not self.reader.consume_comment():
+      self.error("unexpected EOF, expected '*/'")
 
-          found = True
-          value = v2 | (ord(chr) - 0x30)
+  def token(self, token_type, offset = None):
+    if offset is None: offset = self.reader.offset
+    return tokens.Token(self.reader.line, offset, token_type)
 
-        return integer_token(value)
+  def error(self, message):
+    raise ParseError(self.reader.line, self.reader.offset, message)
 
-      if char == u'o':
-        raise NotImplementedError("octal literals not implemented")
 
-      if char not in ordinalset:
-        if char in idstartset:
-          self.error("identifiers may not begin with a digit")
-        reader.push(char)
-        return integer_token(0)
+################################################################################
+## regex engine
+################################################################################
+
+# groups of the master pattern, in order
+M_SPACE = 1
+M_LINE_COMMENT = 2
+M_COMMENT = 3
+M_WORD = 4
+M_NUMBER = 5
+M_STRING = 6
+M_PUNCTUATION = 7
+
+master_pattern = re.compile(u'|'.join([
+  r'([ \t\n]+)',
+  r'(//[^\n]*)',
+  r'(/\*)',
+  r'([A-Za-z_][0-9A-Za-z_]*)',
+  r'([0-9]|\.[0-9])',
+  r'(["\'])',
+  r'(' + u'|'.join(re.escape(string) for string in
+    sorted(tokens.punctuation, key=len, reverse=True)) + r')'
+]))
+
+comment_pattern = re.compile(r'/\*|\*/')
+
+string_patterns = {
+  u'"': re.compile(r'((?:[^"\\]|\\.)*)"', re.S),
+  u"'": re.compile(r"((?:[^'\\]|\\.)*)'", re.S)
+}
 
-      print("warning: octals are written as 0o7, not 07")
+escape_pattern = re.compile(r'\\(x[0-9A-Fa-f]{0,2}|.)', re.S)
 
-    if char == '.':
-      raise NotImplementedError("floating point literals are not implemented")
+number_run_pattern = re.compile(r'[0-9A-Za-z_]*')
 
-    value = 0
+# scans the whole source string at once with a single alternation pattern,
+# producing the same tokens as Scanner
+class RegexScanner(object):
+  # upstream is the source string, or an iterable of characters. scanning can
+  # start partway through the source, from a position between two tokens
+  def __init__(self, upstream, symbols=None, index=0, line=1, line_start=0):
+    if isinstance(upstream, str):
+      self.source = upstream
+    else:
+      self.source = u''.join(upstream)
+    self.symbols = {} if symbols is None else symbols
+    # the position of the next character to be consumed
+    self.index = index
+    self.line = line
+    # the index of the first character on the current line
+    self.line_start = line_start
+    # the index of the first character of the last token
+    self.start = index
+    if stats.active is not None:
+      stats.instrument(self)
 
-    while True:
-      if char in u".eE":
-        raise NotImplementedError("floating point literals are not implemented")
+  def __iter__(self):
+    return self
 
-      if char not in ordinalset:
-        if char in idstartset:
-          self.error("identifiers may not begin with digits")
-        break
+  def __next__(self):
+    token = self.scan()
+    if token is None: raise StopIteration
+    return token
 
-      value = value * 10 + (ord(char) - 0x30)
-      if value > 0xffffffffffffffff:
-        self.error("decimal literal too large")
+  @property
+  def offset(self):
+    return self.index - self.line_start + 1
 
-      char = reader.pop()
+  def scan(self):
+    source = self.source
+    match = master_pattern.match
 
-      if char is None:
+    while True:
+      start = self.index
+      found = match(source, start)
+      if found is None:
+        if start >= len(source): return None
+        self.error("unexpected character '%c'" % source[start])
+
+      group = found.lastindex
+      end = found.end()
+      self.index = end
+
+      if group == M_SPACE:
+        self.newlines(start, end)
+      elif group == M_LINE_COMMENT:
+        # the newline itself is picked up as whitespace
+        continue
+      elif group == M_COMMENT:
+        self.consume_comment()
+      else:
         break
 
-    reader.push(char)
-    return integer_token(value)
+    self.start = start
+    offset = start - self.line_start + 1
 
-  def expect_hex_digit(self):
-    char = self.reader.pop()
+    if group == M_WORD:
+      word = found.group(M_WORD)
+      return word_token(self.line, offset, self.symbols.setdefault(word, word))
 
-    if char is None:
-      self.error("unexpected EOF, expected hex digit")
+    if group == M_PUNCTUATION:
+      return tokens.Token(self.line, offset,
+        tokens.punctuation[found.group(M_PUNCTUATION)])
 
-    c = ord(char)
+    if group == M_STRING:
+      return self.scan_string(source[start], offset)
 
-    if c >= 0x30 and c <= 0x39: return c - 0x30
-    c |= 0x20
-    if c >= 0x61 and c <= 0x66: return c - 0x57
+    self.index = start
+    return self.scan_number(offset)
 
-    self.error("unexpected character, expected hex digit")
+  # internal api
+  def newlines(self, start, end):
+    count = self.source.count(u'\n', start, end)
+    if count:
+      self.line += count
+      self.line_start = self.source.rindex(u'\n', start, end) + 1
 
   def consume_comment(self):
-    reader = self.reader
+    search = comment_pattern.search
+    source = self.source
     depth = 1
-    while True:
-      char = reader.pop()
-
-      if char is None:
+    while depth:
+      found = search(source, self.index)
+      if found is None:
+        self.newlines(self.index, len(source))
+        self.index = len(source)
         self.error("unexpected EOF, expected '*/'")
+      self.newlines(self.index, found.start())
+      self.index = found.end()
+      depth += 1 if found.group() == u'/*' else -1
 
-      # don't need to check for None because we'll just catch it in the next
-      # iteration
-      if char == u'*':
-        if reader.pop() == u'/':
-          depth -= 1
-          if depth == 0: break
-      elif char == u'/':
-        if reader.pop() == u'*': depth += 1
-
-  def token(self, token_type, offset = None):
-    if offset is None: offset = self.reader.offset
-    return tokens.Token(self.reader.line, offset, token_type)
+  def scan_string(self, match, offset):
+    start = self.index
+    found = string_patterns[match].match(self.source, start)
+    if found is None:
+      self.newlines(start, len(self.source))
+      self.index = len(self.source)
+      self.error("unexpected EOF, expected character")
+    self.newlines(start, found.end())
+    self.index = found.end()
+    string = escape_pattern.sub(self.unescape, found.group(1))
+    return tokens.StrToken(self.line, offset,
+      self.symbols.setdefault(string, string))
+
+  def unescape(self, found):
+    escape = found.group(1)
+    if escape in escapemap:
+      return escapemap[escape]
+    if escape == u'u':
+      raise NotImplementedError("unicode not implemented")
+    if escape == u'\n':
+      self.error("expected escape sequence, found newline")
+    if escape[0] == u'x':
+      if len(escape) < 3:
+        self.error("unexpected character, expected hex digit")
+      return chr(int(escape[1:], 16))
+    self.error("unexpected character '%c', expected escape sequence" %
+      escape)
+
+  def scan_number(self, offset):
+    source = self.source
+    start = self.index
+    end = number_run_pattern.match(source, start).end()
+    if source[end:end + 1] == u'.' and source[end + 1:end + 2] in ordinalset \
+      and (end == start or source[start:end].isdigit()):
+      end = number_run_pattern.match(source, end + 1).end()
+    if source[end:end + 1] in (u'+', u'-') and end > start and \
+      exponent_pattern.fullmatch(source, start, end):
+      end = number_run_pattern.match(source, end + 1).end()
+    self.index = end
+    return number_token(self.line, offset, source[start:end], self.error)
 
   def error(self, message):
-    raise ParseError(self.reader.line, self.reader.offset, message)
+    raise ParseError(self.line, self.offset, message)
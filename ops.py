@@ -237,3 +237,29 @@ precedences = {
   tokens.L_DIV: OperatorPrecedence(12),
   tokens.L_MOD: OperatorPrecedence(12)
 }
+
+# the same table as binding powers for parse.PrattParser, in flat lists indexed
+# by token type. a token continues an expression while its left binding power
+# is above the right binding power of the operator being parsed, so 0 never
+# does. right associative operators parse their right side one lower than they
+# bind, which lets an equal operator through
+left_binding = [0] * 256
+right_binding = [0] * 256
+
+def _binding(precedence):
+  return precedence * 2 + 2
+
+for token_type, entry in precedences.items():
+  left_binding[token_type] = _binding(entry.precedence)
+  right_binding[token_type] = _binding(entry.precedence) - entry.right_assoc
+
+# operands of prefix operators, above every binary operator
+prefix_binding = _binding(max(entry.precedence
+  for entry in precedences.values()) + 1)
+
+# ., (), [] and postfix ++, -- bind tighter than prefix operators
+for token_type in (tokens.L_DOT, tokens.L_OPEN_PAREN, tokens.L_OPEN_BRACKET,
+  tokens.L_INCREMENT, tokens.L_DECREMENT):
+  left_binding[token_type] = prefix_binding + 2
+
+del token_type, entry
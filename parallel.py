@@ -0,0 +1,217 @@
+import bisect, os, re
+from concurrent.futures import ProcessPoolExecutor
+
+import pycub.astcache as astcache
+import pycub.tokens as tokens
+from pycub.lex import RegexScanner, comment_pattern, string_patterns
+from pycub.parse import ParseError, Parser, link_block
+from pycub.tokenbuffer import TokenBuffer
+
+# everything at the top level that can hide a newline from the lexer
+boundary_pattern = re.compile(r'//[^\n]*|/\*|["\']')
+
+# the indices just past the newlines where source can be cut into pieces that
+# lex independently, roughly chunk_size characters apart. a newline only
+# qualifies outside string literals and (nested) block comments, and nothing
+# is cut after an unterminated string or comment
+def split_points(source, chunk_size):
+  points = []
+  target = chunk_size
+  search = boundary_pattern.search
+  length = len(source)
+  index = 0
+  while target < length:
+    found = search(source, index)
+    stop = found.start() if found else length
+    # the stretch up to the next string or comment is plain code
+    if stop >= target:
+      newline = source.find(u'\n', max(index, target - 1), stop)
+      if newline != -1:
+        index = newline + 1
+        points.append(index)
+        target = index + chunk_size
+        continue
+    if found is None: break
+
+    text = found.group()
+    index = found.end()
+    if text == u'/*':
+      depth = 1
+      while depth:
+        found = comment_pattern.search(source, index)
+        if found is None: return points
+        depth += 1 if found.group() == u'/*' else -1
+        index = found.end()
+    elif text in string_patterns:
+      found = string_patterns[text].match(source, index)
+      if found is None: return points
+      index = found.end()
+  return points
+
+# lexes one piece in a worker, the piece starts at the beginning of line
+def _lex_piece(piece):
+  source, line = piece
+  return TokenBuffer(RegexScanner(source, line=line))
+
+# lexes source in pieces across a process pool and stitches the token streams
+# back into one TokenBuffer, equal to lexing it in one go. identifiers and
+# strings are interned again across the pieces. by default every worker gets
+# one piece
+def lex_parallel(source, chunk_size=None, workers=None, executor=None,
+  symbols=None):
+  workers = workers or os.cpu_count() or 1
+  if chunk_size is None:
+    chunk_size = max(len(source) // workers + 1, 1 << 16)
+  points = split_points(source, chunk_size)
+  starts = [0] + points
+  ends = points + [len(source)]
+  pieces = []
+  line = 1
+  for start, end in zip(starts, ends):
+    pieces.append((source[start:end], line))
+    line += source.count(u'\n', start, end)
+
+  if len(pieces) == 1:
+    results = [_lex_piece(pieces[0])]
+  elif executor is not None:
+    results = executor.map(_lex_piece, pieces)
+  else:
+    with ProcessPoolExecutor(workers) as pool:
+      results = list(pool.map(_lex_piece, pieces))
+
+  return stitch(results, symbols)
+
+def stitch(buffers, symbols=None):
+  if symbols is None: symbols = {}
+  intern = symbols.setdefault
+  result = TokenBuffer()
+  values = result.values
+  for buffer in buffers:
+    base = len(result)
+    for index, value in buffer.values.items():
+      if isinstance(value, str):
+        value = intern(value, value)
+      elif isinstance(value, tuple) and isinstance(value[1], str):
+        value = (value[0], intern(value[1], value[1]))
+      values[base + index] = value
+    result.types.extend(buffer.types)
+    result.lines.extend(buffer.lines)
+    result.offsets.extend(buffer.offsets)
+  return result
+
+################################################################################
+## parsing
+################################################################################
+
+opening = (tokens.L_OPEN_PAREN, tokens.L_OPEN_BRACKET, tokens.L_OPEN_BRACE)
+closing = (tokens.L_CLOSE_PAREN, tokens.L_CLOSE_BRACKET, tokens.L_CLOSE_BRACE)
+
+# the only token types the pre-scan has to look at, found by the regex engine
+# in the raw type array
+statement_pattern = re.compile(b'[' + re.escape(bytes(opening + closing +
+  (tokens.L_SEMICOLON,))) + b']')
+
+# statements that go on after a ; or }, as in if-else and do-while
+continuations = (tokens.L_ELSE, tokens.L_WHILE)
+
+# the token indices where a buffer can be cut into pieces that parse
+# independently, roughly chunk_size tokens apart. a piece only starts after a
+# ; or } outside any brackets, and not before an else or a while that could
+# belong to the statement just ended. strings and comments are single tokens
+# by now, so they need no special care. nothing is cut after a stray closing
+# bracket, the parser reports it
+def statement_points(buffer, chunk_size):
+  points = []
+  types = buffer.types.tobytes()
+  values = buffer.values
+  length = len(types)
+  target = chunk_size
+  depth = 0
+  for found in statement_pattern.finditer(types):
+    token_type = types[found.start()]
+    if token_type in opening:
+      depth += 1
+      continue
+    if token_type in closing:
+      depth -= 1
+      if depth < 0: break
+      if token_type != tokens.L_CLOSE_BRACE: continue
+    if depth: continue
+
+    index = found.end()
+    if index < target or index >= length: continue
+    if types[index] == tokens.L_IDENTIFIER and \
+      tokens.keywordmap.get(values[index]) in continuations:
+      continue
+    points.append(index)
+    target = index + chunk_size
+  return points
+
+# the tokens from start up to end as a buffer of their own. keys is values'
+# keys in order, shared between pieces
+def _piece(buffer, keys, start, end):
+  piece = TokenBuffer()
+  piece.types = buffer.types[start:end]
+  piece.lines = buffer.lines[start:end]
+  piece.offsets = buffer.offsets[start:end]
+  values = buffer.values
+  first = bisect.bisect_left(keys, start)
+  last = bisect.bisect_left(keys, end, first)
+  piece.values = dict((key - start, values[key]) for key in keys[first:last])
+  return piece
+
+# parses one piece in a worker. trees come back in the astcache format, which
+# loads faster than a pickle and doesn't recurse down long statement chains
+def _parse_piece(piece):
+  buffer, parser_class, fingerprint = piece
+  statements = list(parser_class(buffer).iter_statements())
+  try:
+    return astcache.dump(link_block(statements), fingerprint)
+  except TypeError:
+    return statements
+
+def _piece_statements(result, fingerprint):
+  if isinstance(result, list):
+    return result
+  block = astcache.load(result, fingerprint)
+  statements = []
+  node = block.body
+  while node is not None:
+    statements.append(node)
+    node = getattr(node, 'next', None)
+  return statements
+
+# parses source, or a TokenBuffer of it, in pieces across a process pool and
+# links the top-level statements back into one block, equal to parsing it in
+# one go. chunk_size is in tokens, and by default every worker gets one piece.
+# source is lexed with lex_parallel on the same executor
+def parse_parallel(source, chunk_size=None, workers=None, executor=None,
+  parser=Parser):
+  workers = workers or os.cpu_count() or 1
+  if isinstance(source, TokenBuffer):
+    buffer = source
+  else:
+    buffer = lex_parallel(source, workers=workers, executor=executor)
+  if chunk_size is None:
+    chunk_size = max(len(buffer) // workers + 1, 1 << 14)
+  points = statement_points(buffer, chunk_size)
+  if not points:
+    return parser(buffer).parse()
+
+  keys = sorted(buffer.values)
+  fingerprint = astcache.fingerprint()
+  pieces = [(_piece(buffer, keys, start, end), parser, fingerprint)
+    for start, end in zip([0] + points, points + [len(buffer)])]
+
+  try:
+    if executor is not None:
+      results = executor.map(_parse_piece, pieces)
+    else:
+      with ProcessPoolExecutor(workers) as pool:
+        results = list(pool.map(_parse_piece, pieces))
+    return link_block(statement for result in results
+      for statement in _piece_statements(result, fingerprint))
+  except ParseError:
+    # a piece can fail differently from the whole, say a do cut off from its
+    # while, so the error reported is the one a serial parse raises
+    return parser(buffer).parse()
@@ -3,7 +3,9 @@ import pycub.statement as statement
 import pycub.disambiguate as disambiguate
 import pycub.ops as operator
 import pycub.expression as expression
-from pycub.reader import Reader
+import pycub.types as types
+from pycub.reader import CursorReader, WindowedReader
+from pycub.tokenbuffer import TokenBuffer
 
 # not sure how pythonic this is
 token_map = {
@@ -35,6 +37,12 @@ expected_fail_map = {
   # 'parse_for': 'for loop'
 }
 
+# the keywords of the statements parsed so far. the rest stay identifiers, so
+# they fail to parse as expressions instead of reaching an unfinished parse_
+# method
+statement_keywords = dict((word, tokens.keywordmap[word])
+  for word in (u"if", u"else", u"while", u"do"))
+
 class ParseError(RuntimeError):
   def __init__(self, line, offset, message):
     self.line = line
@@ -55,6 +63,29 @@ def expected_error(reader, token, expected):
   parse_error(token, "expected '%s', found '%s'" %
     (expected, tokens.token_string(token)))
 
+# binary operators stay as written until desugaring
+def new_binary_node(token_type, left, right):
+  return expression.OperatorNode(token_type, left, right)
+
+def new_if_statement(condition, first, second):
+  branch = statement.IfStatement(condition, None, None)
+  branch.first = set_block_parent(first, branch)
+  branch.second = set_block_parent(second, branch)
+  return branch
+
+# a block of the given statements, in order
+def link_block(statements):
+  result = statement.BlockStatement(None)
+  tail = None
+
+  for next in statements:
+    if result.body is None: result.body = next
+    else: tail.next = next
+    next.parent = result
+    tail = next
+
+  return result
+
 def set_block_parent(child, parent):
   if child is None: return None
   else: child_block = child.wrap_block()
@@ -64,22 +95,56 @@ def set_block_parent(child, parent):
 
 class Parser:
   # public api
-  def __init__(self, scanner):
+  # scanner is a token iterator such as lex.Scanner, or a prebuilt
+  # tokenbuffer.TokenBuffer. window bounds how many tokens are held at once,
+  # for streams too large to keep around
+  def __init__(self, scanner, window=None):
     self.scanner = scanner
-    self.reader = Reader(scanner, matches='token_type', fail=self._fail)
+    if isinstance(scanner, TokenBuffer):
+      self.reader = scanner.cursor(self._fail)
+      # errors at EOF are reported at the last token
+      self.position = self.reader
+    else:
+      if window is not None:
+        self.reader = WindowedReader(scanner, window, matches='token_type',
+          fail=self._fail)
+      else:
+        self.reader = CursorReader(scanner, matches='token_type',
+          fail=self._fail)
+      self.position = getattr(scanner, 'reader', scanner)
+    # disambiguation results by token position, see
+    # disambiguate.disambiguate_expression_inner. None turns it off
+    self.memo = {}
+    if hasattr(self.reader, 'peek_type'):
+      self.peek_type = self.reader.peek_type
+
+  def peek_type(self):
+    token = self.reader.peek()
+    return None if token is None else token.token_type
 
   def parse(self):
-    return self.parse_block(None)
+    return link_block(self.iter_statements())
+
+  # yields each top-level statement as soon as it's parsed, without linking it
+  # to the others, so callers can work through a file a statement at a time
+  def iter_statements(self, end_token=None):
+    # self.accept to handle None
+    while not self.accept(end_token):
+      next = self.expect_statement()
+
+      # noop (;) statement, start again from the top
+      if next is not None:
+        yield next
 
   # internal api
   def _fail(self, expected):
     token = self.reader.peek()
     if isinstance(expected, int):
-      expected_error(self.scanner.reader, token, tokens.token_string(expected))
+      expected_error(self.position, token, tokens.token_string(expected))
     elif hasattr(expected, '__call__') and hasattr(expected, '__name__'):
-      expected_error(self.scanner.reader, token, expected_fail_map[expected.__name__])
+      expected_error(self.position, token, expected_fail_map[expected.__name__])
     else:
-      expected_error(self.scanner.reader, token, "something")
+      expected_error(self.position, token, "something")
 
   def accept(self, token):
     if token is None:
@@ -89,19 +154,44 @@ class Parser:
   def lookahead(self):
     return self.reader.lookahead()
 
+  # keywords are scanned as identifiers, see lex.word_token, and only mean
+  # something where a statement can start
+  def statement_type(self, token):
+    token_type = token.token_type
+    if token_type == tokens.L_IDENTIFIER:
+      return statement_keywords.get(token.value, token_type)
+    return token_type
+
+  def accept_keyword(self, keyword):
+    token = self.reader.peek()
+    if token is None or self.statement_type(token) != keyword:
+      return None
+    return self.reader.pop()
+
+  def expect_keyword(self, keyword):
+    token = self.accept_keyword(keyword)
+    if token is None:
+      expected_error(self.position, self.reader.peek(),
+        tokens.token_string(keyword))
+    return token
+
   # branching point when we expect a statement
   def expect_statement(self):
     reader = self.reader
     token = reader.pop()
 
     if token is None:
-      expected_error(self.scanner.reader, None, "statement")
+      expected_error(self.position, None, "statement")
 
-    token_type = token.token_type
+    token_type = self.statement_type(token)
 
     if token_type == tokens.L_SEMICOLON:
       return None
 
+    if token_type == tokens.L_IDENTIFIER and \
+      tokens.keywordmap.get(token.value) in token_map:
+      parse_error(token, "%s statements aren't supported" % token.value)
+
     if token_type in token_map:
       method = token_map[token_type]
       if hasattr(self, method):
@@ -174,23 +264,7 @@ class Parser:
 
   # default exists for token_map calls
   def parse_block(self, end_token=tokens.L_CLOSE_BRACE):
-    result = statement.BlockStatement(None)
-    tail = None
-
-
-    # self.accept to handle None
-    while not self.accept(end_token):
-      next = self.expect_statement()
-
-      # noop (;) statement, start again from the top
-      if next is None: continue
-
-      if result.body is None: result.body = next
-      else: tail.next = next
-      next.parent = result
-      tail = next
-
-    return result
+    return link_block(self.iter_statements(end_token))
 
   def parse_return(self):
     reader = self.reader
@@ -204,16 +278,12 @@ class Parser:
     reader.expect(tokens.L_CLOSE_PAREN)
 
     first = self.expect_statement()
-    if reader.accept(tokens.L_ELSE) is None:
+    if self.accept_keyword(tokens.L_ELSE) is None:
       second = None
     else:
       second = self.expect_statement()
-    branch = statement.IfStatement(condition, None, None)
-
-    branch.first = set_block_parent(first, branch)
-    branch.second = set_block_parent(second, branch)
 
-    return branch
+    return new_if_statement(condition, first, second)
 
   def parse_loop(self, type, body, condition):
     body_block = None if body is None else body.wrap_block()
@@ -241,7 +311,8 @@ class Parser:
     reader = self.reader
     body = self.expect_statement()
 
-    reader.expect(tokens.L_WHILE, tokens.L_OPEN_PAREN)
+    self.expect_keyword(tokens.L_WHILE)
+    reader.expect(tokens.L_OPEN_PAREN)
     condition = self.parse_expression()
     reader.expect(tokens.L_CLOSE_PAREN, tokens.L_SEMICOLON)
 
@@ -331,8 +402,9 @@ class Parser:
     if reader.accept(tokens.L_IDENTIFIER, tokens.L_COLON) is not None:
       next = reader.peek()
 
-      if next.token_type not in {tokens.L_DO, tokens.L_WHILE, tokens.L_FOR}:
-        parse_error(next, "expected loop after label")
+      if next is None or self.statement_type(next) not in \
+        {tokens.L_DO, tokens.L_WHILE, tokens.L_FOR}:
+        expected_error(self.position, next, "loop after label")
 
       loop = self.expect_statement()
 
@@ -344,6 +416,8 @@ class Parser:
 
       return loop
 
+    # nothing before this statement will be looked at again
+    if self.memo: self.memo.clear()
     structure = disambiguate.disambiguate_statement(self)
 
     if structure == disambiguate.G_FUNCTION:
@@ -354,7 +428,7 @@ class Parser:
     elif structure == disambiguate.G_EXPRESSION:
       result = statement.ExpressionStatement(self.parse_expression())
     else:
-      expected_error(self.scanner.reader, self.reader.peek(), "statement")
+      expected_error(self.position, self.reader.peek(), "statement")
 
     self.reader.expect(tokens.L_SEMICOLON)
     return result
@@ -370,8 +444,9 @@ class Parser:
     next = reader.peek()
 
     while next is not None:
+      # anything else ends the expression, like ; or )
       if next.token_type not in operator.precedences:
-        raise Exception("parser error: unknown operator")
+        break
       entry = operator.precedences[next.token_type]
       if entry.precedence < min_precedence:
         break
@@ -403,19 +478,20 @@ class Parser:
 
     prefix = reader.pop()
 
-    if prefix.token_type is None:
+    if prefix is None:
       raise Exception("unexpected EOF")
 
     if prefix.token_type in [tokens.L_INCREMENT, tokens.L_DECREMENT]:
-      return new_binary_node(operator.O_ADD_ASSIGN
+      return new_binary_node(tokens.L_ADD_ASSIGN
         if prefix.token_type == tokens.L_INCREMENT
-        else operation.O_SUB_ASSIGN, self.parse_unary_expression(), expression.IntNode(1))
+        else tokens.L_SUB_ASSIGN, self.parse_unary_expression(),
+        expression.LiteralNode(types.T_U8, 1))
 
     if prefix.token_type == tokens.L_SUB:
       return expression.NegateNode(self.parse_unary_expression())
 
     if prefix.token_type in [tokens.L_NOT, tokens.L_BITWISE_NOT]:
-      return expression.NotNode(prefix.token_type != L_NOT, self.parse_unary_expression())
+      return expression.NotNode(prefix.token_type != tokens.L_NOT, self.parse_unary_expression())
 
     # no identifier-style tokens
     # if prefix.token_type == tokens.L_NEW:
@@ -433,8 +509,9 @@ class Parser:
     while True:
       suffix = reader.pop()
 
-      if suffix.token_type is None:
-        raise Expression("unexpected EOF")
+      # the caller decides whether EOF is allowed here
+      if suffix is None:
+        return left
 
       if suffix.token_type == tokens.L_DOT:
         left = expression.GetFieldNode(left, reader.expect(tokens.L_IDENTIFIER))
@@ -445,9 +522,9 @@ class Parser:
         reader.expect(tokens.L_CLOSE_BRACKET)
         left = expression.GetIndexNode(left, right)
       elif suffix.token_type == tokens.L_INCREMENT:
-        left = PostfixNode(operator.O_INCREMENT, left)
+        left = expression.PostfixNode(tokens.L_INCREMENT, left)
       elif suffix.token_type == tokens.L_DECREMENT:
-        left = PostfixNode(operator.O_DECREMENT, left)
+        left = expression.PostfixNode(tokens.L_DECREMENT, left)
       else:
         reader.push(suffix)
         return left
@@ -498,3 +575,305 @@ class Parser:
 
     return expressions
 
+
+# precedence climbing above recurses once per operator and level, looking each
+# token up in operator.precedences. this parses the same trees in a single loop
+# over flat tables indexed by token type: the binding powers in ops, and the
+# prefix_table and infix_table handlers below
+class PrattParser(Parser):
+  def parse_expression(self):
+    return self.parse_binding(0)
+
+  # parses an expression made of operators binding above min_binding
+  def parse_binding(self, min_binding):
+    reader = self.reader
+    peek_type = self.peek_type
+    left_binding = operator.left_binding
+
+    token_type = peek_type()
+    prefix = None if token_type is None else prefix_table[token_type]
+    if prefix is None:
+      # identifiers and functions go through disambiguation
+      left = self.parse_primary_expression()
+    else:
+      left = prefix(self, reader.pop())
+
+    while True:
+      token_type = peek_type()
+      if token_type is None or left_binding[token_type] <= min_binding:
+        return left
+      left = infix_table[token_type](self, left, reader.pop())
+
+  # prefix handlers take the token they start with
+  def parse_prefix_step(self, token):
+    return new_binary_node(tokens.L_ADD_ASSIGN
+      if token.token_type == tokens.L_INCREMENT else tokens.L_SUB_ASSIGN,
+      self.parse_binding(operator.prefix_binding),
+      expression.LiteralNode(types.T_U8, 1))
+
+  def parse_prefix_negate(self, token):
+    return expression.NegateNode(self.parse_binding(operator.prefix_binding))
+
+  def parse_prefix_not(self, token):
+    return expression.NotNode(token.token_type != tokens.L_NOT,
+      self.parse_binding(operator.prefix_binding))
+
+  def parse_prefix_group(self, token):
+    result = self.parse_binding(0)
+    self.reader.expect(tokens.L_CLOSE_PAREN)
+    return result
+
+  def parse_prefix_literal(self, token):
+    return token.to_expression()
+
+  # infix handlers take the expression so far and the operator token
+  def parse_infix_binary(self, left, token):
+    token_type = token.token_type
+    return new_binary_node(token_type, left,
+      self.parse_binding(operator.right_binding[token_type]))
+
+  def parse_infix_field(self, left, token):
+    return expression.GetFieldNode(left,
+      self.reader.expect(tokens.L_IDENTIFIER))
+
+  def parse_infix_call(self, left, token):
+    return expression.CallNode(left, self.parse_expression_list())
+
+  def parse_infix_index(self, left, token):
+    index = self.parse_binding(0)
+    self.reader.expect(tokens.L_CLOSE_BRACKET)
+    return expression.GetIndexNode(left, index)
+
+  def parse_infix_postfix(self, left, token):
+    return expression.PostfixNode(token.token_type, left)
+
+prefix_map = {
+  tokens.L_INCREMENT: PrattParser.parse_prefix_step,
+  tokens.L_DECREMENT: PrattParser.parse_prefix_step,
+  tokens.L_SUB: PrattParser.parse_prefix_negate,
+  tokens.L_NOT: PrattParser.parse_prefix_not,
+  tokens.L_BITWISE_NOT: PrattParser.parse_prefix_not,
+  tokens.L_OPEN_PAREN: PrattParser.parse_prefix_group,
+  tokens.L_LITERAL: PrattParser.parse_prefix_literal
+}
+
+infix_map = dict.fromkeys(operator.precedences, PrattParser.parse_infix_binary)
+infix_map.update({
+  tokens.L_DOT: PrattParser.parse_infix_field,
+  tokens.L_OPEN_PAREN: PrattParser.parse_infix_call,
+  tokens.L_OPEN_BRACKET: PrattParser.parse_infix_index,
+  tokens.L_INCREMENT: PrattParser.parse_infix_postfix,
+  tokens.L_DECREMENT: PrattParser.parse_infix_postfix
+})
+
+prefix_table = [None] * len(operator.left_binding)
+for token_type, handler in prefix_map.items():
+  prefix_table[token_type] = handler
+
+infix_table = [None] * len(operator.left_binding)
+for token_type, handler in infix_map.items():
+  infix_table[token_type] = handler
+
+# frames on StackParser's stacks. expression frames are (kind, data,
+# min_binding) and wait on an operand, statement frames wait on a statement
+F_PREFIX = 0 # data is the operator token
+F_GROUP = 1
+F_BINARY = 2 # (operator type, left)
+F_CALL = 3 # (callee, arguments so far)
+F_INDEX = 4 # the indexed expression
+F_BLOCK = 5 # [F_BLOCK, block, tail, end token]
+F_IF = 6 # [F_IF, condition]
+F_ELSE = 7 # [F_ELSE, condition, first]
+F_WHILE = 8 # [F_WHILE, condition]
+F_DO = 9 # [F_DO]
+
+# returned by StackParser when a frame was pushed and waits on a statement
+PENDING = object()
+
+prefix_operators = frozenset((tokens.L_INCREMENT, tokens.L_DECREMENT,
+  tokens.L_SUB, tokens.L_NOT, tokens.L_BITWISE_NOT))
+
+# builds the same trees as PrattParser without recursing per level of nesting,
+# keeping pending operators and statements on explicit stacks instead, so
+# generated code with thousands of nested parentheses, prefix operators, blocks
+# or ifs parses in bounded Python stack. nested call arguments are still
+# recursed into by disambiguation
+class StackParser(PrattParser):
+  def parse_binding(self, min_binding):
+    reader = self.reader
+    peek_type = self.peek_type
+    left_binding = operator.left_binding
+    stack = []
+
+    while True:
+      # prefix operators and grouping, each waiting on what follows it
+      token_type = peek_type()
+      while True:
+        if token_type in prefix_operators:
+          stack.append((F_PREFIX, reader.pop(), min_binding))
+          min_binding = operator.prefix_binding
+        elif token_type == tokens.L_OPEN_PAREN:
+          reader.pop()
+          stack.append((F_GROUP, None, min_binding))
+          min_binding = 0
+        else:
+          break
+        token_type = peek_type()
+
+      if token_type == tokens.L_LITERAL:
+        left = reader.pop().to_expression()
+      else:
+        # identifiers and functions go through disambiguation
+        left = self.parse_primary_expression()
+
+      while True:
+        token_type = peek_type()
+        if token_type is not None and left_binding[token_type] > min_binding:
+          reader.pop()
+          if token_type == tokens.L_DOT:
+            left = expression.GetFieldNode(left,
+              reader.expect(tokens.L_IDENTIFIER))
+            continue
+          if token_type == tokens.L_INCREMENT or \
+            token_type == tokens.L_DECREMENT:
+            left = expression.PostfixNode(token_type, left)
+            continue
+          if token_type == tokens.L_OPEN_PAREN:
+            if reader.accept(tokens.L_CLOSE_PAREN) is not None:
+              left = expression.CallNode(left, [])
+              continue
+            stack.append((F_CALL, (left, []), min_binding))
+            min_binding = 0
+          elif token_type == tokens.L_OPEN_BRACKET:
+            stack.append((F_INDEX, left, min_binding))
+            min_binding = 0
+          else:
+            stack.append((F_BINARY, (token_type, left), min_binding))
+            min_binding = operator.right_binding[token_type]
+          # on to the operand
+          break
+
+        # nothing else binds to left, so it completes the innermost frame
+        if not stack:
+          return left
+        kind, data, min_binding = stack.pop()
+
+        if kind == F_BINARY:
+          left = new_binary_node(data[0], data[1], left)
+        elif kind == F_PREFIX:
+          prefix_type = data.token_type
+          if prefix_type == tokens.L_SUB:
+            left = expression.NegateNode(left)
+          elif prefix_type == tokens.L_NOT or \
+            prefix_type == tokens.L_BITWISE_NOT:
+            left = expression.NotNode(prefix_type != tokens.L_NOT, left)
+          else:
+            left = new_binary_node(tokens.L_ADD_ASSIGN
+              if prefix_type == tokens.L_INCREMENT else tokens.L_SUB_ASSIGN,
+              left, expression.LiteralNode(types.T_U8, 1))
+        elif kind == F_GROUP:
+          reader.expect(tokens.L_CLOSE_PAREN)
+        elif kind == F_INDEX:
+          reader.expect(tokens.L_CLOSE_BRACKET)
+          left = expression.GetIndexNode(data, left)
+        else:
+          callee, args = data
+          args.append(left)
+          if reader.accept(tokens.L_COMMA) is not None:
+            stack.append((F_CALL, data, min_binding))
+            min_binding = 0
+            break
+          reader.expect(tokens.L_CLOSE_PAREN)
+          left = expression.CallNode(callee, args)
+
+  def expect_statement(self):
+    stack = []
+    return self.run_statements(stack, self.start_statement(stack))
+
+  def parse_block(self, end_token=tokens.L_CLOSE_BRACE):
+    stack = []
+    return self.run_statements(stack, self.start_block(stack, end_token))
+
+  # hands each finished statement to the frame waiting on it, starting another
+  # whenever a frame wants one
+  def run_statements(self, stack, result):
+    while True:
+      while result is PENDING:
+        result = self.start_statement(stack)
+      if not stack:
+        return result
+      result = self.finish_statement(stack, result)
+
+  # returns the statement, or PENDING after pushing a frame for one that nests
+  def start_statement(self, stack):
+    reader = self.reader
+    token = reader.pop()
+
+    if token is None:
+      expected_error(self.position, None, "statement")
+
+    token_type = self.statement_type(token)
+
+    if token_type == tokens.L_OPEN_BRACE:
+      return self.start_block(stack, tokens.L_CLOSE_BRACE)
+
+    if token_type == tokens.L_IF or token_type == tokens.L_WHILE:
+      reader.expect(tokens.L_OPEN_PAREN)
+      condition = self.parse_expression()
+      reader.expect(tokens.L_CLOSE_PAREN)
+      stack.append([F_IF if token_type == tokens.L_IF else F_WHILE, condition])
+      return PENDING
+
+    if token_type == tokens.L_DO:
+      stack.append([F_DO])
+      return PENDING
+
+    # the rest don't nest statements
+    reader.push(token)
+    return PrattParser.expect_statement(self)
+
+  def start_block(self, stack, end_token):
+    block = statement.BlockStatement(None)
+    if self.accept(end_token):
+      return block
+    stack.append([F_BLOCK, block, None, end_token])
+    return PENDING
+
+  # gives child to the innermost frame, returning the statement that completes
+  # or PENDING if the frame wants another
+  def finish_statement(self, stack, child):
+    frame = stack[-1]
+    kind = frame[0]
+
+    if kind == F_BLOCK:
+      block = frame[1]
+      if child is not None:
+        if block.body is None: block.body = child
+        else: frame[2].next = child
+        child.parent = block
+        frame[2] = child
+      if not self.accept(frame[3]):
+        return PENDING
+      stack.pop()
+      return block
+
+    stack.pop()
+
+    if kind == F_IF:
+      if self.accept_keyword(tokens.L_ELSE) is not None:
+        stack.append([F_ELSE, frame[1], child])
+        return PENDING
+      return new_if_statement(frame[1], child, None)
+
+    if kind == F_ELSE:
+      return new_if_statement(frame[1], frame[2], child)
+
+    if kind == F_WHILE:
+      return self.parse_loop(tokens.L_WHILE, child, frame[1])
+
+    reader = self.reader
+    self.expect_keyword(tokens.L_WHILE)
+    reader.expect(tokens.L_OPEN_PAREN)
+    condition = self.parse_expression()
+    reader.expect(tokens.L_CLOSE_PAREN, tokens.L_SEMICOLON)
+    return self.parse_loop(tokens.L_DO, child, condition)
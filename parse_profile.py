@@ -0,0 +1,195 @@
+import inspect, sys, time
+
+import pycub.disambiguate as disambiguate
+import pycub.parse as parse
+from pycub.reader import CursorReader, WindowedReader
+from pycub.tokenbuffer import TokenCursor
+
+# the profile running right now, if any
+active = None
+
+# time, call count and tokens per parser production, and where in the source
+# the time went. productions are swapped for timing wrappers only while the
+# profile runs, so the parser pays nothing for this otherwise
+#
+#   with parse_profile.Profile() as profile:
+#     Parser(Scanner(file_iter(filename))).parse()
+#   profile.report(sys.stdout, sort='own')
+#   with open('parse.folded', 'w') as f:
+#     profile.collapsed(f)
+#
+# start() and stop() do the same for code that can't use a with block
+class Profile(object):
+  def __init__(self):
+    # name: [calls, cumulative seconds, own seconds, tokens]. a recursive call
+    # adds to cumulative seconds and tokens only through the outermost one
+    self.productions = {}
+    # (name, first line, last line): [calls, seconds]
+    self.lines = {}
+    # tuple of names, outermost first: own seconds
+    self.stacks = {}
+    self.stack = []
+    self.last_line = None
+    self.saved = []
+
+  def __enter__(self):
+    self.start()
+    return self
+
+  def __exit__(self, *exc_info):
+    self.stop()
+    return False
+
+  def start(self):
+    global active
+    if active is not None:
+      raise RuntimeError("a parse profile is already running")
+    active = self
+
+    wrappers = {}
+    def wrap(function):
+      if function not in wrappers:
+        wrappers[function] = self._wrap(function.__qualname__, function)
+      return wrappers[function]
+
+    for cls in (parse.Parser, parse.PrattParser, parse.StackParser):
+      for name, function in list(vars(cls).items()):
+        if _production(name) and inspect.isfunction(function) and \
+          not inspect.isgeneratorfunction(function):
+          self._patch(cls, name, wrap(function))
+    for name, function in list(vars(disambiguate).items()):
+      if name.startswith('disambiguate_') and inspect.isfunction(function):
+        self._patch(disambiguate, name, wrap(function))
+    # the Pratt handler tables hold the functions themselves
+    for table in (parse.prefix_table, parse.infix_table):
+      for index, function in enumerate(table):
+        if function is not None:
+          self._patch(table, index, wrap(function))
+
+    for cls in (TokenCursor, CursorReader, WindowedReader):
+      self._patch(cls, '_pop', self._track_lines(vars(cls)['_pop']))
+
+  def stop(self):
+    global active
+    while self.saved:
+      owner, key, value = self.saved.pop()
+      if isinstance(owner, list): owner[key] = value
+      else: setattr(owner, key, value)
+    active = None
+
+  # rows of (name, calls, cumulative seconds, own seconds, tokens), sorted by
+  # one of those columns, largest first
+  def rows(self, sort='cumulative'):
+    columns = ('name', 'calls', 'cumulative', 'own', 'tokens')
+    if sort not in columns:
+      raise ValueError("can't sort by %s, only %s" % (sort, ', '.join(columns)))
+    rows = [(name,) + tuple(entry) for name, entry in self.productions.items()]
+    column = columns.index(sort)
+    rows.sort(key=lambda row: row[column], reverse=column > 0)
+    return rows
+
+  # the productions, then the line ranges that took longest
+  def report(self, output=None, sort='cumulative', limit=None, ranges=20):
+    output = output or sys.stdout
+    output.write("%-44s %10s %12s %12s %10s\n" %
+      ('production', 'calls', 'cumulative', 'own', 'tokens'))
+    for name, calls, cumulative, own, tokens in self.rows(sort)[:limit]:
+      output.write("%-44s %10d %12.6f %12.6f %10d\n" %
+        (name, calls, cumulative, own, tokens))
+
+    slowest = sorted(self.lines.items(), key=lambda item: -item[1][1])
+    if slowest[:ranges]:
+      output.write("slowest line ranges\n")
+    for (name, first, last), (calls, seconds) in slowest[:ranges]:
+      where = "%s" % first if first == last else "%s-%s" % (first, last)
+      output.write("  %-12s %-40s %8d %12.6f\n" % (where, name, calls, seconds))
+
+  # own time in microseconds by call stack, in the folded format that
+  # flamegraph.pl and speedscope read
+  def collapsed(self, output):
+    for path, seconds in sorted(self.stacks.items()):
+      weight = int(seconds * 1e6)
+      if weight:
+        output.write("%s %d\n" % (';'.join(path), weight))
+
+  # internal api
+  def _patch(self, owner, key, value):
+    if isinstance(owner, list):
+      self.saved.append((owner, key, owner[key]))
+      owner[key] = value
+    else:
+      self.saved.append((owner, key, vars(owner)[key]))
+      setattr(owner, key, value)
+
+  def _wrap(self, name, function):
+    profile = self
+    stack = self.stack
+
+    def profiled(*args, **kwargs):
+      reader = getattr(args[0], 'reader', args[0])
+      position = _position(reader)
+      token = reader.peek()
+      first = None if token is None else token.line
+      path = (stack[-1][0] if stack else ()) + (name,)
+      frame = [path, 0.0]
+      stack.append(frame)
+      start = time.perf_counter()
+      try:
+        return function(*args, **kwargs)
+      finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        profile._record(name, path, frame[1], elapsed,
+          _position(reader) - position, first)
+
+    profiled.__name__ = function.__name__
+    profiled.__qualname__ = function.__qualname__
+    profiled.__wrapped__ = function
+    return profiled
+
+  def _record(self, name, path, children, elapsed, tokens, first):
+    if self.stack:
+      self.stack[-1][1] += elapsed
+
+    entry = self.productions.get(name)
+    if entry is None:
+      entry = self.productions[name] = [0, 0.0, 0.0, 0]
+    entry[0] += 1
+    # recursive calls are already inside the outermost one's time and tokens
+    if name not in path[:-1]:
+      entry[1] += elapsed
+      entry[3] += tokens
+    entry[2] += elapsed - children
+
+    self.stacks[path] = self.stacks.get(path, 0.0) + elapsed - children
+
+    if first is not None:
+      last = self.last_line
+      key = (name, first, last if last is not None and last > first else first)
+      found = self.lines.get(key)
+      if found is None:
+        found = self.lines[key] = [0, 0.0]
+      found[0] += 1
+      found[1] += elapsed
+
+  # the line of the last token the parser consumed, for line ranges
+  def _track_lines(self, pop):
+    profile = self
+    def tracked(reader, raisestop=False):
+      item = pop(reader, raisestop)
+      if item is not None:
+        profile.last_line = item.line
+      return item
+    return tracked
+
+def _production(name):
+  return name.startswith('parse') or name.startswith('expect_') or \
+    name in ('start_statement', 'finish_statement', 'start_block',
+      'gen_define', 'gen_define_inner')
+
+# tokens consumed by a reader, or scanned by a lookahead
+def _position(reader):
+  tell = getattr(reader, 'tell', None)
+  if tell is not None:
+    return tell()
+  return getattr(reader, 'base', 0) + getattr(reader, 'index', 0)
@@ -1,4 +1,6 @@
-import collections, itertools
+import bisect, codecs, collections, itertools, re
+
+import pycub.stats as stats
 
 # assumes no access to reader while lookahead still in use
 class Lookahead(object):
@@ -74,6 +76,9 @@ class Reader(object):
     else:
       self.matches = matches
 
+    if stats.active is not None:
+      stats.instrument(self)
+
   def __iter__(self):
     return self
 
@@ -176,6 +181,279 @@ class Reader(object):
       self.push(value)
     self.fail(match)
 
+# a lookahead over a CursorReader, which just walks a second index through the
+# reader's items
+class CursorLookahead(object):
+  def __init__(self, reader):
+    self.reader = reader
+    self.items = reader.items
+    self.index = reader.index
+
+  def __iter__(self):
+    return self
+
+  def __next__(self):
+    index = self.index
+    if index >= len(self.items) and not self.reader._fill():
+      raise StopIteration
+    self.index = index + 1
+    return self.items[index]
+
+  def next(self):
+    return next(self)
+
+  def peek(self):
+    if self.index >= len(self.items) and not self.reader._fill():
+      return None
+    return self.items[self.index]
+
+  # the position in the whole stream of the next item, and back again
+  def tell(self):
+    return self.reader.base + self.index
+
+  def seek(self, position):
+    self.index = position - self.reader.base
+
+# a Reader that keeps the items it has pulled in a list and moves an index
+# through them, so backtracking is index arithmetic. mark() returns a
+# checkpoint which reset() rewinds to and commit() keeps, consumed items are
+# dropped once no checkpoint is live
+class CursorReader(Reader):
+  # how many consumed items to keep around before dropping them
+  drop_after = 1024
+
+  def __init__(self, gen, fail=None, matches=None):
+    super(CursorReader, self).__init__(iter(gen), fail, matches)
+    self.items = []
+    # the position of the next item in items
+    self.index = 0
+    # the position in the whole stream of items[0]
+    self.base = 0
+    self.marks = 0
+
+  def _fill(self):
+    try:
+      self.items.append(next(self.gen))
+    except StopIteration:
+      return False
+    return True
+
+  def _pop(self, raisestop=False):
+    index = self.index
+    if index >= len(self.items) and not self._fill():
+      if raisestop: raise StopIteration
+      return None
+    item = self.items[index]
+    index += 1
+    if index >= self.drop_after and not self.marks:
+      del self.items[:index]
+      self.base += index
+      index = 0
+    self.index = index
+    return item
+
+  def peek(self):
+    if self.index >= len(self.items) and not self._fill():
+      return None
+    return self.items[self.index]
+
+  def push(self, item):
+    if item is None: return
+    if self.index:
+      self.index -= 1
+      self.items[self.index] = item
+    else:
+      self.items.insert(0, item)
+
+  def lookahead(self):
+    return CursorLookahead(self)
+
+  # checkpoints
+  def mark(self):
+    self.marks += 1
+    return self.base + self.index
+
+  def reset(self, mark):
+    self.marks -= 1
+    self.index = mark - self.base
+
+  def commit(self, mark):
+    self.marks -= 1
+
+  # number of items matching args from the current index
+  def _match(self, args):
+    items, index, matches = self.items, self.index, self.matches
+    for count, other in enumerate(args):
+      if index + count >= len(items) and not self._fill():
+        return count
+      if not matches(items[index + count], other):
+        return count
+    return len(args)
+
+  def _take(self, count):
+    if count == 1:
+      return self._pop()
+    return [self._pop() for _ in range(count)]
+
+  def accept(self, *args):
+    if self._match(args) < len(args):
+      return None
+    return self._take(len(args))
+
+  def expect(self, *args):
+    count = self._match(args)
+    if count < len(args):
+      self.fail(args[count])
+    return self._take(len(args))
+
+  def accept_terminated(self, terminator, match=None, no_match=None):
+    if self._match((terminator,)):
+      self._pop()
+      return no_match() if hasattr(no_match, '__call__') else no_match
+    mark = self.mark()
+    value = self._pop() if match is None else self.accept(match)
+    if value is not None and self.accept(terminator) is not None:
+      self.commit(mark)
+      return value
+    self.reset(mark)
+    return None
+
+  def expect_terminated(self, terminator, match=None, no_match=None):
+    if self._match((terminator,)):
+      self._pop()
+      return no_match() if hasattr(no_match, '__call__') else no_match
+    mark = self.mark()
+    try:
+      if match is None:
+        if self.peek() is None:
+          self.fail(None)
+        value = self._pop()
+      elif hasattr(match, '__call__'):
+        value = match()
+        if value is None: self.fail(match)
+      else:
+        value = self.expect(match)
+      if self.accept(terminator) is not None:
+        return value
+      # unlike Reader this also rolls back whatever a callable match consumed
+      self.index = mark - self.base
+    finally:
+      self.commit(mark)
+    self.fail(match)
+
+# raised when a WindowedReader would need to hold more items than its window
+class WindowError(RuntimeError):
+  def __init__(self, window, message):
+    self.window = window
+    self.message = message
+
+  def __str__(self):
+    return "%s (window of %d items)" % (self.message, self.window)
+
+class WindowedLookahead(object):
+  def __init__(self, reader):
+    self.reader = reader
+    self.index = reader.index
+
+  def __iter__(self):
+    return self
+
+  def __next__(self):
+    item = self.reader._get(self.index)
+    if item is None:
+      raise StopIteration
+    self.index += 1
+    return item
+
+  def next(self):
+    return next(self)
+
+  def peek(self):
+    return self.reader._get(self.index)
+
+  def tell(self):
+    return self.index
+
+  def seek(self, position):
+    self.index = position
+
+# a CursorReader for unbounded streams, which holds at most window items in a
+# ring. everything before the current item and the oldest live mark is
+# released, reading further ahead than the window allows (or rewinding further
+# back) raises WindowError instead of growing
+class WindowedReader(CursorReader):
+  def __init__(self, gen, window=4096, fail=None, matches=None):
+    super(WindowedReader, self).__init__(gen, fail, matches)
+    self.window = window
+    self.ring = [None] * window
+    # positions here are counted from the start of the stream, end is the
+    # position after the last item pulled from gen
+    self.end = 0
+    # the positions of the live marks, oldest first
+    self.live = []
+
+  def _fill(self):
+    floor = self.live[0] if self.live else self.index
+    if self.end - floor >= self.window:
+      raise WindowError(self.window, "lookahead window exceeded")
+    try:
+      item = next(self.gen)
+    except StopIteration:
+      return False
+    self.ring[self.end % self.window] = item
+    self.end += 1
+    return True
+
+  # the item at position, or None past the end of the stream
+  def _get(self, position):
+    while position >= self.end:
+      if not self._fill(): return None
+    return self.ring[position % self.window]
+
+  def _pop(self, raisestop=False):
+    index = self.index
+    item = self._get(index)
+    if item is None:
+      if raisestop: raise StopIteration
+      return None
+    if not self.live:
+      self.ring[index % self.window] = None
+    self.index = index + 1
+    return item
+
+  def peek(self):
+    return self._get(self.index)
+
+  def push(self, item):
+    if item is None: return
+    index = self.index - 1
+    if index < 0 or self.end - index > self.window:
+      raise WindowError(self.window, "unable to push back")
+    self.ring[index % self.window] = item
+    self.index = index
+
+  def lookahead(self):
+    return WindowedLookahead(self)
+
+  def mark(self):
+    self.live.append(self.index)
+    return self.index
+
+  def reset(self, mark):
+    self.live.remove(mark)
+    self.index = mark
+
+  def commit(self, mark):
+    self.live.remove(mark)
+
+  def _match(self, args):
+    get, index, matches = self._get, self.index, self.matches
+    for count, other in enumerate(args):
+      item = get(index + count)
+      if item is None or not matches(item, other):
+        return count
+    return len(args)
+
 class CharReader(Reader):
   def __init__(self, chariter):
     super(CharReader, self).__init__(chariter)
@@ -210,3 +488,489 @@ class CharReader(Reader):
     try:
       while self._pop(True) != '\n': pass
     except StopIteration: pass
+
+  # consumes the rest of a block comment whose opening /* has already been
+  # read, returns False if EOF came first
+  def consume_comment(self, depth=1):
+    while depth:
+      try:
+        char = self._pop(True)
+      except StopIteration:
+        return False
+      if char == u'*' and self.peek() == u'/':
+        self._pop()
+        depth -= 1
+      elif char == u'/' and self.peek() == u'*':
+        self._pop()
+        depth += 1
+    return True
+
+  # consumes characters while they're in charset and returns them, leaving the
+  # first non-matching character unconsumed
+  def take_while(self, charset):
+    chars = []
+    if not len(self.buffer):
+      # straight off the iterator, moving the position once at the end
+      for char in self.gen:
+        if char not in charset:
+          self.buffer.append(char)
+          break
+        chars.append(char)
+      text = u''.join(chars)
+      self._advance(text)
+      return text
+    while True:
+      char = self.peek()
+      if char is None or char not in charset: break
+      chars.append(self._pop())
+    return u''.join(chars)
+
+  # consumes characters until one of them is in stops (or EOF) and returns
+  # them, leaving the stop character unconsumed
+  def take_until(self, stops):
+    chars = []
+    if not len(self.buffer):
+      for char in self.gen:
+        if char in stops:
+          self.buffer.append(char)
+          break
+        chars.append(char)
+      text = u''.join(chars)
+      self._advance(text)
+      return text
+    while True:
+      char = self.peek()
+      if char is None or char in stops: break
+      chars.append(self._pop())
+    return u''.join(chars)
+
+  # moves the position past text[start:end], which was consumed in bulk
+  def _advance(self, text, start=0, end=None):
+    if end is None: end = len(text)
+    newlines = text.count(u'\n', start, end)
+    if newlines:
+      self.line += newlines
+      self.offset = end - text.rfind(u'\n', start, end)
+    else:
+      self.offset += end - start
+
+_ascii = [chr(byte) for byte in range(0x80)]
+
+# the only two things that matter inside a block comment
+_text_comment_pattern = re.compile(r'/\*|\*/')
+_newline_pattern = re.compile(u'\n')
+_comment_pattern = re.compile(br'/\*|\*/')
+
+# compiled text patterns for ChunkReader.take_while and take_until, keyed by
+# the (frozen) character set
+_text_run_patterns = {}
+_text_until_patterns = {}
+
+def _text_class(charset):
+  return u''.join(re.escape(char) for char in sorted(charset))
+
+def _text_run_pattern(charset):
+  pattern = _text_run_patterns.get(charset)
+  if pattern is None:
+    pattern = re.compile(u'[' + _text_class(charset) + u']*')
+    _text_run_patterns[charset] = pattern
+  return pattern
+
+def _text_until_pattern(stops):
+  pattern = _text_until_patterns.get(stops)
+  if pattern is None:
+    pattern = re.compile(u'[^' + _text_class(stops) + u']*')
+    _text_until_patterns[stops] = pattern
+  return pattern
+
+# compiled byte patterns for ByteReader.take_while and take_until, keyed by the
+# (frozen) character set
+_run_patterns = {}
+_until_patterns = {}
+
+def _byte_class(charset):
+  return b''.join(re.escape(char.encode('ascii')) for char in sorted(charset))
+
+def _run_pattern(charset):
+  pattern = _run_patterns.get(charset)
+  if pattern is None:
+    ascii = [char for char in charset if char < u'\x80']
+    pattern = re.compile(b'[' + _byte_class(ascii) + b']*')
+    _run_patterns[charset] = pattern
+  return pattern
+
+# None if any of the stops can't be matched on the bytes
+def _until_pattern(stops):
+  if stops in _until_patterns:
+    return _until_patterns[stops]
+  pattern = None
+  if all(char < u'\x80' for char in stops):
+    pattern = re.compile(b'[^' + _byte_class(stops) + b']*')
+  _until_patterns[stops] = pattern
+  return pattern
+
+# reads utf-8 encoded characters straight out of a bytes-like object, such as
+# the mmap returned by file_iter.file_map. characters are only decoded one at a
+# time when popped individually, runs taken with take_while and take_until are
+# matched on the raw bytes and decoded once
+class ByteReader(CharReader):
+  def __init__(self, data):
+    super(ByteReader, self).__init__(self._chars())
+    self.data = data
+    self.length = len(data)
+    # utf-8-sig behavior, strip the BOM if present
+    self.index = 3 if data[:3] == codecs.BOM_UTF8 else 0
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+    return False
+
+  # closes the data if it can be, like a mapped file. the reader can't be used
+  # afterwards
+  def close(self):
+    close = getattr(self.data, 'close', None)
+    if close is not None:
+      close()
+
+  # backs Lookahead, which pulls from gen
+  def _chars(self):
+    while True:
+      char = self._decode()
+      if char is None: return
+      yield char
+
+  def _decode(self):
+    index = self.index
+    if index >= self.length: return None
+    byte = self.data[index]
+    if byte < 0x80:
+      self.index = index + 1
+      return _ascii[byte]
+    if byte < 0xe0: end = index + 2
+    elif byte < 0xf0: end = index + 3
+    else: end = index + 4
+    self.index = end
+    return self.data[index:end].decode('utf-8')
+
+  def _pop(self, raisestop=False):
+    if len(self.buffer):
+      item = self.buffer.popleft()
+    else:
+      item = self._decode()
+      if item is None and raisestop:
+        raise StopIteration
+    if item == u'\n':
+      self.line += 1
+      self.offset = 1
+    else:
+      self.offset += 1
+    return item
+
+  def peek(self):
+    if len(self.buffer):
+      return self.buffer[0]
+    index = self.index
+    char = self._decode()
+    self.index = index
+    return char
+
+  def push(self, item):
+    if item is None: return
+    if self.offset == 1:
+      raise RuntimeError("unable to push back a line")
+    if len(self.buffer):
+      self.buffer.appendleft(item)
+    else:
+      self.index -= 1 if item < u'\x80' else len(item.encode('utf-8'))
+    self.offset -= 1
+
+  def consume_line(self):
+    if len(self.buffer):
+      return super(ByteReader, self).consume_line()
+    end = self.data.find(b'\n', self.index)
+    if end == -1:
+      self._advance(self.data[self.index:].decode('utf-8'))
+      self.index = self.length
+    else:
+      self.index = end + 1
+      self.line += 1
+      self.offset = 1
+
+  def consume_comment(self, depth=1):
+    if len(self.buffer):
+      return super(ByteReader, self).consume_comment(depth)
+    search = _comment_pattern.search
+    while depth:
+      start = self.index
+      found = search(self.data, start)
+      end = found.end() if found else self.length
+      self.index = end
+      self._advance(self.data[start:end].decode('utf-8'))
+      if found is None: return False
+      depth += 1 if found.group() == b'/*' else -1
+    return True
+
+  def take_while(self, charset):
+    if len(self.buffer):
+      return super(ByteReader, self).take_while(charset)
+    start = self.index
+    end = _run_pattern(charset).match(self.data, start).end()
+    self.index = end
+    text = self.data[start:end].decode('ascii')
+    self._advance(text)
+    # only ascii characters are matched on the bytes
+    return text + super(ByteReader, self).take_while(charset)
+
+  def take_until(self, stops):
+    pattern = _until_pattern(stops)
+    if pattern is None or len(self.buffer):
+      return super(ByteReader, self).take_until(stops)
+    start = self.index
+    end = pattern.match(self.data, start).end()
+    self.index = end
+    # ascii stops never split a multibyte sequence
+    text = self.data[start:end].decode('utf-8')
+    self._advance(text)
+    return text
+
+# reads characters out of a whole string by moving an index through it. the
+# position is only turned into a line and offset when one is asked for, by
+# bisecting a table of the newlines in the text, so nothing is counted per
+# character and push can step back over a newline
+class TextReader(CharReader):
+  def __init__(self, text):
+    # line and offset are computed, so CharReader doesn't get to set them
+    super(CharReader, self).__init__(self._chars())
+    self.text = text
+    self.length = len(text)
+    self.index = 0
+    self.newlines = [found.start()
+      for found in _newline_pattern.finditer(text)]
+    self._line = 0
+
+  # the index of the next character to be consumed
+  @property
+  def position(self):
+    return self.index - len(self.buffer)
+
+  @property
+  def line(self):
+    return self._locate(self.index - len(self.buffer)) + 1
+
+  @property
+  def offset(self):
+    position = self.index - len(self.buffer)
+    line = self._locate(position)
+    return position - (self.newlines[line - 1] + 1 if line else 0) + 1
+
+  # the number of newlines before position. tokens are mostly asked about in
+  # order, so the last line found is checked before bisecting
+  def _locate(self, position):
+    newlines, line = self.newlines, self._line
+    if (not line or newlines[line - 1] < position) and \
+      (line == len(newlines) or position <= newlines[line]):
+      return line
+    line = self._line = bisect.bisect_left(newlines, position)
+    return line
+
+  # backs Lookahead, which pulls from gen
+  def _chars(self):
+    while self.index < self.length:
+      self.index += 1
+      yield self.text[self.index - 1]
+
+  def _pop(self, raisestop=False):
+    if len(self.buffer):
+      return self.buffer.popleft()
+    index = self.index
+    if index >= self.length:
+      if raisestop: raise StopIteration
+      return None
+    self.index = index + 1
+    return self.text[index]
+
+  def peek(self):
+    if len(self.buffer):
+      return self.buffer[0]
+    if self.index >= self.length:
+      return None
+    return self.text[self.index]
+
+  def push(self, item):
+    if item is None: return
+    if not len(self.buffer) and self.index and self.text[self.index - 1] == item:
+      self.index -= 1
+    else:
+      self.buffer.appendleft(item)
+
+  def consume_line(self):
+    if len(self.buffer):
+      return super(TextReader, self).consume_line()
+    end = self.text.find(u'\n', self.index)
+    self.index = self.length if end == -1 else end + 1
+
+  def consume_comment(self, depth=1):
+    if len(self.buffer):
+      return super(TextReader, self).consume_comment(depth)
+    search = _text_comment_pattern.search
+    while depth:
+      found = search(self.text, self.index)
+      if found is None:
+        self.index = self.length
+        return False
+      depth += 1 if found.group() == u'/*' else -1
+      self.index = found.end()
+    return True
+
+  def take_while(self, charset):
+    if len(self.buffer):
+      return super(TextReader, self).take_while(charset)
+    start = self.index
+    self.index = _text_run_pattern(charset).match(self.text, start).end()
+    return self.text[start:self.index]
+
+  def take_until(self, stops):
+    if len(self.buffer):
+      return super(TextReader, self).take_until(stops)
+    start = self.index
+    self.index = _text_until_pattern(stops).match(self.text, start).end()
+    return self.text[start:self.index]
+
+# reads characters out of an iterable of decoded chunks, such as the one
+# returned by file_iter.file_chunks, by walking an index through the current
+# chunk
+class ChunkReader(CharReader):
+  def __init__(self, chunks):
+    super(ChunkReader, self).__init__(self._chars())
+    self.chunks = iter(chunks)
+    self.chunk = u''
+    self.index = 0
+
+  # backs Lookahead, which pulls from gen
+  def _chars(self):
+    while True:
+      char = self._next()
+      if char is None: return
+      yield char
+
+  # moves on to the next non-empty chunk, returns whether there was one
+  def _fill(self):
+    for chunk in self.chunks:
+      if len(chunk):
+        self.chunk = chunk
+        self.index = 0
+        return True
+    return False
+
+  def _next(self):
+    index = self.index
+    if index >= len(self.chunk):
+      if not self._fill(): return None
+      index = 0
+    self.index = index + 1
+    return self.chunk[index]
+
+  def _pop(self, raisestop=False):
+    if len(self.buffer):
+      item = self.buffer.popleft()
+    else:
+      item = self._next()
+      if item is None and raisestop:
+        raise StopIteration
+    if item == u'\n':
+      self.line += 1
+      self.offset = 1
+    else:
+      self.offset += 1
+    return item
+
+  def peek(self):
+    if len(self.buffer):
+      return self.buffer[0]
+    if self.index >= len(self.chunk) and not self._fill():
+      return None
+    return self.chunk[self.index]
+
+  def push(self, item):
+    if item is None: return
+    if self.offset == 1:
+      raise RuntimeError("unable to push back a line")
+    # the previous chunk is gone once we've moved past it
+    if len(self.buffer) or self.index == 0:
+      self.buffer.appendleft(item)
+    else:
+      self.index -= 1
+    self.offset -= 1
+
+  def consume_line(self):
+    if len(self.buffer):
+      return super(ChunkReader, self).consume_line()
+    while True:
+      chunk, start = self.chunk, self.index
+      end = chunk.find(u'\n', start)
+      if end != -1:
+        self.index = end + 1
+        self.line += 1
+        self.offset = 1
+        return
+      self.index = len(chunk)
+      self._advance(chunk, start)
+      if not self._fill(): return
+
+  def consume_comment(self, depth=1):
+    search = _text_comment_pattern.search
+    while depth:
+      chunk, start = self.chunk, self.index
+      # a delimiter can straddle two chunks, so the last character of each
+      # chunk goes through the character at a time path
+      if len(self.buffer) or start >= len(chunk) - 1:
+        try:
+          char = self._pop(True)
+        except StopIteration:
+          return False
+        if char == u'*' and self.peek() == u'/':
+          self._pop()
+          depth -= 1
+        elif char == u'/' and self.peek() == u'*':
+          self._pop()
+          depth += 1
+        continue
+      found = search(chunk, start)
+      end = found.end() if found else len(chunk) - 1
+      self.index = end
+      self._advance(chunk, start, end)
+      if found: depth += 1 if found.group() == u'/*' else -1
+    return True
+
+  def take_while(self, charset):
+    if len(self.buffer):
+      return super(ChunkReader, self).take_while(charset)
+    match = _text_run_pattern(charset).match
+    pieces = []
+    while True:
+      chunk, start = self.chunk, self.index
+      end = match(chunk, start).end()
+      pieces.append(chunk[start:end])
+      self.index = end
+      if end < len(chunk) or not self._fill(): break
+    text = u''.join(pieces)
+    self._advance(text)
+    return text
+
+  def take_until(self, stops):
+    if len(self.buffer):
+      return super(ChunkReader, self).take_until(stops)
+    match = _text_until_pattern(stops).match
+    pieces = []
+    while True:
+      chunk, start = self.chunk, self.index
+      end = match(chunk, start).end()
+      pieces.append(chunk[start:end])
+      self.index = end
+      if end < len(chunk) or not self._fill(): break
+    text = u''.join(pieces)
+    self._advance(text)
+    return text
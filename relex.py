@@ -0,0 +1,315 @@
+import bisect, itertools
+from pycub.lex import RegexScanner
+from pycub.parse import ParseError
+
+# keeps the token stream of a source string up to date across edits, only
+# re-scanning the tokens around each edit
+#
+# every token boundary is a safe place to restart the scanner: comments and
+# whitespace are consumed whole between tokens, so the scanner is never inside
+# a string or a nested comment there. the longest lookahead past the end of a
+# token is two characters, for a number followed by a . that might start its
+# fraction, so a token is unaffected by an edit that starts after both
+#
+# the source is held in chunks of at most chunk_size tokens, cut between tokens,
+# and token positions are relative to their chunk. an edit rewrites the chunks
+# it touches and updates running totals of their sizes, so nothing after it is
+# shifted. token lines are brought up to date a chunk at a time when the chunk
+# is next looked at, so a newline typed near the top of a file doesn't
+# renumber the rest of it
+class IncrementalLexer(object):
+  def __init__(self, source, symbols=None, chunk_size=512):
+    self.symbols = {} if symbols is None else symbols
+    self.chunk_size = chunk_size
+    found, starts, ends = self.scan(RegexScanner(source, self.symbols))
+    self._rebuild(self._split(source, 1, found, starts, ends))
+
+  # the whole source and token list, both built on demand
+  @property
+  def source(self):
+    return u''.join(self.texts)
+
+  @property
+  def tokens(self):
+    lines = itertools.accumulate(self.line_counts.values, initial=1)
+    for chunk, line in zip(range(len(self.texts)), lines):
+      self._sync(chunk, line)
+    return list(itertools.chain.from_iterable(self.chunk_tokens))
+
+  def __len__(self):
+    return self.counts.prefix(len(self.texts))
+
+  # the token at index, with its line up to date
+  def token(self, index):
+    if not 0 <= index < len(self):
+      raise IndexError(index)
+    chunk = self.counts.find(index)
+    self._sync(chunk, self._first_line(chunk))
+    return self.chunk_tokens[chunk][index - self.counts.prefix(chunk)]
+
+  # scans to the end, or until stop returns True for a token's start index
+  def scan(self, scanner, stop=None):
+    found, starts, ends = [], [], []
+    while True:
+      token = scanner.scan()
+      if token is None: break
+      if stop is not None and stop(scanner.start): break
+      found.append(token)
+      starts.append(scanner.start)
+      ends.append(scanner.index)
+    return found, starts, ends
+
+  # replaces source[start:end] with replacement. returns the index of the first
+  # changed token, the number of tokens removed there and the list of tokens
+  # added in their place. raises ParseError (leaving the lexer untouched) if the
+  # edited source doesn't lex
+  def edit(self, start, end, replacement):
+    texts = self.texts
+    last = len(texts) - 1
+    base_of = self.sizes.prefix
+    delta = len(replacement) - (end - start)
+    after = self.sizes.find(end)
+
+    # tokens whose lookahead characters come before the edit are kept as is,
+    # the region re-scanned starts in the chunk of the last of them
+    first, keep = self.sizes.find(start), 0
+    while first >= 0:
+      keep = bisect.bisect_left(self.chunk_ends[first],
+        start - 1 - base_of(first))
+      if keep: break
+      first -= 1
+    if first < 0:
+      first = 0
+      index, line, line_start = 0, 1, 0
+    else:
+      self._sync(first, self._first_line(first))
+      index = self.chunk_ends[first][keep - 1]
+      line = self.chunk_tokens[first][keep - 1].line
+      line_start = self._line_start(first, index) - base_of(first)
+    base = base_of(first)
+
+    old = u''.join(texts[first:after + 1])
+    edited = old[:start - base] + replacement + old[end - base:]
+    edit_end = start - base + len(replacement)
+
+    # stop once a new token starts where an old one did in the unchanged text
+    # after the edit, the rest of the stream is the same from there on
+    resume = [None]
+    def stop(position):
+      if position < edit_end: return False
+      position += base - delta
+      chunk = self.sizes.find(position)
+      position -= base_of(chunk)
+      starts = self.chunk_starts[chunk]
+      found = bisect.bisect_left(starts, position)
+      if found < len(starts) and starts[found] == position:
+        resume[0] = chunk, found
+        return True
+      return False
+
+    # the window starts out as the edited chunks, and takes in more of the
+    # chunks after them when scanning runs off its end, since the last token
+    # in it might have been cut short
+    extra = 0
+    while True:
+      window = edited + u''.join(texts[after + 1:after + 1 + extra])
+      whole = after + extra >= last
+      scanner = RegexScanner(window, self.symbols, index, line, line_start)
+      try:
+        found, found_starts, found_ends = self.scan(scanner, stop)
+      except (ParseError, NotImplementedError):
+        if whole: raise
+        found = None
+      if found is not None and (resume[0] is not None or whole): break
+      resume[0] = None
+      extra = max(1, extra * 2)
+
+    if resume[0] is None:
+      resume_chunk, resume_index = last, len(self.chunk_tokens[last])
+    else:
+      resume_chunk, resume_index = resume[0]
+      # resuming at the start of a chunk leaves that chunk as it is, unless
+      # the tokens found run into it
+      scanned = found_ends[-1] + base - delta if found_ends else start
+      while resume_index == 0 and resume_chunk > after and \
+        base_of(resume_chunk) >= scanned:
+        resume_chunk -= 1
+        resume_index = len(self.chunk_tokens[resume_chunk])
+    region = window[:base_of(resume_chunk + 1) - base + delta]
+
+    # tokens after the resume point move by the change in newlines, and the
+    # ones on the line the edit ends on by the change in its column
+    line_delta = replacement.count(u'\n') - old.count(u'\n', start - base,
+      end - base)
+    new_line_start = edited.rfind(u'\n', 0, edit_end) + 1 + base
+    if new_line_start == base:
+      new_line_start = self._line_start(first, 0)
+    column_delta = start + len(replacement) - new_line_start - \
+      (end - self._line_start(after, end - base_of(after)))
+    for chunk in range(first, resume_chunk + 1):
+      self._sync(chunk, self._first_line(chunk))
+    if column_delta:
+      line_end = self._line_end(after, end - base_of(after))
+      chunk, position = resume_chunk, resume_index
+      while chunk <= last:
+        starts, chunk_base = self.chunk_starts[chunk], base_of(chunk)
+        while position < len(starts) and \
+          chunk_base + starts[position] < line_end:
+          self.chunk_tokens[chunk][position].offset += column_delta
+          position += 1
+        if position < len(starts): break
+        chunk, position = chunk + 1, 0
+
+    tail = self.chunk_tokens[resume_chunk][resume_index:]
+    if line_delta:
+      for token in tail:
+        token.line += line_delta
+    shift = base_of(resume_chunk) - base + delta
+    tokens = self.chunk_tokens[first][:keep] + found + tail
+    starts = self.chunk_starts[first][:keep] + found_starts + [position + shift
+      for position in self.chunk_starts[resume_chunk][resume_index:]]
+    ends = self.chunk_ends[first][:keep] + found_ends + [position + shift
+      for position in self.chunk_ends[resume_chunk][resume_index:]]
+
+    changed = self.counts.prefix(first) + keep
+    removed = self.counts.prefix(resume_chunk) + resume_index - changed
+    line = self._first_line(first)
+    if len(tokens) <= self.chunk_size:
+      chunks = [(region, tokens, starts, ends, region.count(u'\n'), line)]
+    else:
+      chunks = self._split(region, line, tokens, starts, ends)
+    if len(chunks) > resume_chunk + 1 - first:
+      # more chunks than before, which takes a paste or half a chunk's worth
+      # of tokens typed in one place
+      current = self._chunks()
+      self._rebuild(current[:first] + chunks + current[resume_chunk + 1:])
+    else:
+      # any chunks left over stay empty until the next rebuild
+      for chunk in range(first, resume_chunk + 1):
+        self._set(chunk, *(chunks[chunk - first] if chunk - first < len(chunks)
+          else (u'', [], [], [], 0, 0)))
+    return changed, removed, found
+
+  # internal api
+  def _first_line(self, chunk):
+    return self.line_counts.prefix(chunk) + 1
+
+  # chunks of half chunk_size tokens out of text, which starts on line. the
+  # other half is room to grow before a chunk has to be split again
+  def _split(self, text, line, tokens, starts, ends):
+    chunks = []
+    begin = 0
+    size = max(self.chunk_size // 2, 1)
+    for first in range(0, max(len(tokens), 1), size):
+      last = first + size
+      cut = ends[last - 1] if last < len(tokens) else len(text)
+      piece = text[begin:cut]
+      chunks.append((piece, tokens[first:last],
+        [position - begin for position in starts[first:last]],
+        [position - begin for position in ends[first:last]],
+        piece.count(u'\n'), line))
+      line += chunks[-1][4]
+      begin = cut
+    return chunks
+
+  def _chunks(self):
+    return list(zip(self.texts, self.chunk_tokens, self.chunk_starts,
+      self.chunk_ends, self.line_counts.values, self.synced))
+
+  # per chunk: its text, its tokens with their start and end indices in the
+  # text, the number of newlines in the text, and the first line the tokens'
+  # line numbers were last set for. empty chunks are dropped
+  def _rebuild(self, chunks):
+    chunks = [chunk for chunk in chunks if chunk[0]] or \
+      [(u'', [], [], [], 0, 1)]
+    texts, found, starts, ends, newlines, synced = map(list, zip(*chunks))
+    self.texts = texts
+    self.chunk_tokens = found
+    self.chunk_starts = starts
+    self.chunk_ends = ends
+    self.synced = synced
+    self.sizes = Sums(map(len, texts))
+    self.line_counts = Sums(newlines)
+    self.counts = Sums(map(len, found))
+
+  def _set(self, chunk, text, found, starts, ends, newlines, synced):
+    self.texts[chunk] = text
+    self.chunk_tokens[chunk] = found
+    self.chunk_starts[chunk] = starts
+    self.chunk_ends[chunk] = ends
+    self.synced[chunk] = synced
+    self.sizes.set(chunk, len(text))
+    self.line_counts.set(chunk, newlines)
+    self.counts.set(chunk, len(found))
+
+  # moves the tokens of a chunk to the lines it starts on now
+  def _sync(self, chunk, line):
+    line_delta = line - self.synced[chunk]
+    if line_delta:
+      for token in self.chunk_tokens[chunk]:
+        token.line += line_delta
+      self.synced[chunk] = line
+
+  # the index of the start of the line holding position in chunk
+  def _line_start(self, chunk, position):
+    while chunk >= 0:
+      found = self.texts[chunk].rfind(u'\n', 0, position)
+      if found >= 0:
+        return self.sizes.prefix(chunk) + found + 1
+      chunk -= 1
+      position = None
+    return 0
+
+  # the index of the newline ending the line holding position in chunk
+  def _line_end(self, chunk, position):
+    while chunk < len(self.texts):
+      found = self.texts[chunk].find(u'\n', position)
+      if found >= 0:
+        return self.sizes.prefix(chunk) + found
+      chunk += 1
+      position = 0
+    return self.sizes.prefix(len(self.texts))
+
+# running totals over a list of counts that change one at a time, kept in a
+# binary indexed tree so that looking up and changing both take time
+# logarithmic in the length
+class Sums(object):
+  def __init__(self, values):
+    self.values = list(values)
+    tree = [0] + self.values
+    for index in range(1, len(tree)):
+      parent = index + (index & -index)
+      if parent < len(tree):
+        tree[parent] += tree[index]
+    self.tree = tree
+
+  # the total of the first count values
+  def prefix(self, count):
+    total, tree = 0, self.tree
+    while count:
+      total += tree[count]
+      count &= count - 1
+    return total
+
+  def set(self, index, value):
+    change = value - self.values[index]
+    if not change: return
+    self.values[index] = value
+    tree = self.tree
+    index += 1
+    while index < len(tree):
+      tree[index] += change
+      index += index & -index
+
+  # the last index whose prefix is at most total, which is the index holding
+  # position total when the values are lengths. the last index past the end
+  def find(self, total):
+    tree, index = self.tree, 0
+    step = 1 << len(self.values).bit_length()
+    while step:
+      next = index + step
+      if next < len(tree) and tree[next] <= total:
+        index = next
+        total -= tree[next]
+      step >>= 1
+    return min(index, len(self.values) - 1)
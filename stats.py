@@ -0,0 +1,235 @@
+import collections, sys
+
+# the Stats collecting right now, if any. readers and scanners check this once
+# when they're constructed, so nothing is counted (or paid for) otherwise
+active = None
+
+# reader methods whose calls are counted
+reader_events = ('peek', 'pop', 'push', 'accept', 'expect', 'lookahead')
+
+# events also counted by the calling function, which is where backtracking is
+# decided
+caller_events = ('push', 'accept miss', 'lookahead')
+
+# counts reader, lookahead and scanner activity for everything constructed
+# while it's active, and writes a summary to output (stderr by default) when
+# the block exits
+#
+#   with stats.Stats() as counts:
+#     Parser(Scanner(file_iter(filename))).parse()
+class Stats(object):
+  def __init__(self, output=None):
+    self.counts = collections.Counter()
+    # (function name, event) pairs
+    self.callers = collections.Counter()
+    self.lookahead_depth = 0
+    self.chars = 0
+    self.tokens = 0
+    self.output = output
+    self.previous = None
+
+  def __enter__(self):
+    global active
+    self.previous, active = active, self
+    return self
+
+  def __exit__(self, *exc_info):
+    global active
+    active = self.previous
+    self.dump(self.output or sys.stderr)
+    return False
+
+  def dump(self, output):
+    output.write("characters %d, tokens %d\n" % (self.chars, self.tokens))
+    output.write("lookaheads %d, deepest %d\n" %
+      (sum(count for (name, event), count in self.counts.items()
+        if event == 'lookahead'), self.lookahead_depth))
+    for (name, event), count in sorted(self.counts.items()):
+      output.write("  %-32s %10d\n" % (name + '.' + event, count))
+    if self.callers:
+      output.write("backtracking by caller\n")
+      for (caller, event), count in self.callers.most_common():
+        output.write("  %-32s %10d\n" % (caller + ' ' + event, count))
+
+# swaps obj over to a counting subclass of its class, reporting to the active
+# Stats
+def instrument(obj):
+  cls = type(obj)
+  subclass = _subclasses.get(cls)
+  if subclass is None:
+    subclass = _subclasses[cls] = _counting_subclass(cls)
+  obj.__class__ = subclass
+  obj._stats = active
+  # set while an accept is running, so that the accepts a multi-argument
+  # accept makes for each argument aren't counted again
+  obj._accepting = False
+
+_subclasses = {}
+
+def _counting_subclass(cls):
+  name = cls.__name__
+  methods = {'__slots__': ()}
+
+  if hasattr(cls, 'scan'):
+    scan = cls.scan
+    def counted_scan(self):
+      token = scan(self)
+      if token is not None:
+        self._stats.tokens += 1
+      return token
+    methods['scan'] = counted_scan
+    return type(name, (cls,), methods)
+
+  for event in reader_events:
+    if hasattr(cls, event):
+      methods[event] = _counted(name, event, getattr(cls, event))
+
+  # character readers
+  for method_name in ('take_while', 'take_until'):
+    if hasattr(cls, method_name):
+      methods[method_name] = _counted_chars(getattr(cls, method_name))
+  if hasattr(cls, 'take_while'):
+    pop = methods['pop']
+    def counted_pop(self):
+      item = pop(self)
+      if item is not None:
+        self._stats.chars += 1
+      return item
+    methods['pop'] = counted_pop
+    methods.update(_counted_comments(cls))
+
+  return type(name, (cls,), methods)
+
+def _counted(name, event, method):
+  if event == 'accept':
+    def counted(self, *args):
+      if self._accepting:
+        return method(self, *args)
+      stats = self._stats
+      self._accepting = True
+      try:
+        item = method(self, *args)
+      finally:
+        self._accepting = False
+      if item is None:
+        stats.counts[name, 'accept miss'] += 1
+        stats.callers[_caller(), 'accept miss'] += 1
+      else:
+        stats.counts[name, 'accept hit'] += 1
+      return item
+    return counted
+
+  if event == 'lookahead':
+    def counted(self):
+      stats = self._stats
+      stats.counts[name, event] += 1
+      stats.callers[_caller(), event] += 1
+      return _instrument_lookahead(method(self), stats)
+    return counted
+
+  by_caller = event in caller_events
+  def counted(self, *args):
+    stats = self._stats
+    stats.counts[name, event] += 1
+    if by_caller:
+      stats.callers[_caller(), event] += 1
+    return method(self, *args)
+  return counted
+
+# functions that only pass reader calls along
+_delegates = set(reader_events) | {'accept_terminated', 'expect_terminated',
+  '<genexpr>'}
+
+# the name of the function that called into the reader
+def _caller():
+  frame = sys._getframe(2)
+  while frame.f_code.co_name in _delegates and frame.f_back is not None:
+    frame = frame.f_back
+  return frame.f_code.co_name
+
+def _counted_chars(method):
+  def counted(self, chars):
+    text = method(self, chars)
+    self._stats.chars += len(text)
+    return text
+  return counted
+
+_comment_stops = frozenset(u'*/')
+_newline = frozenset(u'\n')
+
+# the readers skip comments in bulk without saying how much they skipped, so
+# the counting readers skip them a run at a time instead, the same way
+# CharReader does
+def _counted_comments(cls):
+  take_until, pop, peek = cls.take_until, cls.pop, cls.peek
+
+  def consume_line(self):
+    stats = self._stats
+    stats.chars += len(take_until(self, _newline))
+    if pop(self) is not None:
+      stats.chars += 1
+
+  def consume_comment(self, depth=1):
+    stats = self._stats
+    while depth:
+      stats.chars += len(take_until(self, _comment_stops))
+      char = pop(self)
+      if char is None:
+        return False
+      stats.chars += 1
+      if char == u'*' and peek(self) == u'/':
+        pop(self)
+        stats.chars += 1
+        depth -= 1
+      elif char == u'/' and peek(self) == u'*':
+        pop(self)
+        stats.chars += 1
+        depth += 1
+    return True
+
+  return {'consume_line': consume_line, 'consume_comment': consume_comment}
+
+_lookahead_subclasses = {}
+
+def _instrument_lookahead(lookahead, stats):
+  cls = type(lookahead)
+  subclass = _lookahead_subclasses.get(cls)
+  if subclass is None:
+    subclass = _lookahead_subclasses[cls] = _counting_lookahead(cls)
+  lookahead.__class__ = subclass
+  lookahead._stats = stats
+  lookahead._depth = 0
+  return lookahead
+
+# tracks how far each lookahead gets ahead of its reader
+def _counting_lookahead(cls):
+  def advance(self, depth):
+    if depth > self._stats.lookahead_depth:
+      self._stats.lookahead_depth = depth
+
+  methods = {'__slots__': ()}
+  base_next = cls.__next__
+  def counted_next(self):
+    item = base_next(self)
+    self._depth += 1
+    advance(self, self._depth)
+    return item
+  methods['__next__'] = counted_next
+
+  base_peek = cls.peek
+  def counted_peek(self):
+    item = base_peek(self)
+    if item is not None:
+      advance(self, self._depth + 1)
+    return item
+  methods['peek'] = counted_peek
+
+  if hasattr(cls, 'skip'):
+    base_skip = cls.skip
+    def counted_skip(self):
+      base_skip(self)
+      self._depth += 1
+      advance(self, self._depth)
+    methods['skip'] = counted_skip
+
+  return type(cls.__name__, (cls,), methods)
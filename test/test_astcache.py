@@ -0,0 +1,83 @@
+import unittest, os, os.path, tempfile
+
+from ..astcache import ASTCache
+from ..bench import programs
+from ..lex import Scanner
+from ..parse import Parser
+from ..tokencache import TokenCache
+
+SOURCE = u"""a = b * (c + d)[e](f, g.h++, -i);
+if (a) { b; c(d); } else if (e) f; else { { g; } }
+while (x < 10) x += 1.5;
+do { y--; ; } while (!y);
+s = 'text' # "more";
+"""
+
+class TestASTCache(unittest.TestCase):
+
+  def setUp(self):
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    self.directory = directory.name
+
+  def entries(self, suffix='.ast'):
+    return sorted(name for name in os.listdir(self.directory)
+      if name.endswith(suffix))
+
+  def test_hit(self):
+    "cache returns the tree it parsed for the same source"
+    source = SOURCE.encode('utf-8')
+    expected = Parser(Scanner(SOURCE)).parse()
+    cache = ASTCache(self.directory)
+    self.assertEqual(cache.load(source), expected)
+    self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+    cache = ASTCache(self.directory)
+    tree = cache.load(source)
+    self.assertEqual((cache.hits, cache.misses), (1, 0))
+    self.assertEqual(tree, expected)
+
+    # parent links point into the loaded tree
+    first = tree.body
+    self.assertIs(first.parent, tree)
+    branch = first.next
+    self.assertIs(branch.first.parent, branch)
+    self.assertIs(branch.first.body.parent, branch.first)
+    # names shared in the tree stay shared
+    self.assertIs(branch.condition.symbol, first.value.left.symbol)
+
+  def test_programs(self):
+    "generated programs survive the round trip"
+    cache = ASTCache(self.directory)
+    for shape in sorted(programs.shapes):
+      source = programs.generate(shape, 4000, seed=2, depth=30)
+      data = source.encode('utf-8')
+      cache.load(data)
+      self.assertEqual(cache.get(data), Parser(Scanner(source)).parse())
+
+  def test_stale(self):
+    "entries from another parser version or damaged entries are misses"
+    source = SOURCE.encode('utf-8')
+    cache = ASTCache(self.directory)
+    cache.load(source)
+    cache.fingerprint = b'\0' * 20
+    self.assertIsNone(cache.get(source))
+    self.assertEqual(self.entries(), [])
+
+    cache.load(source)
+    path = os.path.join(self.directory, self.entries()[0])
+    with open(path, 'r+b') as f:
+      f.truncate(os.path.getsize(path) - 3)
+    self.assertIsNone(cache.get(source))
+    self.assertEqual(cache.load(source), Parser(Scanner(SOURCE)).parse())
+
+  def test_shared_directory(self):
+    "token and tree caches keep to their own entries"
+    source = SOURCE.encode('utf-8')
+    ASTCache(self.directory).load(source)
+    tokens = TokenCache(self.directory)
+    tokens.load(source)
+    tokens.max_bytes = 0
+    tokens.evict()
+    self.assertEqual(self.entries('.tok'), [])
+    self.assertEqual(len(self.entries()), 1)
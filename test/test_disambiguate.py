@@ -1,4 +1,5 @@
 import unittest
+from unittest import mock
 
 from pycub.lex import Scanner
 from pycub.parse import Parser
@@ -67,3 +68,30 @@ class TestStatementDisambiguation(unittest.TestCase):
     self.assertEquals(new("Type()(Type)[]"), disambiguate.G_NEW_ARRAY)
     self.assertEquals(new("Type(Type)(Type)[]"), disambiguate.G_NEW_ARRAY)
     self.assertEquals(new("Type(Type, Type)(Type)[]"), disambiguate.G_NEW_ARRAY)
+
+class TestMemo(unittest.TestCase):
+
+  def test_nested(self):
+    "disambiguation scans each nested argument list once"
+    depth = 30
+    code = u"f(" * depth + u"x" + u")" * depth + u";"
+
+    def scans(memo):
+      parser = Parser(Scanner(iter(code)))
+      if not memo: parser.memo = None
+      with mock.patch.object(disambiguate, 'scan_expression_inner',
+        wraps=disambiguate.scan_expression_inner) as scan:
+        body = parser.parse().body
+      self.assertEqual(body.value.callee.symbol, u"f")
+      return scan.call_count
+
+    self.assertLessEqual(scans(True), 2 * depth)
+    self.assertGreater(scans(False), depth * depth / 4)
+
+  def test_same_results(self):
+    "memoized disambiguation agrees with rescanning"
+    for code in ("Type(Type()) fn;", "func(func(value + value))",
+      "Type(Type(), Type) fn() {}", "a(b(c), d(e(f)))"):
+      parser = Parser(Scanner(iter(code)))
+      parser.memo = None
+      self.assertEqual(statement(code), disambiguate_statement(parser))
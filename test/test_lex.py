@@ -1,19 +1,27 @@
 import unittest, os.path
+from unittest import mock
 
-from ..file_iter import file_iter
-from ..lex import Scanner
+from ..file_iter import file_iter, file_chunks, file_map
+from ..lex import Scanner, punctuation_table
+from ..parse import ParseError
+from ..reader import ByteReader, ChunkReader, TextReader
 import pycub.tokens as tokens
 import pycub.types as types
 
 FIXTURE = os.path.dirname(os.path.realpath(__file__)) + "/fixtures/test.cub"
 
 class TestLex(unittest.TestCase):
+  # TestRegexLex runs these against RegexScanner
+  scanner_class = Scanner
+
+  def scan(self, source):
+    return list(self.scanner_class(source))
 
   def test_empty(self):
-    self.assertEqual(list(Scanner(iter(()))), [])
+    self.assertEqual(self.scan(iter(())), [])
 
   def test_fixture(self):
-    scanner = Scanner(file_iter(FIXTURE))
+    scanner = self.scanner_class(file_iter(FIXTURE))
 
     self.assertEqual(list(scanner), [
       tokens.StrToken(1, 1, "\u5929\u4e95"),
@@ -97,4 +105,133 @@ class TestLex(unittest.TestCase):
 
   def test_eof(self):
     "lex handles eof correctly"
-    self.assertEqual(list(Scanner(iter("4"))), [tokens.IntToken(1, 1, 4)])
+    self.assertEqual(self.scan(iter("4")), [tokens.IntToken(1, 1, 4)])
+
+  def test_punctuation(self):
+    "lex matches the longest punctuation"
+    for string, token_type in tokens.punctuation.items():
+      self.assertEqual(self.scan(iter(string)),
+        [tokens.Token(1, 1, token_type)])
+
+    self.assertEqual(self.scan(iter(u">>>>=^^^")), [
+      tokens.Token(1, 1, tokens.L_RSHIFT),
+      tokens.Token(1, 4, tokens.L_GTE),
+      tokens.Token(1, 6, tokens.L_XOR),
+      tokens.Token(1, 8, tokens.L_BITWISE_XOR)
+    ])
+
+  def test_interning(self):
+    "lex interns identifiers and strings"
+    first, _, second, _, third, fourth = self.scan(iter(u"name + name + 'str' 'str'"))
+    self.assertIs(first.value, second.value)
+    self.assertIs(third.value, fourth.value)
+    self.assertFalse(hasattr(first, '__dict__'))
+
+  def test_strings(self):
+    "lex handles escapes and long strings"
+    self.assertEqual(self.scan(iter(u"'a\\x41\\'\\n' \"" + u"b" * 5000 + u"\"")), [
+      tokens.StrToken(1, 1, u"aA'\n"),
+      tokens.StrToken(1, 13, u"b" * 5000)
+    ])
+    self.assertEqual(self.scan(u"'x\ny' z"), [
+      tokens.StrToken(2, 1, u"x\ny"),
+      tokens.IdToken(2, 4, u"z")
+    ])
+
+  def test_mapped(self):
+    "lex reads mapped files the same as decoded files"
+    with ByteReader(file_map(FIXTURE)) as reader:
+      self.assertEqual(self.scan(reader), self.scan(file_iter(FIXTURE)))
+    self.assertTrue(reader.data.closed)
+
+    source = u"\ufeffstring s = 'caf\u00e9 \\'\u5929';\nid_2;".encode('utf-8')
+    self.assertEqual(self.scan(ByteReader(source)), [
+      tokens.TypeToken(1, 1, types.T_STRING),
+      tokens.IdToken(1, 8, "s"),
+      tokens.Token(1, 10, tokens.L_ASSIGN),
+      tokens.StrToken(1, 12, u"caf\u00e9 '\u5929"),
+      tokens.Token(1, 22, tokens.L_SEMICOLON),
+      tokens.IdToken(2, 1, "id_2"),
+      tokens.Token(2, 5, tokens.L_SEMICOLON)
+    ])
+
+  def test_text(self):
+    "lex reads whole strings the same as decoded files"
+    with open(FIXTURE, encoding='utf-8-sig') as f:
+      text = f.read()
+    self.assertEqual(self.scan(text), self.scan(file_iter(FIXTURE)))
+    self.assertEqual(self.scan(TextReader(text)), self.scan(text))
+    with self.assertRaises(ParseError) as cm:
+      self.scan(TextReader(u"a\n  b $"))
+    self.assertEqual(cm.exception.line, 2)
+
+  def test_chunked(self):
+    "lex reads chunked files the same as decoded files"
+    expected = self.scan(file_iter(FIXTURE))
+    # small blocks split the multibyte characters in the fixture
+    for size in (1, 2, 7, 65536):
+      self.assertEqual(self.scan(ChunkReader(file_chunks(FIXTURE, size))),
+        expected)
+
+  def test_numbers(self):
+    "lex reads radix and floating point literals"
+    self.assertEqual(self.scan(iter(u"0x1F 0b101 0o17 0.5 .25 1e3 1.5e+3 0.1;")), [
+      tokens.IntToken(1, 1, 0x1f),
+      tokens.IntToken(1, 6, 5),
+      tokens.IntToken(1, 12, 15),
+      tokens.FloatToken(1, 17, 0.5),
+      tokens.FloatToken(1, 21, 0.25),
+      tokens.FloatToken(1, 25, 1000.0),
+      tokens.FloatToken(1, 29, 1500.0),
+      tokens.FloatToken(1, 36, 0.1),
+      tokens.Token(1, 39, tokens.L_SEMICOLON)
+    ])
+    self.assertEqual(self.scan(iter(u"0.5")), [tokens.FloatToken(1, 1, 0.5)])
+    self.assertEqual(self.scan(iter(u"0.5"))[0].literal_type, types.T_F32)
+    self.assertEqual(self.scan(iter(u"0.1"))[0].literal_type, types.T_F64)
+
+    # a dot followed by anything but a digit is member access
+    self.assertEqual(self.scan(iter(u"0.x 1-2")), [
+      tokens.IntToken(1, 1, 0),
+      tokens.Token(1, 2, tokens.L_DOT),
+      tokens.IdToken(1, 3, "x"),
+      tokens.IntToken(1, 5, 1),
+      tokens.Token(1, 6, tokens.L_SUB),
+      tokens.IntToken(1, 7, 2)
+    ])
+
+    self.assertEqual(self.scan(iter(u"0xffffffffffffffff"))[0].literal_type,
+      types.T_U64)
+    for source in (u"0x10000000000000000", u"0x", u"0b12", u"1e", u"9lives", u"1e999"):
+      with self.assertRaises(ParseError):
+        self.scan(iter(source))
+
+  def test_comments(self):
+    "lex skips nested comments and reports unterminated ones"
+    self.assertEqual(self.scan(iter(u"/* a /* b **/ */ x /**/\n// y\nz")), [
+      tokens.IdToken(1, 18, "x"),
+      tokens.IdToken(3, 1, "z")
+    ])
+    with self.assertRaises(ParseError):
+      self.scan(iter(u"x /* /* */"))
+
+# Scanner only, RegexScanner builds its pattern straight from tokens.punctuation
+class TestPunctuationTable(unittest.TestCase):
+
+  def test_backing_up(self):
+    "lex backs up to the last match when a longer operator falls through"
+    L_ELLIPSIS = 250
+    transitions, accepts = punctuation_table(dict(tokens.punctuation,
+      **{u'...': L_ELLIPSIS}))
+    with mock.patch.multiple('pycub.lex', punctuation_transitions=transitions,
+      punctuation_accepts=accepts):
+      self.assertEqual(list(Scanner(iter(u"a...b..c"))), [
+        tokens.IdToken(1, 1, u"a"),
+        tokens.Token(1, 2, L_ELLIPSIS),
+        tokens.IdToken(1, 5, u"b"),
+        tokens.Token(1, 6, tokens.L_DOT),
+        tokens.Token(1, 7, tokens.L_DOT),
+        tokens.IdToken(1, 8, u"c")
+      ])
+      self.assertEqual(list(Scanner(u"..")), [tokens.Token(1, 1, tokens.L_DOT),
+        tokens.Token(1, 2, tokens.L_DOT)])
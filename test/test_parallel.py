@@ -0,0 +1,133 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from ..lex import Scanner, RegexScanner
+from ..parallel import split_points, lex_parallel, statement_points, \
+  parse_parallel
+from ..parse import Parser, StackParser
+from ..tokenbuffer import TokenBuffer
+from ..bench.corpus import generate
+from ..bench import programs
+from .test_parse import PROGRAM
+
+# newlines hidden in every way the lexer allows
+TRICKY = u"""a = 1;
+/* one /* two
+  */ still // inside "
+*/ b = "multi
+line /* not a comment
+" + 'it\\'s
+// not a comment either';
+// c = "unterminated in a line comment
+/**/ d; /*/ e
+*/ f; /* x **/
+g.h(0.5, 0x1f);
+"""
+
+def scan_all(source):
+  return list(Scanner(iter(source)))
+
+class TestParallel(unittest.TestCase):
+
+  def assert_split(self, source, chunk_size):
+    points = split_points(source, chunk_size)
+    self.assertEqual(points, sorted(set(points)))
+    for point in points:
+      self.assertEqual(source[point - 1], u'\n')
+    # every piece lexes to exactly its share of the whole
+    pieces = zip([0] + points, points + [len(source)])
+    whole = [(token.line, token.offset) for token in RegexScanner(source)]
+    found = []
+    for start, end in pieces:
+      line = source.count(u'\n', 0, start) + 1
+      found.extend((token.line, token.offset)
+        for token in RegexScanner(source[start:end], line=line))
+    self.assertEqual(found, whole)
+
+  def test_split_points(self):
+    "pieces are only cut at newlines outside strings and comments"
+    for chunk_size in range(1, len(TRICKY) + 2):
+      self.assert_split(TRICKY, chunk_size)
+    points = split_points(TRICKY, 1)
+    self.assertEqual([TRICKY.count(u'\n', 0, point) for point in points],
+      [1, 7, 8, 10, 11])
+
+  def test_unterminated(self):
+    "nothing is cut after an unterminated comment or string"
+    self.assertEqual(split_points(u"a\nb\n/* c\nd\n", 1), [2, 4])
+    self.assertEqual(split_points(u"a\n'b\nc\n", 1), [2])
+
+  def test_same_tokens(self):
+    "stitched streams equal the serial token stream"
+    with ThreadPoolExecutor(4) as executor:
+      for shape in ('mixed', 'comments', 'strings'):
+        source = generate(shape, 20000, seed=3)
+        expected = scan_all(source)
+        for chunk_size in (64, 1000, 7777, 100000):
+          tokenbuffer = lex_parallel(source, chunk_size, executor=executor)
+          self.assertEqual(list(tokenbuffer), expected)
+
+      tokenbuffer = lex_parallel(TRICKY, 16, executor=executor)
+      self.assertEqual(list(tokenbuffer), scan_all(TRICKY))
+
+      tokenbuffer = lex_parallel(u"name;\n" * 3, 1, executor=executor)
+      self.assertIs(tokenbuffer.values[0], tokenbuffer.values[4])
+
+  def test_processes(self):
+    "lexing runs in worker processes"
+    source = generate('mixed', 20000, seed=5)
+    self.assertEqual(list(lex_parallel(source, 4096, workers=2)),
+      scan_all(source))
+
+class TestParseParallel(unittest.TestCase):
+
+  def test_statement_points(self):
+    "pieces start after top-level statements only"
+    buffer = TokenBuffer(Scanner(PROGRAM))
+    points = statement_points(buffer, 1)
+    # at the start of each line but the while, which might have ended a do
+    self.assertEqual([buffer.lines[point] for point in points],
+      [2, 3, 5, 6, 7, 8])
+    self.assertEqual(statement_points(buffer, len(buffer)), [])
+    # the first boundary at least chunk_size tokens past the last
+    spaced = statement_points(buffer, 30)
+    self.assertEqual(spaced, [51, 87])
+    self.assertTrue(set(spaced) <= set(points))
+    # nothing is cut past a stray closing brace
+    buffer = TokenBuffer(Scanner(u"a; } b; c;"))
+    self.assertEqual(statement_points(buffer, 1), [2])
+
+  def test_same_trees(self):
+    "the linked pieces equal a serial parse"
+    with ThreadPoolExecutor(4) as executor:
+      for chunk_size in (1, 7, 30, 1000):
+        self.assertEqual(parse_parallel(PROGRAM, chunk_size,
+          executor=executor), Parser(Scanner(PROGRAM)).parse())
+      for shape in ('flat', 'nesting'):
+        source = programs.generate(shape, 20000, depth=8)
+        self.assertEqual(parse_parallel(source, 200, executor=executor,
+          parser=StackParser), Parser(Scanner(source)).parse())
+
+  def test_errors(self):
+    "the first error is the one a serial parse raises"
+    for source in (u"a;\nb = ;\nc;\nd = );\n", u"a;\nif (b c;\nd = );\n",
+      u"a;\nb;\ndo c; d;\n", u"a;\nb = (c;\nd;\ne);\n"):
+      with self.assertRaises(Exception) as serial:
+        Parser(Scanner(source)).parse()
+      with ThreadPoolExecutor(4) as executor:
+        with self.assertRaises(type(serial.exception)) as parallel:
+          parse_parallel(source, 1, executor=executor)
+      self.assertEqual(str(parallel.exception), str(serial.exception))
+
+    # anything but a syntax error isn't parsed again
+    class BrokenPool(object):
+      def map(self, function, pieces):
+        raise OSError("pool is gone")
+    with self.assertRaises(OSError):
+      parse_parallel(TokenBuffer(Scanner(PROGRAM)), 1, executor=BrokenPool())
+
+  def test_processes(self):
+    "parsing runs in worker processes"
+    source = programs.generate('flat', 20000, seed=5)
+    self.assertEqual(parse_parallel(source, 500, workers=2),
+      Parser(Scanner(source)).parse())
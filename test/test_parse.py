@@ -1,12 +1,21 @@
-import unittest#, os.path
+import itertools, sys, unittest#, os.path
 
 from ..file_iter import file_iter
 from ..lex import Scanner
-from ..parse import Parser
+from ..parse import Parser, PrattParser, StackParser, ParseError, \
+  link_block
+from ..reader import WindowError
+from ..disambiguate import disambiguate_statement
+from ..bench import programs
+import pycub.disambiguate as disambiguate
+import pycub.expression as expression
 import pycub.statement as statement
 import pycub.tokens as tokens
 import pycub.types as types
 
+def parse_expression(parser_class, code):
+  return parser_class(Scanner(iter(code))).parse().body.value
+
 # FIXTURE = os.path.dirname(os.path.realpath(__file__)) + "/fixtures/test.cub"
 
 class TestParse(unittest.TestCase):
@@ -14,6 +23,43 @@ class TestParse(unittest.TestCase):
   def test_empty(self):
     self.assertEqual(Parser(Scanner(iter(()))).parse(), statement.BlockStatement(None))
 
+  def test_window(self):
+    "parser reads through a bounded window"
+    self.assertEqual(Parser(Scanner(iter(())), window=4).parse(),
+      statement.BlockStatement(None))
+    parser = Parser(Scanner(iter("Type(Type()) fn;")), window=8)
+    self.assertEqual(disambiguate_statement(parser), disambiguate.G_DEFINE)
+    with self.assertRaises(WindowError):
+      disambiguate_statement(Parser(Scanner(iter("Type(Type()) fn;")), window=4))
+
+  def test_iter_statements(self):
+    "top-level statements come out one at a time, before later input is read"
+    parsed = Parser(Scanner(PROGRAM)).parse()
+    for parser_class in (Parser, StackParser):
+      statements = list(parser_class(Scanner(PROGRAM)).iter_statements())
+      self.assertEqual(len(statements), 7)
+      self.assertFalse(any(hasattr(found, 'next') for found in statements))
+      self.assertEqual(link_block(statements), parsed)
+
+    def source():
+      yield u"a = 1;\n"
+      yield u"if (a) { b; }\n"
+      raise AssertionError("read too far")
+    statements = Parser(Scanner(itertools.chain.from_iterable(source()))
+      ).iter_statements()
+    self.assertIsInstance(next(statements), statement.ExpressionStatement)
+
+  def test_unsupported(self):
+    "statements that aren't parsed yet are syntax errors"
+    for code in (u"return x;", u"for (;;) x;", u"let x = 1;", u"class A {}",
+      u"if (a) { break; }"):
+      for parser_class in (Parser, PrattParser, StackParser):
+        with self.assertRaises(ParseError):
+          parser_class(Scanner(code)).parse()
+    # they're still identifiers elsewhere
+    self.assertIsInstance(Parser(Scanner(u"a = return;")).parse().body,
+      statement.ExpressionStatement)
+
   def test_print(self):
     # TODO: add expressions
     one = None # expression.LiteralExpression(types.T_U8, 1)
@@ -24,3 +70,85 @@ class TestParse(unittest.TestCase):
 
     # test assignment associativity
     self.assertEqual(Parser(Scanner(iter("a = b = 1;"))).parse(), None)
+
+class TestPratt(unittest.TestCase):
+
+  def test_same_trees(self):
+    "the Pratt parser agrees with precedence climbing"
+    for code in EXPRESSIONS:
+      self.assertEqual(parse_expression(PrattParser, code),
+        parse_expression(Parser, code), code)
+
+  def test_associativity(self):
+    "binary operators group left, assignments group right"
+    a, b, c = (expression.GetSymbolNode(name) for name in u"abc")
+    self.assertEqual(parse_expression(PrattParser, "a - b - c;"),
+      expression.OperatorNode(tokens.L_SUB,
+        expression.OperatorNode(tokens.L_SUB, a, b), c))
+    self.assertEqual(parse_expression(PrattParser, "a = b = c;"),
+      expression.OperatorNode(tokens.L_ASSIGN, a,
+        expression.OperatorNode(tokens.L_ASSIGN, b, c)))
+
+EXPRESSIONS = ("a = b = c + d * e - f / g % h;",
+  "x << 2 >> 1 | y & z ^ w == v != u && t || s;",
+  "-a.b(c, d)[e]++ + !f - ~g--;", "++a + (b + c) * --d;",
+  "f(g(h(x)), (y), 1)[2].z;", "a += b -= c * (d = e);",
+  "1 + 2.5 * 'three';")
+
+PROGRAM = u"""a = b * (c + d)[e](f, g.h++, -i);
+if (a) { b; c(d); } else if (e) f; else { { g; } }
+if (a) if (b) c; else d;
+while (x < 10) x += 1;
+do { y--; ; } while (!y);
+{}
+;
+z = ~(q) - --r;
+"""
+
+class TestStackParser(unittest.TestCase):
+
+  def test_same_trees(self):
+    "the explicit stack parser agrees with the recursive parsers"
+    for code in EXPRESSIONS + (PROGRAM,):
+      expected = Parser(Scanner(iter(code))).parse()
+      self.assertEqual(StackParser(Scanner(iter(code))).parse(), expected)
+      self.assertEqual(PrattParser(Scanner(iter(code))).parse(), expected)
+    self.assertNotEqual(StackParser(Scanner(iter(PROGRAM + u"z;"))).parse(),
+      Parser(Scanner(iter(PROGRAM))).parse())
+
+  def test_hashable(self):
+    "tree nodes hash by identity"
+    tree = StackParser(Scanner(u"a = b + c; if (a) d;")).parse()
+    nodes = {tree: 1, tree.body: 2, tree.body.value: 3}
+    self.assertEqual(nodes[tree.body.value], 3)
+    self.assertEqual(len(nodes), 3)
+
+  def test_deep(self):
+    "nesting is bounded by memory rather than the recursion limit"
+    depth = sys.getrecursionlimit() * 2
+    for code in (u"(" * depth + u"x" + u")" * depth + u";",
+      u"-!~" * depth + u"x;", u"a" + u" = a" * depth + u";",
+      u"a" + u"[b" * depth + u"]" * depth + u";",
+      u"if (x) " * depth + u"y;", u"{" * depth + u"}" * depth,
+      u"do " * depth + u"x;" + u" while (y);" * depth,
+      u"x = " + u"f(" * depth + u"y" + u")" * depth + u";"):
+      tree = StackParser(Scanner(code)).parse()
+      self.assertEqual(tree, StackParser(Scanner(code)).parse())
+      self.assertNotEqual(tree, StackParser(Scanner(u"x;" + code)).parse())
+      with self.assertRaises(RecursionError):
+        Parser(Scanner(code)).parse()
+
+    block = StackParser(Scanner(u"{" * depth + u"}" * depth)).parse()
+    for _ in range(depth):
+      block = block.body
+    self.assertEqual(block, statement.BlockStatement(None))
+    self.assertIsNone(block.body)
+
+  def test_programs(self):
+    "generated benchmark programs parse the same with every engine"
+    for shape in sorted(programs.shapes):
+      code = programs.generate(shape, 2000, seed=1, depth=20)
+      expected = Parser(Scanner(code)).parse()
+      self.assertIsNotNone(expected.body)
+      self.assertEqual(PrattParser(Scanner(code)).parse(), expected)
+      self.assertEqual(StackParser(Scanner(code)).parse(), expected)
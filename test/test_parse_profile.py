@@ -0,0 +1,89 @@
+import io, unittest
+
+from ..lex import Scanner
+from ..parse import Parser, PrattParser, StackParser
+from ..tokenbuffer import TokenBuffer
+import pycub.disambiguate as disambiguate
+import pycub.parse as parse
+import pycub.parse_profile as parse_profile
+
+PROGRAM = u"""a = b * (c + d);
+if (a) {
+  b;
+  c(d);
+} else e;
+while (x < 10) x += 1;
+"""
+
+class TestParseProfile(unittest.TestCase):
+
+  def test_counts(self):
+    "productions are counted and timed inside the block"
+    expected = Parser(Scanner(PROGRAM)).parse()
+    with parse_profile.Profile() as profile:
+      self.assertEqual(Parser(Scanner(PROGRAM)).parse(), expected)
+
+    calls, cumulative, own, tokens = profile.productions['Parser.parse_if']
+    self.assertEqual(calls, 1)
+    self.assertGreaterEqual(cumulative, own)
+    self.assertEqual(tokens, 15)
+    self.assertEqual(profile.productions['Parser.parse'][3], 36)
+    self.assertEqual(profile.productions['disambiguate_statement'][0], 5)
+    self.assertIn(('Parser.parse_if', 2, 5), profile.lines)
+
+    output = io.StringIO()
+    profile.report(output, sort='calls')
+    self.assertIn("Parser.parse_if", output.getvalue())
+    self.assertRaises(ValueError, profile.rows, 'speed')
+
+    output = io.StringIO()
+    profile.collapsed(output)
+    for line in output.getvalue().splitlines():
+      path, weight = line.rsplit(' ', 1)
+      self.assertTrue(path.startswith('Parser.parse'))
+      self.assertGreater(int(weight), 0)
+
+  def test_nested(self):
+    "nested calls of a production don't count their tokens again"
+    source = u"if (a) { if (b) c; }\nx = ((y));\n"
+    with parse_profile.Profile() as profile:
+      Parser(Scanner(source)).parse()
+    # the outer if, from after its keyword to the end of the first line
+    self.assertEqual(profile.productions['Parser.parse_if'][0], 2)
+    self.assertEqual(profile.productions['Parser.parse_if'][3], 11)
+    self.assertEqual(profile.productions['Parser.parse'][3], 20)
+    for name, entry in profile.productions.items():
+      self.assertLessEqual(entry[3], 20, name)
+
+  def test_engines(self):
+    "every engine and reader parses the same with profiling on"
+    for parser_class in (Parser, PrattParser, StackParser):
+      expected = parser_class(Scanner(PROGRAM)).parse()
+      with parse_profile.Profile() as profile:
+        self.assertEqual(parser_class(Scanner(PROGRAM)).parse(), expected)
+        self.assertEqual(parser_class(TokenBuffer(Scanner(PROGRAM))).parse(),
+          expected)
+        self.assertEqual(parser_class(Scanner(PROGRAM), window=16).parse(),
+          expected)
+      # the if statement, whichever production parsed it
+      self.assertIn((2, 5), [key[1:] for key in profile.lines])
+    self.assertIn('StackParser.parse_binding', profile.productions)
+
+  def test_restored(self):
+    "the parser is left as it was afterwards"
+    parse_if = Parser.parse_if
+    statement = disambiguate.disambiguate_statement
+    table = list(parse.infix_table)
+    profile = parse_profile.Profile()
+    profile.start()
+    self.assertIsNot(Parser.parse_if, parse_if)
+    self.assertRaises(RuntimeError, parse_profile.Profile().start)
+    profile.stop()
+
+    self.assertIsNone(parse_profile.active)
+    self.assertIs(Parser.parse_if, parse_if)
+    self.assertIs(disambiguate.disambiguate_statement, statement)
+    self.assertEqual(parse.infix_table, table)
+    # nothing is recorded afterwards
+    Parser(Scanner(PROGRAM)).parse()
+    self.assertEqual(profile.productions, {})
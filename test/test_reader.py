@@ -1,6 +1,7 @@
-import unittest
+import mmap, unittest
 
-from ..reader import Reader, CharReader
+from ..reader import Reader, CursorReader, WindowedReader, WindowError, \
+  CharReader, ByteReader, ChunkReader, TextReader
 
 class ExampleException(Exception):
   def __init__(self, message, expected):
@@ -21,21 +22,23 @@ class SampleObj(object):
     self.value = value
 
 class TestReader(unittest.TestCase):
+  # the subclasses below run these against the other readers
+  reader_class = Reader
 
   def test_basic(self):
     "reader reads and terminates"
-    self.assertIsNone(Reader(iter(())).pop())
-    self.assertEqual(list(Reader(iter(()))), [])
+    self.assertIsNone(self.reader_class(iter(())).pop())
+    self.assertEqual(list(self.reader_class(iter(()))), [])
 
-    self.assertEqual(list(Reader(iter('hello'))), list('hello'))
+    self.assertEqual(list(self.reader_class(iter('hello'))), list('hello'))
     items = [{'a': 1}, {'b': 1}]
-    self.assertEqual(list(Reader(iter(items))), items)
+    self.assertEqual(list(self.reader_class(iter(items))), items)
 
   def test_peek(self):
     "reader can peek without advancing"
-    self.assertIsNone(Reader(iter(())).peek())
+    self.assertIsNone(self.reader_class(iter(())).peek())
 
-    reader = Reader(iter('hello'))
+    reader = self.reader_class(iter('hello'))
     self.assertEqual(reader.peek(), 'h')
     self.assertEqual(reader.peek(), 'h')
     self.assertEqual(reader.pop(), 'h')
@@ -44,7 +47,7 @@ class TestReader(unittest.TestCase):
 
   def test_seek(self):
     "reader can seek back and forth"
-    reader = Reader(iter('hello'))
+    reader = self.reader_class(iter('hello'))
     reader.pop()
     reader.push('h')
     reader.push(None)
@@ -53,7 +56,7 @@ class TestReader(unittest.TestCase):
 
   def test_lookahead(self):
     "reader is independent of lookahead"
-    reader = Reader(iter('hello'))
+    reader = self.reader_class(iter('hello'))
     lookahead = reader.lookahead()
     self.assertEqual(list(lookahead), list('hello'))
     self.assertEqual(reader.pop(), 'h')
@@ -61,25 +64,25 @@ class TestReader(unittest.TestCase):
     self.assertEqual(list(lookahead), list('ello'))
     self.assertEqual(list(reader), list('ello'))
 
-    reader = Reader(iter('hello'))
+    reader = self.reader_class(iter('hello'))
     lookahead = reader.lookahead()
     self.assertEqual(lookahead.peek(), 'h')
     self.assertEqual(lookahead.next(), 'h')
     self.assertEqual(list(reader), list('hello'))
 
-    reader = Reader(iter('hello'))
+    reader = self.reader_class(iter('hello'))
     reader.peek()
     lookahead = reader.lookahead()
     self.assertEqual(lookahead.peek(), 'h')
     self.assertEqual(lookahead.peek(), 'h')
     self.assertEqual(lookahead.next(), 'h')
 
-    reader = Reader(iter(()))
+    reader = self.reader_class(iter(()))
     lookahead = reader.lookahead()
     self.assertEqual(list(lookahead), [])
 
   def test_matcher(self):
-    reader = Reader(iter('hello'), fail=example_fail)
+    reader = self.reader_class(iter('hello'), fail=example_fail)
     self.assertEqual(reader.accept('h'), 'h')
     self.assertIsNone(reader.accept('h'))
     self.assertEqual(reader.peek(), 'e')
@@ -90,7 +93,7 @@ class TestReader(unittest.TestCase):
     # failed expect doesn't screw up state
     self.assertEqual(reader.pop(), 'l')
 
-    reader = Reader(iter(()), fail=example_fail)
+    reader = self.reader_class(iter(()), fail=example_fail)
     self.assertIsNone(reader.accept(1))
     self.assertIsNone(reader.accept(None))
     with self.assertRaises(ExampleException) as cm:
@@ -103,11 +106,11 @@ class TestReader(unittest.TestCase):
       reader.expect_terminated('z')
     self.assertEqual(cm.exception.expected, None)
 
-    reader = Reader(iter(()), matches=lambda a, b: a['a'] == b)
+    reader = self.reader_class(iter(()), matches=lambda a, b: a['a'] == b)
     self.assertIsNone(reader.accept(1))
     self.assertIsNone(reader.accept(None))
 
-    reader = Reader(iter(({'a': 4}, {'a': 3}, {'a': 1}, {'a': 1}, {'a': 0})), matches=lambda a, b: a['a'] == b['a'], fail=example_fail)
+    reader = self.reader_class(iter(({'a': 4}, {'a': 3}, {'a': 1}, {'a': 1}, {'a': 0})), matches=lambda a, b: a['a'] == b['a'], fail=example_fail)
     self.assertIsNone(reader.accept({'a': 3}))
     self.assertEqual(reader.accept({'a': 4}), {'a': 4})
     with self.assertRaises(ExampleException) as cm:
@@ -115,7 +118,7 @@ class TestReader(unittest.TestCase):
     self.assertEqual(cm.exception.expected, {'a': 4})
     self.assertEqual(reader.expect({'a': 3}), {'a': 3})
 
-    reader = Reader(alphabet(), fail=example_fail)
+    reader = self.reader_class(alphabet(), fail=example_fail)
     self.assertEqual(reader.accept('a', 'b'), ['a', 'b']);
     self.assertEqual(reader.accept('d', 'c'), None);
     self.assertEqual(reader.peek(), 'c')
@@ -125,7 +128,7 @@ class TestReader(unittest.TestCase):
       reader.expect('e', 'f', 'g')
     self.assertEqual(cm.exception.expected, 'e')
 
-    reader = Reader(alphabet(), fail=example_fail)
+    reader = self.reader_class(alphabet(), fail=example_fail)
     self.assertIsNone(reader.accept_terminated('z'))
     self.assertIsNone(reader.accept_terminated('c'))
     self.assertEqual(reader.peek(), 'a')
@@ -162,18 +165,18 @@ class TestReader(unittest.TestCase):
       reader.expect_terminated('k', faker_parse)
     self.assertEqual(cm.exception.expected, faker_parse)
 
-    reader = Reader(iter(()))
+    reader = self.reader_class(iter(()))
     with self.assertRaises(Exception):
       reader.expect(0)
 
-    reader = Reader(iter(()), fail="some message")
+    reader = self.reader_class(iter(()), fail="some message")
     with self.assertRaises(Exception) as cm:
       reader.expect(0)
 
     self.assertEqual(str(cm.exception), "some message")
 
     samp = SampleObj(4), SampleObj(3), SampleObj(1), SampleObj(1), SampleObj(0)
-    reader = Reader(iter(samp), matches="value")
+    reader = self.reader_class(iter(samp), matches="value")
     reader.expect(4)
     reader.expect(3)
     reader.expect(1)
@@ -181,6 +184,77 @@ class TestReader(unittest.TestCase):
     reader.expect(0)
     self.assertIsNone(reader.pop())
 
+class TestCursorReader(TestReader):
+  "runs the Reader tests against CursorReader"
+
+  reader_class = CursorReader
+
+  def test_marks(self):
+    "cursor rewinds to marks and drops what it no longer needs"
+    reader = CursorReader(alphabet())
+    reader.drop_after = 4
+    mark = reader.mark()
+    self.assertEqual(reader.accept('a', 'b', 'c', 'd', 'e'), list('abcde'))
+    inner = reader.mark()
+    self.assertEqual(reader.pop(), 'f')
+    reader.reset(inner)
+    self.assertEqual(reader.peek(), 'f')
+    reader.reset(mark)
+    self.assertEqual(reader.pop(), 'a')
+
+    mark = reader.mark()
+    self.assertEqual(list(reader.lookahead())[:2], ['b', 'c'])
+    reader.commit(mark)
+    self.assertEqual(reader.expect('b', 'c', 'd'), list('bcd'))
+    # nothing is live any more, so the consumed prefix goes
+    self.assertEqual(reader.pop(), 'e')
+    self.assertEqual(reader.items[reader.index], 'f')
+    self.assertLess(reader.index, 4)
+
+    def bad_parse():
+      reader.expect('f')
+      return True
+    with self.assertRaises(Exception):
+      reader.expect_terminated('z', bad_parse)
+    self.assertEqual(reader.peek(), 'f')
+    self.assertEqual(reader.marks, 0)
+
+class TestWindowedReader(TestReader):
+  "runs the Reader tests against WindowedReader"
+
+  reader_class = WindowedReader
+
+  def test_window(self):
+    "windowed reader holds a bounded number of items"
+    reader = WindowedReader(iter(range(1, 10 ** 6)), window=4)
+    for expected in range(1, 1000):
+      self.assertEqual(reader.lookahead().peek(), expected)
+      self.assertEqual(reader.pop(), expected)
+    # nothing behind the reader is held on to
+    self.assertEqual(sum(item is not None for item in reader.ring), 0)
+
+    mark = reader.mark()
+    self.assertEqual(reader.accept(1000, 1001, 1002, 1003),
+      [1000, 1001, 1002, 1003])
+    # the mark pins 1000, so there's no room for 1004
+    with self.assertRaises(WindowError):
+      reader.peek()
+    reader.reset(mark)
+    self.assertEqual(reader.accept(1000, 1001), [1000, 1001])
+    reader.push(1001)
+    self.assertEqual(reader.pop(), 1001)
+
+    lookahead = reader.lookahead()
+    self.assertEqual([lookahead.next() for _ in range(4)],
+      [1002, 1003, 1004, 1005])
+    with self.assertRaises(WindowError) as cm:
+      lookahead.next()
+    self.assertEqual(cm.exception.window, 4)
+    # 1005 took the place of 1001
+    with self.assertRaises(WindowError):
+      reader.push(1001)
+    self.assertEqual(reader.pop(), 1002)
+
 class TestCharReader(unittest.TestCase):
 
   def test_pos(self):
@@ -217,6 +291,20 @@ class TestCharReader(unittest.TestCase):
     assert_pos(1, 3)
     self.assertIsNone(reader.pop())
 
+  def test_take(self):
+    "character readers take runs off the iterator and keep their position"
+    reader = CharReader(iter(u"ab\nc d\n\nef"))
+    self.assertEqual(reader.take_until(frozenset(u' ')), u'ab\nc')
+    self.assertEqual((reader.line, reader.offset), (2, 2))
+    self.assertEqual(reader.take_while(frozenset(u' ')), u' ')
+    reader.push(reader.pop())
+    self.assertEqual(reader.take_until(frozenset(u'f')), u'd\n\ne')
+    self.assertEqual((reader.line, reader.offset), (4, 2))
+    self.assertEqual(reader.take_while(frozenset(u'f')), u'f')
+    self.assertEqual(reader.take_until(frozenset(u'x')), u'')
+    self.assertEqual((reader.line, reader.offset), (4, 3))
+    self.assertIsNone(reader.pop())
+
   def test_consume_line(self):
     reader = CharReader(iter(u"some silly\n\nlittle file thin\ng\nasdf"))
 
@@ -236,3 +324,134 @@ class TestCharReader(unittest.TestCase):
     assert_pos(5, 5)
 
     self.assertEqual(list(reader), [])
+
+  def test_consume_comment(self):
+    "all readers skip nested block comments and line comments alike"
+    source = u"a /* b /* \u5929\n*/ c **/ d\n// e\n/*/ f */x // g"
+    readers = [
+      lambda: CharReader(iter(source)),
+      lambda: TextReader(source),
+      lambda: ByteReader(source.encode('utf-8')),
+      lambda: ChunkReader([source])
+    ] + [
+      lambda size=size: ChunkReader(source[i:i + size]
+        for i in range(0, len(source), size))
+      for size in (1, 2, 3, 5)
+    ]
+
+    for make_reader in readers:
+      reader = make_reader()
+
+      def assert_pos(line, offset):
+        self.assertEqual((reader.line, reader.offset), (line, offset))
+
+      self.assertEqual(reader.take_until(frozenset(u'*')), u'a /')
+      reader.pop()
+      self.assertTrue(reader.consume_comment())
+      assert_pos(2, 9)
+      self.assertEqual(reader.pop(), u' ')
+      self.assertEqual(reader.pop(), u'd')
+      reader.consume_line()
+      reader.consume_line()
+      assert_pos(4, 1)
+      reader.pop()
+      reader.pop()
+      self.assertTrue(reader.consume_comment())
+      assert_pos(4, 9)
+      self.assertEqual(reader.pop(), u'x')
+      reader.consume_line()
+      assert_pos(4, 15)
+      self.assertIsNone(reader.peek())
+
+      reader = make_reader()
+      for _ in range(3): reader.consume_line()
+      self.assertFalse(reader.consume_comment())
+      assert_pos(4, 15)
+
+class TestByteReader(unittest.TestCase):
+
+  def test_pos(self):
+    reader = ByteReader(u"ab\u5929\nc\U0001f600d".encode('utf-8'))
+
+    def assert_pos(line, offset):
+      self.assertEqual(reader.line, line)
+      self.assertEqual(reader.offset, offset)
+
+    self.assertEqual(reader.take_while(frozenset(u'ab')), u'ab')
+    assert_pos(1, 3)
+    self.assertEqual(reader.peek(), u'\u5929')
+    self.assertEqual(reader.pop(), u'\u5929')
+    reader.push(u'\u5929')
+    assert_pos(1, 3)
+    self.assertEqual(reader.take_until(frozenset(u'd')), u'\u5929\nc\U0001f600')
+    assert_pos(2, 3)
+    self.assertEqual(list(reader), [u'd'])
+    self.assertIsNone(reader.pop())
+
+  def test_bom(self):
+    reader = ByteReader(b'\xef\xbb\xbfhi')
+    self.assertEqual(list(reader.lookahead()), list(u'hi'))
+    self.assertEqual(list(reader), list(u'hi'))
+
+  def test_close(self):
+    "byte readers close the data under them"
+    with ByteReader(b'hi') as reader:
+      self.assertEqual(reader.pop(), u'h')
+    data = mmap.mmap(-1, 2)
+    data.write(b'hi')
+    with ByteReader(data) as reader:
+      self.assertEqual(list(reader), list(u'hi'))
+    self.assertTrue(data.closed)
+
+class TestChunkReader(unittest.TestCase):
+
+  def test_chunks(self):
+    reader = ChunkReader([u'ab', u'', u'c\nd', u'ddx'])
+
+    def assert_pos(line, offset):
+      self.assertEqual(reader.line, line)
+      self.assertEqual(reader.offset, offset)
+
+    self.assertEqual(reader.pop(), u'a')
+    self.assertEqual(reader.pop(), u'b')
+    self.assertEqual(reader.pop(), u'c')
+    # pushing back past the start of the current chunk
+    reader.push(u'c')
+    reader.push(u'b')
+    assert_pos(1, 2)
+    self.assertEqual(reader.take_while(frozenset(u'bc')), u'bc')
+    self.assertEqual(reader.pop(), u'\n')
+    self.assertEqual(reader.take_while(frozenset(u'd')), u'ddd')
+    assert_pos(2, 4)
+    self.assertEqual(list(reader.lookahead()), [u'x'])
+    self.assertEqual(list(reader), [u'x'])
+    self.assertIsNone(reader.peek())
+
+class TestTextReader(unittest.TestCase):
+
+  def test_pos(self):
+    "text reader computes positions on demand and pushes back over lines"
+    reader = TextReader(u"ab\n\ncd\n")
+
+    def assert_pos(line, offset):
+      self.assertEqual((reader.line, reader.offset), (line, offset))
+
+    assert_pos(1, 1)
+    self.assertEqual(reader.take_until(frozenset(u'c')), u'ab\n\n')
+    assert_pos(3, 1)
+    reader.push(u'\n')
+    reader.push(u'\n')
+    assert_pos(1, 3)
+    self.assertEqual(reader.pop(), u'\n')
+    assert_pos(2, 1)
+    reader.consume_line()
+    self.assertEqual(list(reader.lookahead()), list(u'cd\n'))
+    assert_pos(3, 1)
+    self.assertEqual(reader.pop(), u'c')
+    # items that aren't from the text still go in front
+    reader.push(u'x')
+    assert_pos(3, 1)
+    self.assertEqual(list(reader), list(u'xd\n'))
+    assert_pos(4, 1)
+    self.assertIsNone(reader.pop())
+    assert_pos(4, 1)
@@ -0,0 +1,27 @@
+from ..lex import RegexScanner, Scanner
+from . import test_lex
+import pycub.tokens as tokens
+
+class TestRegexLex(test_lex.TestLex):
+  "runs the Scanner tests against the regex engine"
+
+  scanner_class = RegexScanner
+
+  def test_same_tokens(self):
+    "regex engine matches the scanner"
+    source = u"a>>>=b>>=c>>>d>>e^^f^=g;\n/* x /* y */\n*/ 'multi\nline' 0. 12;"
+    self.assertEqual(list(RegexScanner(source)), list(Scanner(iter(source))))
+
+  def test_positions(self):
+    "regex engine tracks lines past comments and strings"
+    self.assertEqual(list(RegexScanner(u"x\n// c\n  y\n")), [
+      tokens.IdToken(1, 1, "x"),
+      tokens.IdToken(3, 3, "y")
+    ])
+
+  def test_radix(self):
+    "regex engine reads hex and binary literals"
+    self.assertEqual(list(RegexScanner(u"0x1F 0b101")), [
+      tokens.IntToken(1, 1, 0x1f),
+      tokens.IntToken(1, 6, 5)
+    ])
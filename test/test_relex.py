@@ -0,0 +1,86 @@
+import random, unittest
+
+from ..lex import RegexScanner, Scanner
+from ..parse import ParseError
+from ..relex import IncrementalLexer
+
+SOURCE = u"""u8 b = 4 + (3 / (2 - 1) * 4);
+/* a /* nested */ comment
+ */ b += 3; // trailing
+string q = "multi
+line" # 'x';
+c >>>= d;
+"""
+
+class TestIncrementalLexer(unittest.TestCase):
+
+  def assert_synced(self, lexer):
+    self.assertEqual(lexer.tokens, list(RegexScanner(lexer.source)))
+
+  def test_edits(self):
+    "relex matches a full lex after an edit"
+    lexer = IncrementalLexer(SOURCE)
+    self.assert_synced(lexer)
+
+    # typing inside an identifier only re-scans that token
+    at = SOURCE.index(u'b +=')
+    index, removed, added = lexer.edit(at, at + 1, u'bee')
+    self.assertEqual((removed, len(added)), (1, 1))
+    self.assert_synced(lexer)
+
+    # commenting out the first line, then uncommenting it again
+    end = lexer.source.index(u'\n')
+    lexer.edit(end, end, u' */')
+    lexer.edit(0, 0, u'/*')
+    self.assert_synced(lexer)
+    lexer.edit(0, 2, u'')
+    lexer.edit(end, end + 3, u'')
+    self.assert_synced(lexer)
+
+    # closing a string early
+    at = lexer.source.index(u'multi')
+    lexer.edit(at, at, u'"; "')
+    self.assert_synced(lexer)
+
+  def test_numbers(self):
+    "relex backs up over a number whose fraction an edit completes"
+    lexer = IncrementalLexer(u"x = 1.a;")
+    lexer.edit(6, 7, u'5')
+    self.assertEqual(lexer.tokens, list(Scanner(u"x = 1.5;")))
+
+  def test_random_edits(self):
+    "relex survives random edits"
+    for chunk_size in (512, 3):
+      self.random_edits(chunk_size)
+
+  def random_edits(self, chunk_size):
+    rng = random.Random(4)
+    pieces = [u'a', u'1', u' ', u'\n', u'/*', u'*/', u'"', u'>', u'=', u';',
+      u'//', u'(', u'.', u'5', u'e', u'+']
+    lexer = IncrementalLexer(SOURCE * 3, chunk_size=chunk_size)
+    for _ in range(300):
+      start = rng.randrange(len(lexer.source) + 1)
+      end = min(len(lexer.source), start + rng.randrange(3))
+      replacement = u''.join(rng.choice(pieces) for _ in range(rng.randrange(3)))
+      source = lexer.source[:start] + replacement + lexer.source[end:]
+      try:
+        expected = list(RegexScanner(source))
+      except (ParseError, NotImplementedError):
+        continue
+      lexer.edit(start, end, replacement)
+      self.assertEqual(lexer.tokens, expected)
+
+  def test_chunks(self):
+    "relex only rewrites the chunks around an edit"
+    lexer = IncrementalLexer(u"a;\n" * 1000, chunk_size=16)
+    chunks = len(lexer.texts)
+    self.assertGreater(chunks, 100)
+    tail = lexer.chunk_tokens[-1]
+
+    lexer.edit(0, 0, u'b\n\n')
+    # lines further down are only renumbered when they're looked at
+    self.assertIs(lexer.chunk_tokens[-1], tail)
+    self.assertEqual(tail[-1].line, 1000)
+    self.assertEqual(lexer.token(len(lexer) - 1).line, 1002)
+    self.assertLessEqual(len(lexer.texts), chunks + 1)
+    self.assert_synced(lexer)
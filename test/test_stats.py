@@ -0,0 +1,55 @@
+import io, unittest
+
+from ..lex import Scanner
+from ..parse import Parser
+from ..reader import Reader, ByteReader, TextReader
+from ..disambiguate import disambiguate_statement
+import pycub.stats as stats
+
+class TestStats(unittest.TestCase):
+
+  def test_counts(self):
+    "stats count reader and scanner activity inside the block"
+    output = io.StringIO()
+    with stats.Stats(output) as counts:
+      reader = Reader(iter('hello'))
+      self.assertEqual(reader.accept('h', 'x'), None)
+      reader.push(reader.pop())
+      lookahead = reader.lookahead()
+      self.assertEqual([lookahead.next(), lookahead.next()], ['h', 'e'])
+      self.assertEqual(list(Scanner(iter(u"abc + 12;"))),
+        list(Scanner(u"abc + 12;")))
+
+    # a multi-argument accept counts once
+    self.assertEqual(counts.counts['Reader', 'accept miss'], 1)
+    self.assertEqual(counts.counts['Reader', 'accept hit'], 0)
+    self.assertEqual(counts.callers['test_counts', 'accept miss'], 1)
+    self.assertEqual(counts.counts['Reader', 'push'], 1)
+    self.assertEqual(counts.callers['test_counts', 'lookahead'], 1)
+    self.assertEqual(counts.lookahead_depth, 2)
+    self.assertEqual(counts.tokens, 8)
+    self.assertGreaterEqual(counts.chars, 16)
+    self.assertIn("tokens 8", output.getvalue())
+
+    # nothing is counted afterwards
+    self.assertIsNone(stats.active)
+    self.assertIs(type(Reader(iter(()))), Reader)
+    Reader(iter('a')).pop()
+    self.assertEqual(counts.counts['Reader', 'pop'], 2)
+
+  def test_comments(self):
+    "stats count the characters skipped inside comments"
+    source = u"a /* b /* c */ */ d // e\nf"
+    for make_reader in (iter, str, TextReader,
+      lambda text: ByteReader(text.encode('utf-8'))):
+      with stats.Stats(io.StringIO()) as counts:
+        self.assertEqual(len(list(Scanner(make_reader(source)))), 3)
+      self.assertEqual(counts.chars, len(source))
+
+  def test_parser(self):
+    "stats find the parser functions that backtrack"
+    with stats.Stats(io.StringIO()) as counts:
+      disambiguate_statement(Parser(Scanner(iter(u"Type(Type()) fn;"))))
+    self.assertEqual(counts.counts['CursorReader', 'lookahead'], 1)
+    self.assertEqual(counts.callers['disambiguate_statement', 'lookahead'], 1)
+    self.assertGreater(counts.lookahead_depth, 4)
@@ -0,0 +1,56 @@
+import unittest, os.path
+
+from ..file_iter import file_iter
+from ..lex import Scanner
+from ..parse import Parser
+from ..tokenbuffer import TokenBuffer
+from ..disambiguate import disambiguate_statement
+import pycub.disambiguate as disambiguate
+import pycub.statement as statement
+import pycub.tokens as tokens
+
+FIXTURE = os.path.dirname(os.path.realpath(__file__)) + "/fixtures/test.cub"
+
+def buffer(code):
+  return TokenBuffer(Scanner(iter(code)))
+
+class TestTokenBuffer(unittest.TestCase):
+
+  def test_round_trip(self):
+    "buffer rebuilds the tokens it was given"
+    expected = list(Scanner(file_iter(FIXTURE)))
+    tokenbuffer = TokenBuffer(expected)
+    self.assertEqual(len(tokenbuffer), len(expected))
+    self.assertEqual(list(tokenbuffer), expected)
+    self.assertEqual(tokenbuffer.lines[-1], 18)
+
+  def test_cursor(self):
+    "cursor matches token types"
+    cursor = buffer(u"a ( b ) ;").cursor()
+    self.assertEqual(cursor.peek_type(), tokens.L_IDENTIFIER)
+    self.assertIsNone(cursor.accept(tokens.L_OPEN_PAREN))
+    self.assertIsNone(cursor.accept(tokens.L_IDENTIFIER, tokens.L_IDENTIFIER))
+    self.assertEqual(cursor.index, 0)
+    self.assertEqual(cursor.accept(tokens.L_IDENTIFIER).value, "a")
+    self.assertEqual(len(cursor.expect(tokens.L_OPEN_PAREN,
+      tokens.L_IDENTIFIER)), 2)
+
+    lookahead = cursor.lookahead()
+    self.assertEqual(lookahead.next().token_type, tokens.L_CLOSE_PAREN)
+    self.assertEqual(lookahead.peek_type(), tokens.L_SEMICOLON)
+    self.assertEqual(cursor.peek_type(), tokens.L_CLOSE_PAREN)
+
+    token = cursor.pop()
+    cursor.push(token)
+    with self.assertRaises(Exception):
+      cursor.expect(tokens.L_SEMICOLON)
+    self.assertEqual(cursor.accept_terminated(tokens.L_SEMICOLON), token)
+    self.assertIsNone(cursor.pop())
+
+  def test_parser(self):
+    "parser consumes token buffers"
+    self.assertEqual(Parser(buffer(u"")).parse(), statement.BlockStatement(None))
+    self.assertEqual(disambiguate_statement(Parser(buffer(u"Type(Type()) fn;"))),
+      disambiguate.G_DEFINE)
+    self.assertEqual(disambiguate_statement(Parser(buffer(u"func(func(a + b))"))),
+      disambiguate.G_EXPRESSION)
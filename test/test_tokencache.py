@@ -0,0 +1,83 @@
+import unittest, os, os.path, tempfile
+
+from ..file_iter import file_iter
+from ..lex import Scanner
+from ..parse import Parser
+from ..tokencache import TokenCache, header
+from ..disambiguate import disambiguate_statement
+import pycub.disambiguate as disambiguate
+
+FIXTURE = os.path.dirname(os.path.realpath(__file__)) + "/fixtures/test.cub"
+
+class TestTokenCache(unittest.TestCase):
+
+  def setUp(self):
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    self.directory = directory.name
+
+  def entries(self):
+    return sorted(name for name in os.listdir(self.directory)
+      if name.endswith('.tok'))
+
+  def test_hit(self):
+    "cache returns the tokens it lexed for the same source"
+    expected = list(Scanner(file_iter(FIXTURE)))
+    cache = TokenCache(self.directory)
+    self.assertEqual(list(cache.load_file(FIXTURE)), expected)
+    self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+    cache = TokenCache(self.directory)
+    tokenbuffer = cache.load_file(FIXTURE)
+    self.assertEqual((cache.hits, cache.misses), (1, 0))
+    self.assertEqual(list(tokenbuffer), expected)
+    # interned names stay shared
+    self.assertIs(tokenbuffer.values[2], tokenbuffer.values[5])
+
+    self.assertEqual(disambiguate_statement(
+      Parser(cache.load(u"func(func(a + b))".encode('utf-8')))),
+      disambiguate.G_EXPRESSION)
+
+  def test_stale(self):
+    "entries from another lexer version or damaged entries are misses"
+    source = u"a = 1.5 + 'x';".encode('utf-8')
+    cache = TokenCache(self.directory)
+    cache.load(source)
+    cache.fingerprint = b'\0' * 20
+    self.assertIsNone(cache.get(source))
+    self.assertEqual(self.entries(), [])
+
+    cache.load(source)
+    path = os.path.join(self.directory, self.entries()[0])
+    with open(path, 'r+b') as f:
+      f.truncate(os.path.getsize(path) - 3)
+    self.assertIsNone(cache.get(source))
+    self.assertEqual(list(cache.load(source)), list(Scanner(iter(source.decode()))))
+
+    # cut off inside the columns, partway through an item
+    with open(path, 'r+b') as f:
+      f.truncate(header.size + 7)
+    self.assertIsNone(cache.get(source))
+    self.assertEqual(self.entries(), [])
+
+  def test_evict(self):
+    "cache stays under its size by dropping the least recently used entries"
+    cache = TokenCache(self.directory)
+    sources = [(u"name%d;" % index).encode('utf-8') for index in range(3)]
+    for source in sources:
+      cache.load(source)
+      # age everything written so far
+      for name in self.entries():
+        path = os.path.join(self.directory, name)
+        when = os.path.getmtime(path) - 10
+        os.utime(path, (when, when))
+    size = os.path.getsize(os.path.join(self.directory, self.entries()[0]))
+
+    # using the first one makes the second the oldest
+    cache.get(sources[0])
+    cache.max_bytes = size * 2
+    cache.evict()
+    self.assertEqual(len(self.entries()), 2)
+    self.assertIsNone(cache.get(sources[1]))
+    self.assertIsNotNone(cache.get(sources[0]))
+    self.assertIsNotNone(cache.get(sources[2]))
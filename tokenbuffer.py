@@ -0,0 +1,176 @@
+import array
+import pycub.tokens as tokens
+import pycub.types as types
+from pycub.reader import Reader
+
+# stores a token stream as parallel arrays instead of token objects, token
+# objects are only created on demand
+class TokenBuffer(object):
+  def __init__(self, source=None):
+    self.types = array.array('B')
+    self.lines = array.array('I')
+    self.offsets = array.array('I')
+    # payloads by token index: the name of identifiers, the literal_type of
+    # types and (literal_type, value) for literals
+    self.values = {}
+    if source is not None:
+      self.extend(source)
+
+  def __len__(self):
+    return len(self.types)
+
+  def __iter__(self):
+    return (self.token(index) for index in range(len(self.types)))
+
+  def append(self, token):
+    token_type = token.token_type
+    if token_type == tokens.L_IDENTIFIER:
+      self.values[len(self.types)] = token.value
+    elif token_type == tokens.L_TYPE:
+      self.values[len(self.types)] = token.literal_type
+    elif token_type == tokens.L_LITERAL:
+      self.values[len(self.types)] = \
+        (token.literal_type, getattr(token, 'value', None))
+    self.types.append(token_type)
+    self.lines.append(token.line)
+    self.offsets.append(token.offset)
+
+  def extend(self, source):
+    append = self.append
+    for token in source:
+      append(token)
+
+  # builds the token object at index
+  def token(self, index):
+    token_type = self.types[index]
+    line = self.lines[index]
+    offset = self.offsets[index]
+    if token_type == tokens.L_IDENTIFIER:
+      return tokens.IdToken(line, offset, self.values[index])
+    if token_type == tokens.L_TYPE:
+      return tokens.TypeToken(line, offset, self.values[index])
+    if token_type == tokens.L_LITERAL:
+      literal_type, value = self.values[index]
+      if literal_type == types.T_BOOL:
+        return tokens.BoolToken(line, offset, value)
+      if literal_type == types.T_STRING:
+        return tokens.StrToken(line, offset, value)
+      if types.is_int(literal_type):
+        return tokens.IntToken(line, offset, value)
+      if literal_type in types.floats:
+        return tokens.FloatToken(line, offset, value)
+      return tokens.LiteralToken(line, offset, literal_type)
+    return tokens.Token(line, offset, token_type)
+
+  def cursor(self, fail=None):
+    return TokenCursor(self, fail)
+
+class TokenLookahead(object):
+  def __init__(self, cursor):
+    self.tokens = cursor.tokens
+    self.types = cursor.types
+    self.index = cursor.index
+
+  def __iter__(self):
+    return self
+
+  def __next__(self):
+    index = self.index
+    if index >= len(self.types):
+      raise StopIteration
+    self.index = index + 1
+    return self.tokens.token(index)
+
+  def next(self):
+    return next(self)
+
+  def peek(self):
+    if self.index >= len(self.types):
+      return None
+    return self.tokens.token(self.index)
+
+  # the type of the next token, or None at the end of the stream
+  def peek_type(self):
+    if self.index >= len(self.types):
+      return None
+    return self.types[self.index]
+
+  def skip(self):
+    self.index += 1
+
+  def tell(self):
+    return self.index
+
+  def seek(self, index):
+    self.index = index
+
+# a Reader over a TokenBuffer which matches token types against the type array
+# directly, so failed matches never build token objects
+class TokenCursor(Reader):
+  def __init__(self, buffer, fail=None):
+    super(TokenCursor, self).__init__(None, fail=fail, matches='token_type')
+    self.tokens = buffer
+    self.types = buffer.types
+    # the index of the next token to be consumed
+    self.index = 0
+
+  # the position of the last consumed token, for errors at EOF
+  @property
+  def line(self):
+    return self.tokens.lines[self.index - 1] if self.index else 1
+
+  @property
+  def offset(self):
+    return self.tokens.offsets[self.index - 1] if self.index else 1
+
+  def _pop(self, raisestop=False):
+    index = self.index
+    if index >= len(self.types):
+      if raisestop: raise StopIteration
+      return None
+    self.index = index + 1
+    return self.tokens.token(index)
+
+  def peek(self):
+    if self.index >= len(self.types):
+      return None
+    return self.tokens.token(self.index)
+
+  def peek_type(self):
+    if self.index >= len(self.types):
+      return None
+    return self.types[self.index]
+
+  # only ever pushes back the token that was just popped
+  def push(self, item):
+    if item is not None:
+      self.index -= 1
+
+  def lookahead(self):
+    return TokenLookahead(self)
+
+  # number of tokens matching args from the current index
+  def _match(self, args):
+    types, index = self.types, self.index
+    count = 0
+    for token_type in args:
+      if index + count >= len(types) or types[index + count] != token_type:
+        break
+      count += 1
+    return count
+
+  def accept(self, *args):
+    count = self._match(args)
+    if count < len(args):
+      return None
+    if len(args) == 1:
+      return self._pop()
+    return [self._pop() for _ in args]
+
+  def expect(self, *args):
+    count = self._match(args)
+    if count < len(args):
+      self.fail(args[count])
+    if len(args) == 1:
+      return self._pop()
+    return [self._pop() for _ in args]
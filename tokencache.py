@@ -0,0 +1,193 @@
+import array, hashlib, marshal, mmap, os, struct, sys, tempfile
+
+import pycub.lex as lex
+import pycub.reader as reader
+import pycub.tokens as tokens
+import pycub.types as types
+from pycub.file_iter import file_map
+from pycub.reader import ByteReader
+from pycub.tokenbuffer import TokenBuffer
+
+# bump when the layout of a cache file changes
+FORMAT = 1
+
+MAGIC = b'PCTK'
+
+# magic, format, fingerprint, token count
+header = struct.Struct('<4sH20sI')
+
+# the modules whose source decides what tokens a lex produces
+lexer_modules = (lex, reader)
+
+# entries written by a lexer with different token constants describe a
+# different token stream, so the constants (and the lexer source itself) are
+# folded into every header
+def fingerprint():
+  digest = hashlib.sha1()
+  constants = sorted((name, value)
+    for module in (tokens, types)
+    for name, value in vars(module).items()
+    if name[:2] in ('L_', 'T_') and isinstance(value, int))
+  digest.update(repr((FORMAT, sys.byteorder, array.array('I').itemsize,
+    constants, sorted(tokens.punctuation.items()),
+    sorted(lex.keywordmap.items()), sorted(lex.typemap.items()))).encode('utf-8'))
+  for module in lexer_modules:
+    try:
+      with open(module.__file__, 'rb') as f:
+        digest.update(f.read())
+    except (OSError, TypeError):
+      pass
+  return digest.digest()
+
+def source_key(data):
+  return hashlib.sha256(data).hexdigest()
+
+def dump(buffer, fingerprint):
+  return b''.join([
+    header.pack(MAGIC, FORMAT, fingerprint, len(buffer)),
+    buffer.types.tobytes(),
+    buffer.lines.tobytes(),
+    buffer.offsets.tobytes(),
+    # marshal keeps shared (interned) strings shared
+    marshal.dumps(buffer.values)
+  ])
+
+# returns None if data isn't a cache file for this fingerprint
+def load(data, fingerprint):
+  if len(data) < header.size:
+    return None
+  magic, format, found, count = header.unpack_from(data)
+  if magic != MAGIC or format != FORMAT or found != fingerprint:
+    return None
+  buffer = TokenBuffer()
+  start = header.size
+  # a truncated entry can end inside the columns
+  if len(data) < start + count * sum(column.itemsize
+    for column in (buffer.types, buffer.lines, buffer.offsets)):
+    return None
+  for column in (buffer.types, buffer.lines, buffer.offsets):
+    end = start + count * column.itemsize
+    column.frombytes(data[start:end])
+    start = end
+  try:
+    buffer.values = marshal.loads(data[start:])
+  except (EOFError, ValueError, TypeError):
+    return None
+  return buffer
+
+# stores lexed token streams in a directory, one file per distinct source,
+# keeping the total size under max_bytes by evicting the least recently used
+# entries
+#
+#   cache = TokenCache('.pycub-cache')
+#   parser = Parser(cache.load_file('main.cub'))
+#
+# subclasses cache something else by overriding suffix, build, encode and
+# decode, see astcache.ASTCache
+class TokenCache(object):
+  suffix = '.tok'
+
+  def __init__(self, directory, max_bytes=64 << 20):
+    self.directory = directory
+    self.max_bytes = max_bytes
+    self.fingerprint = fingerprint()
+    self.hits = 0
+    self.misses = 0
+
+  # public api
+  def get(self, data):
+    path = self._path(source_key(data))
+    try:
+      with open(path, 'rb') as f:
+        buffer = self.decode(f.read())
+    except OSError:
+      return None
+    if buffer is None:
+      # stale or damaged, it'll be replaced on the next put
+      self._remove(path)
+      return None
+    # mtime doubles as the last use time for eviction
+    try:
+      os.utime(path)
+    except OSError:
+      pass
+    return buffer
+
+  def put(self, data, buffer):
+    os.makedirs(self.directory, exist_ok=True)
+    path = self._path(source_key(data))
+    # write to a temporary file and rename it over the entry, so concurrent
+    # builds never read a partial file
+    fd, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        f.write(self.encode(buffer))
+      os.replace(temp, path)
+    except BaseException:
+      self._remove(temp)
+      raise
+    self.evict()
+
+  # the token stream for utf-8 source data, lexing and storing it on a miss
+  def load(self, data):
+    buffer = self.get(data)
+    if buffer is not None:
+      self.hits += 1
+      return buffer
+    self.misses += 1
+    buffer = self.build(data)
+    self.put(data, buffer)
+    return buffer
+
+  def load_file(self, filename):
+    data = file_map(filename)
+    try:
+      return self.load(data)
+    finally:
+      # the token buffer holds nothing of the map
+      if isinstance(data, mmap.mmap):
+        data.close()
+
+  # removes the least recently used entries until the cache fits
+  def evict(self):
+    entries = []
+    total = 0
+    for entry in os.scandir(self.directory):
+      if not entry.name.endswith(self.suffix): continue
+      try:
+        stat = entry.stat()
+      except OSError:
+        continue
+      entries.append((stat.st_mtime, stat.st_size, entry.path))
+      total += stat.st_size
+    entries.sort()
+    for _, size, path in entries:
+      if total <= self.max_bytes: break
+      self._remove(path)
+      total -= size
+
+  def clear(self):
+    if not os.path.isdir(self.directory): return
+    for entry in os.scandir(self.directory):
+      if entry.name.endswith(self.suffix):
+        self._remove(entry.path)
+
+  # internal api
+  def build(self, data):
+    return TokenBuffer(lex.Scanner(ByteReader(data)))
+
+  def encode(self, buffer):
+    return dump(buffer, self.fingerprint)
+
+  # returns None for stale or damaged entries
+  def decode(self, data):
+    return load(data, self.fingerprint)
+
+  def _path(self, key):
+    return os.path.join(self.directory, key + self.suffix)
+
+  def _remove(self, path):
+    try:
+      os.remove(path)
+    except OSError:
+      pass
@@ -1,7 +1,5 @@
-import math
-import ctypes
+import ctypes, struct
 import pycub.types as types
-import pycub.expression as expression
 
 L_ADD                = 0
 L_ADD_ASSIGN         = 1
@@ -147,6 +145,79 @@ token_strings = {
   L_XOR: "XOR"
 }
 
+# keywords by spelling. the scanner leaves these as identifiers, and the
+# parser maps them where a statement can start
+keywordmap = {
+  u"as":       L_AS,
+  u"break":    L_BREAK,
+  u"case":     L_CASE,
+  u"class":    L_CLASS,
+  u"continue": L_CONTINUE,
+  u"do":       L_DO,
+  u"else":     L_ELSE,
+  u"extends":  L_EXTENDS,
+  u"for":      L_FOR,
+  u"if":       L_IF,
+  u"let":      L_LET,
+  u"native":   L_NATIVE,
+  u"new":      L_NEW,
+  u"return":   L_RETURN,
+  u"while":    L_WHILE
+}
+
+# punctuation by spelling, scanned by maximal munch
+punctuation = {
+  u'!': L_NOT,
+  u'!=': L_NE,
+  u'#': L_STR_CONCAT,
+  u'#=': L_STR_CONCAT_ASSIGN,
+  u'%': L_MOD,
+  u'%=': L_MOD_ASSIGN,
+  u'&': L_BITWISE_AND,
+  u'&&': L_AND,
+  u'&=': L_BITWISE_AND_ASSIGN,
+  u'(': L_OPEN_PAREN,
+  u')': L_CLOSE_PAREN,
+  u'*': L_MUL,
+  u'*=': L_MUL_ASSIGN,
+  u'+': L_ADD,
+  u'++': L_INCREMENT,
+  u'+=': L_ADD_ASSIGN,
+  u',': L_COMMA,
+  u'-': L_SUB,
+  u'--': L_DECREMENT,
+  u'-=': L_SUB_ASSIGN,
+  u'.': L_DOT,
+  u'/': L_DIV,
+  u'/=': L_DIV_ASSIGN,
+  u':': L_COLON,
+  u';': L_SEMICOLON,
+  u'<': L_LT,
+  u'<<': L_LSHIFT,
+  u'<<=': L_LSHIFT_ASSIGN,
+  u'<=': L_LTE,
+  u'=': L_ASSIGN,
+  u'==': L_EQ,
+  u'>': L_GT,
+  u'>=': L_GTE,
+  u'>>': L_ASHIFT,
+  u'>>=': L_ASHIFT_ASSIGN,
+  u'>>>': L_RSHIFT,
+  u'>>>=': L_RSHIFT_ASSIGN,
+  u'?': L_TERNARY,
+  u'[': L_OPEN_BRACKET,
+  u']': L_CLOSE_BRACKET,
+  u'^': L_BITWISE_XOR,
+  u'^=': L_BITWISE_XOR_ASSIGN,
+  u'^^': L_XOR,
+  u'{': L_OPEN_BRACE,
+  u'|': L_BITWISE_OR,
+  u'|=': L_BITWISE_OR_ASSIGN,
+  u'||': L_OR,
+  u'}': L_CLOSE_BRACE,
+  u'~': L_BITWISE_NOT
+}
+
 def token_string(token_type):
   if isinstance(token_type, Token):
     token_type = token_type.token_type
@@ -155,9 +226,19 @@ def token_string(token_type):
   return "UNKNOWN_TOKEN"
 
 def count_bits(value):
-  return 0 if value == 0 else int(math.log2(value)) + 1
+  return value.bit_length()
+
+# whether value survives a round trip through single precision
+def fits_f32(value):
+  try:
+    return struct.unpack('f', struct.pack('f', value))[0] == value
+  except OverflowError:
+    return False
 
+# tokens are allocated by the hundred thousand, so none of them carry a __dict__
 class Token(object):
+  __slots__ = ('line', 'offset', 'token_type')
+
   def __init__(self, line, offset, token_type):
     self.line = line
     self.offset = offset
@@ -171,6 +252,8 @@ class Token(object):
       self.line == other.line and self.offset == other.offset
 
 class TypeToken(Token):
+  __slots__ = ('literal_type',)
+
   def __init__(self, line, offset, literal_type):
     super(TypeToken, self).__init__(line, offset, L_TYPE)
     self.literal_type = literal_type
@@ -183,6 +266,8 @@ class TypeToken(Token):
       isinstance(other, TypeToken) and self.literal_type == other.literal_type
 
 class IdToken(Token):
+  __slots__ = ('value',)
+
   def __init__(self, line, offset, name):
     super(IdToken, self).__init__(line, offset, L_IDENTIFIER)
     self.value = name
@@ -195,6 +280,8 @@ class IdToken(Token):
       and self.value == other.value
 
 class LiteralToken(Token):
+  __slots__ = ('literal_type',)
+
   def __init__(self, line, offset, literal_type):
     super(LiteralToken, self).__init__(line, offset, L_LITERAL)
     self.literal_type = literal_type
@@ -208,8 +295,10 @@ class LiteralToken(Token):
       self.literal_type == other.literal_type
 
 class BoolToken(LiteralToken):
+  __slots__ = ('value',)
+
   def __init__(self, line, offset, value):
-    super(IntToken, self).__init__(line, offset, types.T_BOOL)
+    super(BoolToken, self).__init__(line, offset, types.T_BOOL)
     self.value = value
 
   def __repr__(self):
@@ -223,6 +312,8 @@ class BoolToken(LiteralToken):
     return expression.LiteralNode(types.T_BOOL, self.value)
 
 class IntToken(LiteralToken):
+  __slots__ = ('value',)
+
   def __init__(self, line, offset, value):
     bits = count_bits(value)
     if bits > 32: literal_type = types.T_U64
@@ -242,7 +333,27 @@ class IntToken(LiteralToken):
   def to_expression(self):
     return expression.LiteralNode(self.literal_type, self.value)
 
+class FloatToken(LiteralToken):
+  __slots__ = ('value',)
+
+  def __init__(self, line, offset, value):
+    literal_type = types.T_F32 if fits_f32(value) else types.T_F64
+    super(FloatToken, self).__init__(line, offset, literal_type)
+    self.value = value
+
+  def __repr__(self):
+    return "<FloatToken %r>" % self.value
+
+  def __eq__(self, other):
+    return super(FloatToken, self).__eq__(other) and \
+      isinstance(other, FloatToken) and self.value == other.value
+
+  def to_expression(self):
+    return expression.LiteralNode(self.literal_type, self.value)
+
 class StrToken(LiteralToken):
+  __slots__ = ('value',)
+
   def __init__(self, line, offset, string):
     super(StrToken, self).__init__(line, offset, types.T_STRING)
     self.value = string
@@ -256,3 +367,7 @@ class StrToken(LiteralToken):
 
   def to_expression(self):
     return expression.LiteralNode(types.T_STRING, self.value)
+
+# imported last, expression depends (through code and ops) on the constants
+# above
+import pycub.expression as expression
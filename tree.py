@@ -0,0 +1,26 @@
+# structural equality for statement and expression trees. statements list the
+# attributes that make them up in fields (leaving out parent links, which would
+# loop), and expression nodes compare all of theirs. pairs are walked from an
+# explicit stack, so trees nested to any depth compare without recursion
+def equal(left, right):
+  pairs = [(left, right)]
+
+  while pairs:
+    left, right = pairs.pop()
+    if left is right:
+      continue
+
+    fields = getattr(left, 'fields', None)
+    if fields is not None:
+      if type(left) is not type(right) or fields != right.fields:
+        return False
+      pairs.extend((getattr(left, name, None), getattr(right, name, None))
+        for name in fields)
+    elif isinstance(left, (list, tuple)):
+      if type(left) is not type(right) or len(left) != len(right):
+        return False
+      pairs.extend(zip(left, right))
+    elif left != right:
+      return False
+
+  return True